@@ -0,0 +1,195 @@
+"""Rate limiting and admission control for chat turns.
+
+Two layers in front of every chat turn (and so of the LLM calls it makes):
+
+  - token buckets per session and per client IP (RATE_LIMIT_*). A request
+    that finds its bucket empty gets 429 with Retry-After. Buckets live in
+    the session store, so with the sqlite or redis backend every worker
+    shares them.
+  - AdmissionGate: at most ADMISSION_MAX_IN_FLIGHT turns run at once and at
+    most ADMISSION_MAX_QUEUE wait for a slot (up to ADMISSION_QUEUE_TIMEOUT).
+    Past that, requests are shed at once with 503 + Retry-After instead of
+    piling up behind a slow or rate-limited provider.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Dict, Optional
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+RATE_LIMIT_SESSION_PER_MINUTE = float(os.getenv("RATE_LIMIT_SESSION_PER_MINUTE", "20"))
+RATE_LIMIT_SESSION_BURST = float(os.getenv("RATE_LIMIT_SESSION_BURST", "10"))
+RATE_LIMIT_IP_PER_MINUTE = float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", "120"))
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "40"))
+# Take the client IP from X-Forwarded-For (only behind a trusted proxy)
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "0") == "1"
+
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+
+BUSY_MESSAGE = "The assistant is busy right now. Please retry in {seconds} s."
+RATE_LIMITED_MESSAGE = "You're sending messages too quickly. Please retry in {seconds} s."
+
+
+class Rejected(Exception):
+    """A turn turned away before it started; status is the HTTP code to send."""
+
+    def __init__(self, status: int, reason: str, retry_after: float):
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, int(retry_after + 0.999))
+        template = RATE_LIMITED_MESSAGE if status == 429 else BUSY_MESSAGE
+        super().__init__(template.format(seconds=self.retry_after))
+
+    def payload(self) -> Dict:
+        return {"error": self.reason, "response": str(self), "retry_after": self.retry_after}
+
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(self.retry_after)}
+
+
+def client_ip(headers, client) -> str:
+    """Client address for per-IP limits (headers: a Starlette Headers)."""
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = headers.get("x-forwarded-for", "")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return client.host if client is not None else "unknown"
+
+
+class RateLimiter:
+    def __init__(self, store, enabled: bool = RATE_LIMIT_ENABLED):
+        self.store = store  # anything with async take_tokens(buckets), e.g. SessionManager
+        self.enabled = enabled
+        self.limits = {
+            "session": (RATE_LIMIT_SESSION_PER_MINUTE / 60, RATE_LIMIT_SESSION_BURST),
+            "ip": (RATE_LIMIT_IP_PER_MINUTE / 60, RATE_LIMIT_IP_BURST),
+        }
+        self.limited = {scope: 0 for scope in self.limits}
+
+    async def check(self, session_id: str, ip: str):
+        """Spend one token from the IP and session buckets, or raise Rejected(429).
+
+        Both buckets are taken in one store round-trip, all or none, so a
+        rejected request doesn't use up the other bucket.
+        """
+        if not self.enabled:
+            return
+        scopes = [(scope, key) for scope, key in (("ip", ip), ("session", session_id)) if self.limits[scope][0] > 0]
+        if not scopes:
+            return
+        empty, retry_after = await self.store.take_tokens(
+            [(f"{scope}:{key}", *self.limits[scope]) for scope, key in scopes]
+        )
+        if empty is not None:
+            self.limited[scopes[empty][0]] += 1
+            raise Rejected(429, "rate_limited", retry_after)
+
+    def stats(self) -> Dict:
+        return {"enabled": self.enabled, "limited": dict(self.limited)}
+
+
+class Ticket:
+    """One admitted turn; release() is safe to call more than once."""
+
+    def __init__(self, gate):
+        self.gate = gate
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.gate.release(self.started)
+
+
+class AdmissionGate:
+    """Concurrency cap with a bounded FIFO wait queue and load shedding."""
+
+    def __init__(self, max_in_flight: int = ADMISSION_MAX_IN_FLIGHT, max_queue: int = ADMISSION_MAX_QUEUE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.timed_out = 0
+        # Recent turn durations, to tell shed clients when to come back
+        self._durations = deque(maxlen=100)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> float:
+        average = sum(self._durations) / len(self._durations) if self._durations else 2.0
+        # The queue ahead drains max_in_flight turns at a time
+        return average * (1 + self.waiting / max(1, self.max_in_flight))
+
+    async def acquire(self) -> Ticket:
+        """Wait for a slot, or raise Rejected(503) if the queue is full or too slow."""
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return Ticket(self)
+        if self.waiting >= self.max_queue:
+            self.shed += 1
+            raise Rejected(503, "busy", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as we gave up: hand the slot on
+                self._release_slot()
+            else:
+                waiter.cancel()
+            self.timed_out += 1
+            self.shed += 1
+            raise Rejected(503, "busy", self.retry_after())
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self.admitted += 1
+        return Ticket(self)
+
+    def _release_slot(self):
+        # Hand the slot straight to the oldest live waiter, else free it
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def release(self, started: Optional[float] = None):
+        """Free a slot (normally via Ticket.release)."""
+        if started is not None:
+            self._durations.append(time.monotonic() - started)
+        self._release_slot()
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+        }
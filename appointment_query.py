@@ -0,0 +1,169 @@
+"""Read API over the appointments table: keyset pages and streaming exports.
+
+Both paths share one filter set (doctor, department, date range, email or
+mobile prefix), ordered by appointment ID:
+
+  - fetch_page() returns at most `limit` rows after a cursor (the last ID of
+    the previous page), so page 1000 costs the same as page 1 and rows
+    booked while a client pages through never shift or repeat.
+  - export_chunks() streams CSV, NDJSON or XLSX from a server-side cursor
+    (stream_results + yield_per), EXPORT_CHUNK_ROWS rows at a time. CSV and
+    NDJSON are encoded per chunk; XLSX goes through openpyxl's write-only
+    workbook into a spooled temp file and is streamed once complete.
+
+Memory stays constant in the number of rows either way. Exports never
+touch the request-path workbook in appointments_data/.
+"""
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import date
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import and_, func, select
+
+from database import engine
+import models
+
+QUERY_PAGE_SIZE = int(os.getenv("QUERY_PAGE_SIZE", "50"))
+QUERY_MAX_PAGE_SIZE = int(os.getenv("QUERY_MAX_PAGE_SIZE", "500"))
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+# XLSX exports spill from memory to disk past this size
+EXPORT_SPOOL_BYTES = 8 * 1024 * 1024
+EXPORT_READ_BYTES = 64 * 1024
+
+EXPORT_FIELDS = ["id", "timestamp", "name", "department", "doctor", "date", "time", "email", "mobile"]
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+_table = models.Appointment.__table__
+_columns = [_table.c[field] for field in EXPORT_FIELDS]
+# Matches ix_appointments_email_normalized, so prefix ranges use that index
+_email_normalized = func.lower(func.trim(_table.c.email))
+# Dates are compared as strings: only rows holding a YYYY-MM-DD date take part
+_ISO_DATE_PATTERN = "____-__-__"
+
+
+class QueryError(ValueError):
+    """Bad filter or cursor; the message is safe to show to the caller."""
+
+
+def _prefix(column, prefix):
+    # A range instead of LIKE 'x%', so the column's index is used on every backend
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return and_(column >= prefix, column < upper)
+
+
+def _iso_date(value, name):
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise QueryError(f"{name} must be a YYYY-MM-DD date")
+
+
+def build_filters(doctor: str = "", department: str = "", date_from: str = "", date_to: str = "",
+                  email_prefix: str = "", mobile_prefix: str = "") -> List:
+    """WHERE clauses for the given filters (empty strings are ignored).
+
+    doctor and department match exactly. Dates are compared as ISO strings,
+    which is how bookings and imports store them (legacy rows with a
+    free-form date are left out of date-filtered results). The email prefix
+    is case-insensitive.
+    """
+    filters = []
+    if doctor:
+        filters.append(_table.c.doctor == doctor.strip())
+    if department:
+        filters.append(_table.c.department == department.strip())
+    if date_from:
+        filters.append(_table.c.date >= _iso_date(date_from, "date_from"))
+    if date_to:
+        filters.append(_table.c.date <= _iso_date(date_to, "date_to"))
+    if date_from or date_to:
+        filters.append(_table.c.date.like(_ISO_DATE_PATTERN))
+    if email_prefix:
+        filters.append(_prefix(_email_normalized, email_prefix.strip().lower()))
+    if mobile_prefix:
+        filters.append(_prefix(_table.c.mobile, mobile_prefix.strip()))
+    return filters
+
+
+def row_dict(row) -> Dict:
+    record = dict(row._mapping)
+    if record["timestamp"] is not None:
+        record["timestamp"] = record["timestamp"].isoformat(sep=" ", timespec="seconds")
+    return record
+
+
+def fetch_page(filters: List, after: Optional[int] = None, limit: int = QUERY_PAGE_SIZE):
+    """One page of appointments after ID `after`; returns (rows, next_cursor)."""
+    if not 1 <= limit <= QUERY_MAX_PAGE_SIZE:
+        raise QueryError(f"limit must be between 1 and {QUERY_MAX_PAGE_SIZE}")
+    query = select(*_columns).where(*filters)
+    if after is not None:
+        query = query.where(_table.c.id > after)
+    # One extra row tells us whether there is a next page
+    query = query.order_by(_table.c.id).limit(limit + 1)
+    with engine.connect() as conn:
+        rows = [row_dict(row) for row in conn.execute(query)]
+    next_cursor = rows[limit - 1]["id"] if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def iter_rows(filters: List, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[List[Dict]]:
+    """Matching rows in ID order, chunk_rows at a time, from a server-side cursor."""
+    query = select(*_columns).where(*filters).order_by(_table.c.id)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_rows).execute(query)
+        for partition in result.partitions():
+            yield [row_dict(row) for row in partition]
+
+
+def _csv_chunks(chunks):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _ndjson_chunks(chunks):
+    for rows in chunks:
+        yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+
+
+def _xlsx_chunks(chunks):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Appointments")
+    sheet.append(EXPORT_FIELDS)
+    for rows in chunks:
+        for row in rows:
+            sheet.append([row[field] for field in EXPORT_FIELDS])
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as f:
+        workbook.save(f)
+        f.seek(0)
+        while True:
+            data = f.read(EXPORT_READ_BYTES)
+            if not data:
+                break
+            yield data
+
+
+def export_chunks(filters: List, fmt: str, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    """Encoded export body, piece by piece (a plain iterator: run it off the event loop)."""
+    encoders = {"csv": _csv_chunks, "ndjson": _ndjson_chunks, "xlsx": _xlsx_chunks}
+    if fmt not in encoders:
+        raise QueryError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    return encoders[fmt](iter_rows(filters, chunk_rows))
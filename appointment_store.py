@@ -0,0 +1,233 @@
+"""Group-commit writer for confirmed appointments.
+
+Confirmations are queued and inserted by one writer task, several rows per
+transaction, so a burst of simultaneous bookings costs one commit (and one
+WAL sync) instead of one per row. An appointment and its confirmation email
+are inserted in the same transaction, together with the booking's ledger
+entry and its booked slot: the ledger's unique idempotency key makes a second
+insert of the same booking fail instead of adding a duplicate row and email,
+and the slot's unique (doctor, date, minute) makes a booking of a slot that
+another worker already booked fail.
+"""
+import asyncio
+import os
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+import models
+from database import AsyncSessionLocal, SessionLocal
+from outbox import email_row
+
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "100"))
+# How long the writer waits for more rows after the first one arrives
+DB_BATCH_WINDOW_MS = float(os.getenv("DB_BATCH_WINDOW_MS", "5"))
+
+
+class DuplicateBooking(Exception):
+    """The booking's idempotency key is already in the ledger."""
+
+    def __init__(self, key, appointment_id):
+        super().__init__(f"booking {key} already recorded as appointment {appointment_id}")
+        self.key = key
+        self.appointment_id = appointment_id
+
+
+class SlotTaken(Exception):
+    """The doctor/date/time slot is already booked (by another worker, or before)."""
+
+    def __init__(self, slot, appointment_id):
+        super().__init__(f"slot {slot.doctor} {slot.date} {slot.minute} already booked by appointment {appointment_id}")
+        self.slot = slot
+        self.appointment_id = appointment_id
+
+
+def find_booking(key):
+    """Appointment ID recorded in the ledger for an idempotency key (None if new)."""
+    db = SessionLocal()
+    try:
+        return db.execute(
+            select(models.BookingLedger.appointment_id).where(models.BookingLedger.key == key)
+        ).scalar()
+    finally:
+        db.close()
+
+
+def find_slot(slot):
+    """Appointment ID holding a booked slot (None if free)."""
+    db = SessionLocal()
+    try:
+        return db.execute(
+            select(models.BookedSlot.appointment_id).where(
+                models.BookedSlot.doctor == slot.doctor,
+                models.BookedSlot.date == slot.date,
+                models.BookedSlot.minute == slot.minute,
+            )
+        ).scalar()
+    finally:
+        db.close()
+
+
+def build_rows(appointment_data, email=None, key=None, slot=None):
+    """ORM objects for one booking: the appointment and, optionally, its
+    email, ledger entry and booked slot."""
+    appointment = models.Appointment(
+        name=appointment_data.get("name", ""),
+        department=appointment_data.get("department", ""),
+        doctor=appointment_data.get("doctor", ""),
+        # The slot's ISO date, not the patient's wording ("tomorrow"): date filters compare strings
+        date=slot.date if slot is not None else appointment_data.get("date", ""),
+        time=appointment_data.get("time", ""),
+        email=appointment_data.get("email", ""),
+        mobile=appointment_data.get("mobile", ""),
+    )
+    outbox_row = email_row(*email) if email is not None else None
+    ledger_row = models.BookingLedger(key=key) if key is not None else None
+    slot_row = models.BookedSlot(doctor=slot.doctor, date=slot.date, minute=slot.minute) if slot is not None else None
+    return appointment, outbox_row, ledger_row, slot_row
+
+
+def _add_all(db, rows):
+    db.add_all([appointment for appointment, *_ in rows])
+    db.flush()  # assigns appointment ids
+    for appointment, *dependents in rows:
+        for row in dependents:
+            if row is not None:
+                row.appointment_id = appointment.id
+                db.add(row)
+
+
+def insert_batch(bookings):
+    """Insert (appointment_data, email, key, slot) bookings in one transaction; returns ids."""
+    rows = [build_rows(*booking) for booking in bookings]
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        _add_all(db, rows)
+        db.commit()
+        return [appointment.id for appointment, *_ in rows]
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def insert_batch_async(bookings):
+    """insert_batch on the async engine (DATABASE_ASYNC=1)."""
+    rows = [build_rows(*booking) for booking in bookings]
+    async with AsyncSessionLocal() as db:
+        try:
+            await db.run_sync(_add_all, rows)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+    return [appointment.id for appointment, *_ in rows]
+
+
+class AppointmentWriter:
+    """Single writer task batching appointment inserts."""
+
+    def __init__(self, batch_size=DB_BATCH_SIZE, batch_window_ms=DB_BATCH_WINDOW_MS):
+        self.batch_size = batch_size
+        self.batch_window = batch_window_ms / 1000
+        self.rows_written = 0
+        self.batches_written = 0
+        self._queue = None
+        self._task = None
+
+    async def save(self, appointment_data, email=None, key=None, slot=None):
+        """Queue one booking and wait for its commit; returns the appointment ID.
+
+        email is an optional (to_email, subject, body) tuple queued in the
+        outbox in the same transaction. key is the booking's idempotency key;
+        if it is already in the ledger, DuplicateBooking is raised and
+        nothing is written. slot is its availability.Slot; if that is
+        already booked, SlotTaken is raised and nothing is written.
+        """
+        booking = (appointment_data, email, key, slot)
+        if self._task is None:
+            # Not started (scripts, tests): write directly
+            try:
+                return (await self._insert([booking]))[0]
+            except IntegrityError as e:
+                raise await self._duplicate(booking, e)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((booking, future))
+        return await future
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Commit everything still queued, then stop the writer task."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def _insert(self, bookings):
+        if AsyncSessionLocal is not None:
+            return await insert_batch_async(bookings)
+        return await asyncio.to_thread(insert_batch, bookings)
+
+    async def _duplicate(self, booking, error):
+        """DuplicateBooking / SlotTaken if error came from the ledger's key or the slot, else error itself."""
+        _, _, key, slot = booking
+        if key is not None:
+            appointment_id = await asyncio.to_thread(find_booking, key)
+            if appointment_id is not None:
+                return DuplicateBooking(key, appointment_id)
+        if slot is not None:
+            appointment_id = await asyncio.to_thread(find_slot, slot)
+            if appointment_id is not None:
+                return SlotTaken(slot, appointment_id)
+        return error
+
+    async def _collect(self, first):
+        """The first queued item plus whatever arrives within the batch window."""
+        batch = [first]
+        deadline = asyncio.get_running_loop().time() + self.batch_window
+        while len(batch) < self.batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            try:
+                item = self._queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(self._queue.get(), timeout)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if item is None:
+                # Stop marker: write this batch, then exit
+                self._queue.put_nowait(None)
+                break
+            batch.append(item)
+        return batch
+
+    async def _write(self, batch):
+        try:
+            ids = await self._insert([booking for booking, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                (booking, future), = batch
+                if isinstance(e, IntegrityError):
+                    e = await self._duplicate(booking, e)
+                if not future.done():
+                    future.set_exception(e)
+                return
+            # One bad row must not fail the whole batch: retry each on its own
+            print(f"⚠️ Batch insert of {len(batch)} appointments failed ({e}); retrying row by row")
+            for item in batch:
+                await self._write([item])
+            return
+        for (_, future), appointment_id in zip(batch, ids):
+            if not future.done():
+                future.set_result(appointment_id)
+        self.rows_written += len(batch)
+        self.batches_written += 1
+
+    async def _run(self):
+        while True:
+            first = await self._queue.get()
+            if first is None:
+                return
+            await self._write(await self._collect(first))
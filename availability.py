@@ -0,0 +1,223 @@
+"""Doctor availability: an in-memory index of booked slots.
+
+Appointments store doctor, date and time as free-form strings. Each booking
+is normalized to a Slot (doctor key, ISO date, minutes after midnight) on
+the SLOT_MINUTES grid; the index maps (doctor, date) to the set of booked
+minutes, so a conflict check is one dict + set lookup and "next free slot"
+only ever scans a few days of the grid, however large the table grows.
+
+The index is built from the database at startup (future dates only) and
+updated on every confirmation. It is per process: with several workers, each
+one only sees bookings made through it since its last load. The booked_slots
+table's unique constraint (models.BookedSlot) is what actually guarantees a
+slot is booked once; a worker whose index missed a booking finds out when
+its insert fails (appointment_store.SlotTaken) and reserves the slot then.
+"""
+import os
+import threading
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+from fast_extractor import FastExtractor
+
+SLOT_MINUTES = int(os.getenv("SLOT_MINUTES", "30"))
+SLOT_DAY_START = os.getenv("SLOT_DAY_START", "09:00")
+SLOT_DAY_END = os.getenv("SLOT_DAY_END", "17:00")
+# Weekday numbers (Monday=0) the doctors see patients on
+SLOT_WORKING_DAYS = {int(d) for d in os.getenv("SLOT_WORKING_DAYS", "0,1,2,3,4,5").split(",")}
+# How far ahead next_free looks
+SLOT_SEARCH_DAYS = int(os.getenv("SLOT_SEARCH_DAYS", "14"))
+SLOT_LOAD_BATCH = 10000
+
+Slot = namedtuple("Slot", ["doctor", "date", "minute"])
+
+
+def parse_clock(value):
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def format_minute(minute):
+    return datetime(2000, 1, 1, minute // 60, minute % 60).strftime("%I:%M %p")
+
+
+def doctor_key(name):
+    """Lowercase, whitespace-collapsed name with the Dr. prefix normalized."""
+    words = name.lower().replace(".", " ").split()
+    if words and words[0] in ("dr", "doctor"):
+        words = words[1:]
+    return "dr. " + " ".join(words) if words else ""
+
+
+# JSON-schema style description handed to the LLM in fused mode
+NEXT_FREE_SLOTS_TOOL = {
+    "name": "next_free_slots",
+    "description": "Find the next free appointment times for a doctor, "
+                   "starting from a date (default: today).",
+    "parameters": {
+        "doctor": {"type": "string", "description": "Doctor name, e.g. Dr. Mehta"},
+        "date": {"type": "string", "description": "Earliest date wanted, any format (optional)"},
+    },
+}
+
+
+class SlotIndex:
+    """Booked slots per (doctor, date), with availability queries."""
+
+    def __init__(self, extractor=None, slot_minutes=SLOT_MINUTES, day_start=SLOT_DAY_START,
+                 day_end=SLOT_DAY_END, working_days=SLOT_WORKING_DAYS):
+        self.extractor = extractor or FastExtractor()
+        self.slot_minutes = slot_minutes
+        self.grid = list(range(parse_clock(day_start), parse_clock(day_end), slot_minutes))
+        self.working_days = working_days
+        self.booked = {}
+        self.count = 0
+        self._lock = threading.Lock()
+        # Free-form strings repeat a lot; normalize each distinct one once
+        self._normalize = lru_cache(maxsize=65536)(self._normalize_uncached)
+
+    # === Normalization ===
+    def doctor_for(self, doctor):
+        """Slot doctor key for a free-form doctor name (directory spelling if known)."""
+        match = self.extractor.match_doctor(doctor)
+        return doctor_key(match.value if match else doctor)
+
+    def snap(self, minute):
+        """Off-grid times occupy the slot they fall in (works on pandas Series too)."""
+        return minute - (minute - self.grid[0]) % self.slot_minutes if self.grid else minute
+
+    def _normalize_uncached(self, doctor, date_text, time_text, today):
+        key = self.doctor_for(doctor)
+        date_match = self.extractor.match_date(date_text, today=today)
+        time_match = self.extractor.match_time(time_text)
+        if not key or date_match is None or time_match is None or ":" not in time_match.value:
+            return None  # vague ("morning") or unparseable
+        minute = datetime.strptime(time_match.value, "%I:%M %p")
+        return Slot(key, date_match.value, self.snap(minute.hour * 60 + minute.minute))
+
+    def slot_for(self, doctor, date_text, time_text, today=None):
+        """The Slot for a booking's free-form fields, or None if not pinned down."""
+        if not (doctor and date_text and time_text):
+            return None
+        return self._normalize(doctor.strip(), date_text.strip(), time_text.strip(), today or date.today())
+
+    # === Updates ===
+    def reserve(self, slot):
+        """Book a slot; False if it is already taken (the O(1) conflict check)."""
+        with self._lock:
+            minutes = self.booked.setdefault((slot.doctor, slot.date), set())
+            if slot.minute in minutes:
+                return False
+            minutes.add(slot.minute)
+            self.count += 1
+            return True
+
+    def release(self, slot):
+        with self._lock:
+            minutes = self.booked.get((slot.doctor, slot.date))
+            if minutes and slot.minute in minutes:
+                minutes.discard(slot.minute)
+                self.count -= 1
+
+    def is_free(self, slot):
+        return slot.minute not in self.booked.get((slot.doctor, slot.date), ())
+
+    def unbookable(self, slot, now=None):
+        """Why a slot can't be booked at all: (field to change, reason), or None."""
+        now = now or datetime.now()
+        day = date.fromisoformat(slot.date)
+        if day < now.date():
+            return "date", f"{slot.date} has already passed"
+        if day == now.date() and slot.minute <= now.hour * 60 + now.minute:
+            return "time", f"{format_minute(slot.minute)} today has already passed"
+        if day.weekday() not in self.working_days:
+            return "date", f"{day.strftime('%A')} {slot.date} is not a consulting day"
+        if slot.minute not in self.grid:
+            return "time", (f"{format_minute(slot.minute)} is outside consulting hours "
+                            f"({format_minute(self.grid[0])} to {format_minute(self.grid[-1] + self.slot_minutes)})")
+        return None
+
+    def load(self, session_factory, today=None):
+        """Rebuild the index from the appointments table (dates from today on)."""
+        from sqlalchemy import select
+
+        import models
+
+        today_iso = (today or date.today()).isoformat()
+        booked, count, skipped = {}, 0, 0
+        db = session_factory()
+        try:
+            rows = db.execute(
+                select(models.Appointment.doctor, models.Appointment.date,
+                       models.Appointment.time, models.Appointment.timestamp)
+                .execution_options(yield_per=SLOT_LOAD_BATCH)
+            )
+            for doctor, date_text, time_text, timestamp in rows:
+                # Relative dates ("tomorrow") are relative to when they were booked
+                slot = self.slot_for(doctor or "", date_text or "", time_text or "",
+                                     timestamp.date() if timestamp else None)
+                if slot is None:
+                    skipped += 1
+                    continue
+                if slot.date < today_iso:
+                    continue
+                minutes = booked.setdefault((slot.doctor, slot.date), set())
+                if slot.minute not in minutes:
+                    minutes.add(slot.minute)
+                    count += 1
+        finally:
+            db.close()
+        with self._lock:
+            self.booked, self.count = booked, count
+        print(f"✅ Slot index loaded: {count} booked slots ({skipped} bookings without an exact slot)")
+        return count
+
+    # === Queries ===
+    def free_slots(self, doctor, day):
+        """Free grid minutes for a doctor on an ISO date (empty on days off)."""
+        if date.fromisoformat(day).weekday() not in self.working_days:
+            return []
+        taken = self.booked.get((doctor, day), ())
+        return [minute for minute in self.grid if minute not in taken]
+
+    def next_free(self, doctor, start=None, limit=3, days=SLOT_SEARCH_DAYS, now=None):
+        """Up to `limit` free slots for a doctor, earliest first, from start."""
+        now = now or datetime.now()
+        day = max(start or now.date(), now.date())
+        found = []
+        for _ in range(days):
+            iso = day.isoformat()
+            for minute in self.free_slots(doctor, iso):
+                if day == now.date() and minute <= now.hour * 60 + now.minute:
+                    continue
+                found.append(Slot(doctor, iso, minute))
+                if len(found) >= limit:
+                    return found
+            day += timedelta(days=1)
+        return found
+
+    def suggest(self, doctor, date_text="", limit=3):
+        """next_free for free-form doctor/date text; returns (doctor name, slots)."""
+        match = self.extractor.match_doctor(doctor)
+        name = match.value if match else doctor.strip()
+        start = None
+        if date_text:
+            date_match = self.extractor.match_date(date_text)
+            start = date.fromisoformat(date_match.value) if date_match else None
+        return name, self.next_free(doctor_key(name), start, limit)
+
+    def describe(self, slots):
+        return ", ".join(f"{slot.date} {format_minute(slot.minute)}" for slot in slots)
+
+    def run_tool(self, arguments):
+        """NEXT_FREE_SLOTS_TOOL handler: a short text result for the LLM."""
+        name, slots = self.suggest(arguments.get("doctor", ""), arguments.get("date", ""))
+        if not name:
+            return "Ask the patient which doctor they want first."
+        if not slots:
+            return f"{name} has no free slots in the next {SLOT_SEARCH_DAYS} days."
+        return f"Next free slots for {name}: {self.describe(slots)}."
+
+    def stats(self):
+        return {"booked_slots": self.count, "doctor_days": len(self.booked), "slot_minutes": self.slot_minutes}
@@ -0,0 +1,70 @@
+"""Diff two --json benchmark results and flag regressions.
+
+Rows are matched on their first field (concurrency, size, strategy, ...).
+Timings (*_ms, *_us, *_s), errors, LLM calls and RSS growth that grew, and
+rates (rps) that fell, by more than --threshold percent are flagged; the
+exit status is 1 if any were.
+
+    python benchmarks/load_test.py --json > before.json
+    ... change something ...
+    python benchmarks/load_test.py --json > after.json
+    python benchmarks/compare.py before.json after.json [--threshold 10]
+"""
+import argparse
+import json
+import sys
+
+TIMING_SUFFIXES = ("_ms", "_us", "_s")
+RATE_FIELDS = ("rps",)
+LOWER_IS_BETTER = ("errors", "failed", "llm_calls_per_booking", "rss_growth_mb")
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    rows = data if isinstance(data, list) else [data]
+    return {(next(iter(row.items())) if row else None): row for row in rows}
+
+
+def regressed(field, before, after, threshold):
+    if not before:
+        return field in LOWER_IS_BETTER and after > 0
+    change = (after - before) / before * 100
+    if field.endswith(TIMING_SUFFIXES) or field in LOWER_IS_BETTER:
+        return change > threshold
+    if field in RATE_FIELDS:
+        return change < -threshold
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10, help="percent change treated as a regression")
+    args = parser.parse_args()
+
+    before, after = load(args.before), load(args.after)
+    flagged = 0
+    for key, old in before.items():
+        new = after.get(key)
+        if new is None:
+            print(f"{key[0]}={key[1]}: missing from {args.after}")
+            continue
+        print(f"{key[0]}={key[1]}")
+        for field, old_value in old.items():
+            new_value = new.get(field)
+            if (field == key[0] or isinstance(old_value, bool)
+                    or not isinstance(old_value, (int, float)) or not isinstance(new_value, (int, float))):
+                continue
+            change = f"{(new_value - old_value) / old_value * 100:+.1f}%" if old_value else "n/a"
+            mark = ""
+            if regressed(field, old_value, new_value, args.threshold):
+                mark = "  ⚠️ regression"
+                flagged += 1
+            print(f"  {field:<24} {old_value:>12} -> {new_value:<12} {change}{mark}")
+    sys.exit(1 if flagged else 0)
+
+
+if __name__ == "__main__":
+    main()
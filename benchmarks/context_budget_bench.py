@@ -0,0 +1,73 @@
+"""Prompt-size benchmark for the bounded conversation context.
+
+Replays a synthetic conversation of N turns and reports, at a few points,
+the estimated prompt tokens per turn with the full history (old behaviour)
+and with ContextWindow (recent turns + rolling summary + extracted state).
+The summary call is faked with a fixed-size summary, so no API key is needed.
+
+    python benchmarks/context_budget_bench.py [--turns 100] [--budget 6000] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from context_window import ContextWindow, estimate_tokens  # noqa: E402
+
+SYSTEM_PROMPT = {"role": "system", "content": "You are AppointmentBot, an automated service to issue hospital appointments. " * 12}
+USER_TURN = "I would like to know whether the cardiology department has parking nearby and if I can bring someone."
+BOT_TURN = ("Of course! Our hospital has visitor parking next to the main entrance, and you are welcome to "
+            "bring a companion. Which doctor would you prefer for your appointment?")
+
+
+async def fake_summary(messages):
+    return "Patient asked about parking and companions; prefers morning slots; no doctor chosen yet."
+
+
+async def replay(turns, budget, checkpoints):
+    window = ContextWindow(fake_summary)
+    session = {"context": [SYSTEM_PROMPT], "summary": "", "data": {"name": "Asha Rao", "department": "Cardiology"}}
+    full_history = [SYSTEM_PROMPT]
+    rows = []
+    for turn in range(1, turns + 1):
+        session["context"].append({"role": "user", "content": USER_TURN})
+        full_history.append({"role": "user", "content": USER_TURN})
+        messages = window.build(session, budget)
+        window.record(session, messages)
+        if turn in checkpoints:
+            rows.append({
+                "turn": turn,
+                "full_history_tokens": estimate_tokens(full_history),
+                "bounded_tokens": estimate_tokens(messages),
+            })
+        session["context"].append({"role": "assistant", "content": BOT_TURN})
+        full_history.append({"role": "assistant", "content": BOT_TURN})
+        await window.fold(session)
+    return rows, window.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--budget", type=int, default=6000, help="prompt token budget (GROQ_CONTEXT_TOKENS)")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    checkpoints = {t for t in (1, 5, 10, 25, 50, 100, 200, 500) if t <= args.turns} | {args.turns}
+    rows, totals = asyncio.run(replay(args.turns, args.budget, checkpoints))
+    if args.json:
+        print(json.dumps({"checkpoints": rows, "totals": totals}, indent=2))
+        return
+    print(f"{'turn':>6}{'full history':>15}{'bounded':>10}")
+    for row in rows:
+        print(f"{row['turn']:>6}{row['full_history_tokens']:>15}{row['bounded_tokens']:>10}")
+    print(f"Total prompt tokens over {totals['turns']} turns: {totals['prompt_tokens']} "
+          f"vs {totals['full_history_tokens']} ({totals['saved_pct']}% saved, {totals['folds']} folds)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Write-latency benchmark for the Excel export at growing history sizes.
+
+For each size N it pre-fills a journal with N rows and measures:
+  - submit: per-booking cost on the request path (queue put)
+  - flush: appending one batch to the journal (includes fsync)
+  - compact: rebuilding the workbook from the journal (off the request path)
+  - legacy: the old read-whole-workbook / concat / rewrite save_to_excel
+
+    python benchmarks/excel_export_bench.py [--sizes 10000,100000,500000] [--legacy-max 10000] [--json]
+"""
+import argparse
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import excel_export  # noqa: E402
+from excel_export import EXCEL_COLUMNS, ExcelExporter, appointment_row  # noqa: E402
+
+SAMPLE = {
+    "name": "Asha Rao", "department": "Cardiology", "doctor": "Dr. Mehta", "date": "2026-10-20",
+    "time": "10:30 AM", "email": "asha.rao@example.com", "mobile": "9876543210",
+}
+
+
+def fill_journal(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(EXCEL_COLUMNS)
+        row = appointment_row(SAMPLE)
+        writer.writerows(row for _ in range(rows))
+
+
+def legacy_save(excel_file, appointment_data):
+    """The pre-journal save_to_excel: O(N) read + rewrite per booking."""
+    import pandas as pd
+
+    new_df = pd.DataFrame([dict(zip(EXCEL_COLUMNS, appointment_row(appointment_data)))])
+    existing_df = pd.read_excel(excel_file, engine="openpyxl")
+    pd.concat([existing_df, new_df], ignore_index=True).to_excel(excel_file, index=False, engine="openpyxl")
+
+
+def bench_size(rows, batch_rows, legacy):
+    folder = tempfile.mkdtemp(prefix="excel-bench-")
+    try:
+        exporter = ExcelExporter(folder=folder, flush_rows=batch_rows)
+        fill_journal(exporter.journal_file, rows)
+
+        start = time.perf_counter()
+        for _ in range(batch_rows):
+            exporter.submit(appointment_row(SAMPLE))
+        submit_us = (time.perf_counter() - start) / batch_rows * 1e6
+
+        batch = [exporter.queue.get_nowait() for _ in range(batch_rows)]
+        start = time.perf_counter()
+        exporter._flush(batch)
+        flush_ms = (time.perf_counter() - start) * 1e3
+
+        start = time.perf_counter()
+        excel_export.compact(exporter.journal_file, exporter.excel_file, os.path.join(folder, ".lock"))
+        compact_s = time.perf_counter() - start
+
+        result = {
+            "rows": rows,
+            "submit_us_per_booking": round(submit_us, 2),
+            "flush_ms_per_batch": round(flush_ms, 3),
+            "batch_rows": batch_rows,
+            "compact_s": round(compact_s, 2),
+            "legacy_save_s_per_booking": None,
+        }
+        if legacy:
+            start = time.perf_counter()
+            legacy_save(exporter.excel_file, SAMPLE)
+            result["legacy_save_s_per_booking"] = round(time.perf_counter() - start, 2)
+        return result
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,500000")
+    parser.add_argument("--batch-rows", type=int, default=200)
+    parser.add_argument("--legacy-max", type=int, default=10000,
+                        help="also time the legacy save up to this many rows (it is very slow)")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        results.append(bench_size(size, args.batch_rows, legacy=size <= args.legacy_max))
+        if not args.json:
+            r = results[-1]
+            legacy = "-" if r["legacy_save_s_per_booking"] is None else f"{r['legacy_save_s_per_booking']}s"
+            print(f"{r['rows']:>8} rows | submit {r['submit_us_per_booking']}µs | "
+                  f"flush {r['flush_ms_per_batch']}ms/{r['batch_rows']} rows | "
+                  f"compact {r['compact_s']}s | legacy {legacy}")
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Accuracy / latency benchmark for the rule-based fast-path extractor.
+
+Replays a labeled corpus of single patient turns through FastExtractor and
+reports per-field precision/recall, extraction latency, and how many turns
+would have skipped the LLM extraction call entirely.
+
+    python benchmarks/fast_extractor_bench.py [--corpus PATH] [--repeat N] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from collections import defaultdict
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from extraction import APPOINTMENT_FIELDS  # noqa: E402
+from fast_extractor import FastExtractor, load_directory  # noqa: E402
+
+# The corpus labels relative dates ("tomorrow") against this day.
+CORPUS_TODAY = date(2026, 10, 17)
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run(corpus, repeat):
+    extractor = FastExtractor(load_directory(os.path.join(ROOT, "directory.json")))
+    counts = defaultdict(lambda: {"tp": 0, "fp": 0, "fn": 0})
+    latencies = []
+    skipped = 0
+    wrong_skips = 0
+
+    for example in corpus:
+        text, expected = example["input"], example["fields"]
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+            matches = extractor.extract(text, today=CORPUS_TODAY)
+            resolved = extractor.fully_resolved(text, matches)
+            latencies.append((time.perf_counter() - start) * 1e6)
+
+        found = {field: m.value for field, m in extractor.confident(matches).items()}
+        for field in APPOINTMENT_FIELDS:
+            if field in found and found[field] == expected.get(field):
+                counts[field]["tp"] += 1
+            elif field in found:
+                counts[field]["fp"] += 1
+            if field in expected and found.get(field) != expected[field]:
+                counts[field]["fn"] += 1
+
+        if resolved:
+            # A skipped call only counts if nothing the LLM would have found is lost
+            if found == expected:
+                skipped += 1
+            else:
+                wrong_skips += 1
+
+    fields = {}
+    for field in APPOINTMENT_FIELDS:
+        c = counts[field]
+        fields[field] = {
+            "precision": c["tp"] / (c["tp"] + c["fp"]) if c["tp"] + c["fp"] else None,
+            "recall": c["tp"] / (c["tp"] + c["fn"]) if c["tp"] + c["fn"] else None,
+            **c,
+        }
+
+    latencies.sort()
+    return {
+        "turns": len(corpus),
+        "llm_extraction_calls_saved": skipped,
+        "llm_extraction_calls_saved_pct": round(100 * skipped / len(corpus), 1),
+        "incorrect_skips": wrong_skips,
+        "latency_us": {
+            "mean": round(statistics.mean(latencies), 2),
+            "p50": round(latencies[len(latencies) // 2], 2),
+            "p99": round(latencies[int(len(latencies) * 0.99) - 1], 2),
+        },
+        "fields": fields,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "benchmarks", "data", "extraction_corpus.jsonl"))
+    parser.add_argument("--repeat", type=int, default=200, help="extractions per turn for latency")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = run(load_corpus(args.corpus), args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"Turns: {results['turns']}")
+    print(f"LLM extraction calls saved: {results['llm_extraction_calls_saved']} "
+          f"({results['llm_extraction_calls_saved_pct']}%), incorrect skips: {results['incorrect_skips']}")
+    lat = results["latency_us"]
+    print(f"Latency per turn: mean {lat['mean']}µs  p50 {lat['p50']}µs  p99 {lat['p99']}µs")
+    print(f"{'field':<12}{'precision':>10}{'recall':>10}")
+    for field, stats in results["fields"].items():
+        fmt = lambda v: "-" if v is None else f"{v:.2f}"  # noqa: E731
+        print(f"{field:<12}{fmt(stats['precision']):>10}{fmt(stats['recall']):>10}")
+
+
+if __name__ == "__main__":
+    main()
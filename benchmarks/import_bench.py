@@ -0,0 +1,102 @@
+"""Bulk import benchmark: generate a large CSV and run bulk_import over it.
+
+The file mixes date/time/mobile spellings, ~2% invalid rows and ~1% rows
+repeated from earlier in the file. Every other row books a slot of its own
+(doctors x half-hour grid x days), so only the repeats clash. It is imported into an empty temporary
+SQLite database. Reported: rows/s, inserted / duplicate / invalid counts
+and peak RSS (which should not grow with --rows).
+
+    python benchmarks/import_bench.py [--rows 1000000] [--chunk-rows 50000] [--json]
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix="import-bench-")
+# database.py binds its engine at import time
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'appointments.db')}"
+
+import database  # noqa: E402
+from bulk_import import import_file  # noqa: E402
+from excel_export import EXCEL_COLUMNS  # noqa: E402
+from fast_extractor import load_directory  # noqa: E402
+
+DATES = ["%Y-%m-%d", "%d %b %Y", "%B %d, %Y"]
+TIMES = ["{hour12}:{minute:02d} {ampm}", "{hour12}:{minute:02d} {ampm_dots}", "{hour}:{minute:02d}"]
+FIRST_DAY = date(2031, 1, 1)
+SLOTS_PER_DAY = 16  # 09:00-17:00, every 30 minutes
+MOBILES = ["98{n:08d}", "+91 98{n:08d}", "098{n:08d}"]
+
+
+def write_file(path, rows, seed=1):
+    rng = random.Random(seed)
+    doctors = load_directory().get("doctors") or [{"name": "Dr. Mehta", "department": "Cardiology"}]
+    recent = []
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(EXCEL_COLUMNS)
+        for n in range(rows):
+            roll = rng.random()
+            if roll < 0.01 and recent:
+                writer.writerow(rng.choice(recent))
+                continue
+            doctor = doctors[n % len(doctors)]
+            slot = n // len(doctors)
+            day = FIRST_DAY + timedelta(days=slot // SLOTS_PER_DAY)
+            hour, minute = divmod(9 * 60 + 30 * (slot % SLOTS_PER_DAY), 60)
+            ampm = "AM" if hour < 12 else "PM"
+            row = ["", f"Patient {n}", doctor["department"], doctor["name"],
+                   day.strftime(rng.choice(DATES)),
+                   rng.choice(TIMES).format(hour=hour, hour12=(hour - 1) % 12 + 1, minute=minute, ampm=ampm,
+                                            ampm_dots=ampm[0].lower() + ".m."),
+                   f"patient{n}@example.com", rng.choice(MOBILES).format(n=n)]
+            if roll > 0.98:
+                row[rng.choice([4, 6, 7])] = "n/a"
+            writer.writerow(row)
+            if n % 100 == 0:
+                recent = (recent + [row])[-50:]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--chunk-rows", type=int, default=50000)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    path = os.path.join(WORKDIR, "appointments.csv")
+    try:
+        write_file(path, args.rows)
+        database.create_tables()
+        report = import_file(path, "csv", os.path.join(WORKDIR, "errors.csv"), args.chunk_rows,
+                             journal_file=os.path.join(WORKDIR, "appointments_journal.csv"))
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+    result = {key: report[key] for key in ("rows", "inserted", "duplicates", "invalid", "seconds", "rows_per_sec")}
+    result["peak_rss_mb"] = peak_rss_mb()
+
+    if args.json:
+        print(json.dumps([result], indent=2))
+        return
+    print(f"{result['rows']} rows in {result['seconds']}s ({result['rows_per_sec']} rows/s): "
+          f"{result['inserted']} inserted, {result['duplicates']} duplicates, {result['invalid']} invalid | "
+          f"peak RSS {result['peak_rss_mb']}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""Load test: replay booking conversations through /chat at rising concurrency.
+
+The app runs in-process behind httpx's ASGI transport with its LLM
+providers replaced by FakeProvider (LLM_FAKE_PROVIDERS, configurable
+latency / 429 rate) and the outbox's SMTP connection by a local fake, so no
+API keys, mail server or network are needed and runs are reproducible.
+The database, Excel journal and sessions live in a temporary directory.
+
+Every virtual user replays one conversation from
+benchmarks/data/booking_conversations.jsonl ({doctor}, {date}, {time}, ...
+are filled in so that each user books a distinct slot). The fake LLM is
+scripted: its fused-turn and extraction answers report the details the
+patient has typed so far, as a real model would, so conversations reach a
+booking. For each
+concurrency level it reports requests/sec, p50/p95/p99 /chat latency,
+completed bookings, LLM calls per booking (from /usage) and RSS growth.
+
+    python benchmarks/load_test.py [--levels 1,8,32,64] [--users 64] [--llm-latency 0.3] [--json]
+
+With --url the same conversations are sent to a running server instead
+(start it with LLM_FAKE_PROVIDERS set to keep the LLM out of the numbers;
+those fakes extract nothing, so only fast-path details are picked up);
+RSS is then not reported. The script exits non-zero if a level completes no
+booking: its numbers would not describe a booking flow.
+
+Rate limiting: every virtual user comes from the same process, so with the
+per-IP token bucket (admission.py) on they would all share one IP's budget
+and the run would mostly measure 429s. The in-process app therefore runs
+with RATE_LIMIT_ENABLED=0. --rate-limiter keeps the limiter on and trusts
+X-Forwarded-For, which each virtual user sets to an address of its own, so
+only the per-user limits apply; 429s are reported as "rate_limited". For
+--url, start the server with RATE_LIMIT_ENABLED=0 or
+RATE_LIMIT_TRUST_FORWARDED=1 for the same effect.
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CONVERSATIONS = os.path.join(ROOT, "benchmarks", "data", "booking_conversations.jsonl")
+# Next Monday: bookings must be in the future and on consulting days (Mon-Sat)
+FIRST_DAY = date.today() + timedelta(days=7 - date.today().weekday())
+TIMES = ["9:00 AM", "9:30 AM", "10:00 AM", "10:30 AM", "11:00 AM", "11:30 AM", "2:00 PM", "2:30 PM", "3:00 PM", "4:00 PM"]
+BOOKED_MARKER = "confirmation email is on its way"
+FIRST_NAMES = ["Asha", "Rahul", "Priya", "Vikram", "Meera", "Arjun", "Kavya", "Rohan", "Divya", "Sanjay", "Neha"]
+LAST_NAMES = ["Rao", "Kumar", "Sharma", "Iyer", "Nair", "Gupta", "Reddy", "Menon", "Das", "Joshi", "Pillai", "Bose", "Shah"]
+
+
+# field -> every value a virtual user types for it (filled by user_turns)
+SCRIPTED_VALUES = {}
+
+
+def scripted_fields(text):
+    """The scripted details that appear in text as whole words (longest match per field)."""
+    fields = {}
+    for field, values in SCRIPTED_VALUES.items():
+        # "ENT" is not in "patient", nor patient1@ in patient12@
+        found = [value for value in values
+                 if re.search(rf"(?<![\w@.]){re.escape(value)}(?![\w@])", text, re.IGNORECASE)]
+        if found:
+            fields[field] = max(found, key=len)
+    return fields
+
+
+def load_providers():
+    from llm_providers import FakeProvider
+
+    class ScriptedProvider(FakeProvider):
+        """FakeProvider whose extraction reads the scripted details from the patient's messages."""
+
+        async def _complete(self, messages, model, temperature):
+            if "data extraction assistant" not in messages[0]["content"]:
+                return await super()._complete(messages, model, temperature)
+            await self._respond()
+            # extract_with_llm quotes this turn's input; the rest of the prompt is earlier context
+            prompt = messages[-1]["content"]
+            start = prompt.find('User input: "') + len('User input: "')
+            fields = scripted_fields(prompt[start:prompt.find('"', start)])
+            return "\n".join(f"{field.capitalize()}: {value}" for field, value in fields.items())
+
+        async def _complete_json(self, messages, model, temperature, schema):
+            await self._respond()
+            said = "\n".join(m["content"] for m in messages if m["role"] == "user")
+            return json.dumps({"reply": self.reply, "appointment": scripted_fields(said)})
+
+    return ScriptedProvider
+
+
+class FakeSMTPConnection:
+    """Stands in for outbox.SMTPConnection: sleeps instead of talking SMTP."""
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.sent = 0
+
+    def send(self, to_email, subject, body):
+        time.sleep(self.latency)
+        self.sent += 1
+
+    def close(self):
+        pass
+
+
+def load_conversations(path=CONVERSATIONS):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else None
+
+
+def rss_mb():
+    """Current resident set size (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def user_turns(conversation, user, doctors):
+    """A conversation's turns with this user's details (a distinct slot per user)."""
+    doctor = doctors[user % len(doctors)]
+    n = (user // len(doctors)) // len(TIMES)
+    day = FIRST_DAY + timedelta(days=n + n // 6)  # skip Sundays
+    values = {
+        "patient": f"{FIRST_NAMES[user % len(FIRST_NAMES)]} {LAST_NAMES[user // len(FIRST_NAMES) % len(LAST_NAMES)]}",
+        "doctor": doctor["name"],
+        "department": doctor["department"],
+        "date": day.isoformat(),
+        "time": TIMES[(user // len(doctors)) % len(TIMES)],
+        "email": f"patient{user}@example.com",
+        "mobile": f"98{user:08d}",
+    }
+    for field, value in values.items():
+        SCRIPTED_VALUES.setdefault("name" if field == "patient" else field, set()).add(value)
+    return [turn.format(**values) for turn in conversation["turns"]]
+
+
+def user_address(user):
+    """A client address of the virtual user's own (sent as X-Forwarded-For)."""
+    return f"10.{user // 65536 % 256}.{user // 256 % 256}.{user % 256}"
+
+
+def start_app(workdir, args):
+    """Import bot-gemini.py inside workdir with scripted fake providers and SMTP."""
+    fakes = {
+        "groq": {"latency": args.llm_latency, "jitter": args.llm_latency / 2,
+                 "rate_limit_rate": args.rate_limit, "seed": args.seed},
+        "gemini": {"latency": args.llm_latency * 1.5, "jitter": args.llm_latency / 2, "seed": args.seed + 1},
+    }
+    os.environ["LLM_FAKE_PROVIDERS"] = json.dumps(fakes)
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'appointments.db')}")
+    os.environ.setdefault("DIRECTORY_PATH", os.path.join(ROOT, "directory.json"))
+    os.environ.setdefault("LLM_CACHE_ENABLED", "1" if args.cache else "0")
+    os.environ["DIALOG_MODE"] = args.dialog_mode
+    os.environ["RATE_LIMIT_ENABLED"] = "1" if args.rate_limiter else "0"
+    os.environ["RATE_LIMIT_TRUST_FORWARDED"] = "1"
+    os.symlink(os.path.join(ROOT, "static"), os.path.join(workdir, "static"))
+    os.chdir(workdir)
+
+    # The router and get_provider look providers up in this dict
+    from llm_providers import providers
+    ScriptedProvider = load_providers()
+    for name, options in fakes.items():
+        providers[name] = ScriptedProvider(name=name, **options)
+
+    spec = importlib.util.spec_from_file_location("bot_gemini", os.path.join(ROOT, "bot-gemini.py"))
+    bot = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bot)
+    bot.outbox.connection_factory = lambda: FakeSMTPConnection(args.smtp_latency)
+    return bot
+
+
+async def run_level(client, conversations, doctors, concurrency, users, first_user):
+    latencies, errors, rate_limited, booked = [], 0, 0, 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def virtual_user(user):
+        nonlocal errors, rate_limited, booked
+        async with semaphore:
+            session_id = f"load-{user}"
+            headers = {"X-Forwarded-For": user_address(user)}
+            turns = user_turns(conversations[user % len(conversations)], user, doctors)
+            for turn in turns:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/chat", data={"input": turn, "session_id": session_id},
+                                                 headers=headers)
+                    if response.status_code == 429:
+                        rate_limited += 1
+                        return
+                    response.raise_for_status()
+                    reply = response.json()["response"]
+                except Exception:
+                    errors += 1
+                    return
+                latencies.append(time.perf_counter() - start)
+                if BOOKED_MARKER in reply:
+                    booked += 1
+
+    before = (await client.get("/usage")).json()
+    start = time.perf_counter()
+    await asyncio.gather(*(virtual_user(first_user + i) for i in range(users)))
+    wall = time.perf_counter() - start
+    after = (await client.get("/usage")).json()
+
+    calls = sum(p["calls"] for p in after["providers"].values()) - sum(p["calls"] for p in before["providers"].values())
+    cache_hits = ((after["cache"]["memory_hits"] + after["cache"]["disk_hits"])
+                  - (before["cache"]["memory_hits"] + before["cache"]["disk_hits"]))
+    return {
+        "concurrency": concurrency,
+        "users": users,
+        "requests": len(latencies),
+        "errors": errors,
+        "rate_limited": rate_limited,
+        "bookings": booked,
+        "wall_s": round(wall, 2),
+        "rps": round(len(latencies) / wall, 1) if wall else None,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        "llm_calls_per_booking": round(calls / booked, 2) if booked else None,
+        "cache_hits": cache_hits,
+        "template_turns": after["dialog"]["template_turns"] - before["dialog"]["template_turns"],
+    }
+
+
+async def run(args):
+    import httpx
+
+    conversations = load_conversations(args.conversations)
+    with open(os.path.join(ROOT, "directory.json"), encoding="utf-8") as f:
+        doctors = json.load(f)["doctors"]
+    levels = [int(level) for level in args.levels.split(",")]
+
+    workdir = None
+    if args.url:
+        bot, transport, base_url = None, None, args.url
+    else:
+        workdir = tempfile.mkdtemp(prefix="load-test-")
+        bot = start_app(workdir, args)
+        transport, base_url = httpx.ASGITransport(app=bot.app), "http://load-test"
+
+    results = []
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=120) as client:
+            lifespan = bot.app.router.lifespan_context(bot.app) if bot else None
+            if lifespan:
+                await lifespan.__aenter__()
+            try:
+                rss_start = rss_mb() if bot else None
+                first_user = 0
+                for concurrency in levels:
+                    users = max(args.users, concurrency)
+                    result = await run_level(client, conversations, doctors, concurrency, users, first_user)
+                    first_user += users
+                    if bot:
+                        result["rss_mb"] = rss_mb()
+                        result["rss_growth_mb"] = round(result["rss_mb"] - rss_start, 1)
+                    results.append(result)
+            finally:
+                if lifespan:
+                    await lifespan.__aexit__(None, None, None)
+    finally:
+        if workdir:
+            os.chdir(ROOT)
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--levels", default="1,8,32,64", help="comma-separated concurrency levels")
+    parser.add_argument("--users", type=int, default=64, help="virtual users (conversations) per level")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="fake LLM latency in seconds")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="share of primary LLM calls answered with 429")
+    parser.add_argument("--smtp-latency", type=float, default=0.05)
+    parser.add_argument("--cache", action="store_true", help="keep the LLM response cache enabled")
+    parser.add_argument("--dialog-mode", choices=["llm", "fsm"], default="llm",
+                        help="DIALOG_MODE of the in-process app (fsm: template replies for deterministic turns)")
+    parser.add_argument("--rate-limiter", action="store_true",
+                        help="keep the per-IP / per-session rate limiter on (one address per virtual user)")
+    parser.add_argument("--conversations", default=CONVERSATIONS)
+    parser.add_argument("--url", help="load a running server instead of an in-process app")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    # The app logs every turn; keep the report (and --json output) clean
+    sys.stdout = open(os.devnull, "w")
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        sys.stdout.close()
+        sys.stdout = sys.__stdout__
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            rss = f"  rss +{r['rss_growth_mb']}MB" if "rss_mb" in r else ""
+            print(f"c={r['concurrency']:>3}: {r['rps']} req/s  p50 {r['p50_ms']}ms  p95 {r['p95_ms']}ms  "
+                  f"p99 {r['p99_ms']}ms  bookings {r['bookings']}/{r['users']}  errors {r['errors']}  "
+                  f"429s {r['rate_limited']}  "
+                  f"LLM calls/booking {r['llm_calls_per_booking']} (template turns {r['template_turns']}){rss}")
+    failed = [str(r["concurrency"]) for r in results if not r["bookings"]]
+    if failed:
+        sys.exit(f"no booking completed at concurrency {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
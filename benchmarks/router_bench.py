@@ -0,0 +1,108 @@
+"""Tail-latency benchmark: provider router vs. the old retry-same-provider path.
+
+Runs the same request load against two fake providers (no API keys, no
+network). The primary ("groq") is rate limited part of the time and has a
+slow tail; the secondary ("gemini") is slower on average but healthy.
+
+  - legacy: call the primary, on a 429 sleep 2s / 4s and retry it (the old
+    tenacity policy), up to 3 attempts
+  - router: ProviderRouter with circuit breakers, failover and hedging
+
+    python benchmarks/router_bench.py [--requests 400] [--concurrency 40] [--rate-limit 0.3] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from llm_providers import FakeProvider  # noqa: E402
+from llm_router import ProviderRouter, percentile  # noqa: E402
+
+MODEL = "llama-3.3-70b-versatile"
+MESSAGES = [{"role": "user", "content": "Which department do I need for chest pain?"}]
+
+
+def make_providers(rate_limit, seed):
+    return {
+        "groq": FakeProvider("groq", latency=0.25, jitter=0.15, tail_rate=0.05, tail_latency=3.0,
+                             rate_limit_rate=rate_limit, max_concurrency=64, seed=seed),
+        "gemini": FakeProvider("gemini", latency=0.5, jitter=0.2, max_concurrency=64, seed=seed + 1),
+    }
+
+
+async def legacy_call(provider):
+    for attempt in range(1, 4):
+        try:
+            return await provider.call(MESSAGES, MODEL, 0)
+        except Exception as e:
+            if not provider.is_rate_limited(e) or attempt == 3:
+                return provider.error_message
+            await asyncio.sleep(min(10, 2 ** attempt))
+
+
+async def run(strategy, requests, concurrency, rate_limit, seed):
+    fakes = make_providers(rate_limit, seed)
+    router = ProviderRouter(fakes)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            if strategy == "legacy":
+                reply = await legacy_call(fakes["groq"])
+            else:
+                reply = await router.complete(MESSAGES, MODEL)
+            latencies.append(time.perf_counter() - start)
+            if reply in (fakes["groq"].error_message, fakes["gemini"].error_message):
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    result = {
+        "strategy": strategy,
+        "requests": requests,
+        "failed": failures,
+        "wall_s": round(time.perf_counter() - start, 2),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000),
+    }
+    if strategy == "router":
+        stats = router.stats()
+        result.update(hedges=stats["hedges"], hedge_wins=stats["hedge_wins"], failovers=stats["failovers"],
+                      breaker_opens=stats["providers"]["groq"]["breaker_opens"])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=40)
+    parser.add_argument("--rate-limit", type=float, default=0.3, help="share of primary calls answered with 429")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = [asyncio.run(run(strategy, args.requests, args.concurrency, args.rate_limit, args.seed))
+               for strategy in ("legacy", "router")]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        extra = ""
+        if r["strategy"] == "router":
+            extra = (f" | hedges {r['hedges']} (won {r['hedge_wins']}) failovers {r['failovers']}"
+                     f" breaker opens {r['breaker_opens']}")
+        print(f"{r['strategy']:>7}: p50 {r['p50_ms']}ms  p95 {r['p95_ms']}ms  p99 {r['p99_ms']}ms  "
+              f"failed {r['failed']}/{r['requests']}  wall {r['wall_s']}s{extra}")
+
+
+if __name__ == "__main__":
+    main()
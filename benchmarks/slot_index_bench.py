@@ -0,0 +1,135 @@
+"""Lookup-cost benchmark for the availability slot index.
+
+For each size N it fills a SlotIndex with N booked slots (spread over many
+doctors and days) and measures:
+  - conflict: is_free + reserve/release on a random slot (confirmation path)
+  - next_free: the 3 next free slots for a busy doctor (tool / endpoint)
+  - load: rebuilding the index from an appointments table of N rows
+    (temporary SQLite database, only up to --load-max rows)
+
+    python benchmarks/slot_index_bench.py [--sizes 10000,100000,1000000] [--load-max 100000] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from availability import Slot, SlotIndex  # noqa: E402
+from fast_extractor import FastExtractor, load_directory  # noqa: E402
+
+TODAY = date(2026, 10, 17)
+LOOKUPS = 20000
+
+
+def synthetic_slots(index, rows, doctors=200):
+    """N distinct booked slots: doctors x days x grid, from TODAY forward."""
+    per_day = len(index.grid)
+    for i in range(rows):
+        doctor = f"dr. doctor{i % doctors}"
+        day = TODAY + timedelta(days=i // doctors // per_day)
+        yield Slot(doctor, day.isoformat(), index.grid[(i // doctors) % per_day])
+
+
+def fill_db(path, index, rows):
+    """An appointments table with the same N bookings as free-form strings."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    import models
+
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    booked_at = datetime(2026, 10, 1)
+    batch = []
+    with engine.begin() as conn:
+        for slot in synthetic_slots(index, rows):
+            batch.append({
+                "timestamp": booked_at, "name": "Patient", "department": "Cardiology",
+                "doctor": slot.doctor.title(), "date": slot.date,
+                "time": datetime(2000, 1, 1, slot.minute // 60, slot.minute % 60).strftime("%I:%M %p"),
+                "email": "patient@example.com", "mobile": "9876543210",
+            })
+            if len(batch) >= 10000:
+                conn.execute(models.Appointment.__table__.insert(), batch)
+                batch = []
+        if batch:
+            conn.execute(models.Appointment.__table__.insert(), batch)
+    return sessionmaker(bind=engine)
+
+
+def bench_size(rows, load):
+    extractor = FastExtractor(load_directory(os.path.join(ROOT, "directory.json")))
+    index = SlotIndex(extractor)
+    for slot in synthetic_slots(index, rows):
+        index.reserve(slot)
+
+    rng = random.Random(0)
+    days = max(1, rows // 200 // len(index.grid))
+    probes = [
+        Slot(f"dr. doctor{rng.randrange(200)}", (TODAY + timedelta(days=rng.randrange(days))).isoformat(),
+             rng.choice(index.grid))
+        for _ in range(LOOKUPS)
+    ]
+    start = time.perf_counter()
+    for slot in probes:
+        if index.is_free(slot):
+            index.reserve(slot)
+            index.release(slot)
+    conflict_us = (time.perf_counter() - start) / LOOKUPS * 1e6
+
+    now = datetime.combine(TODAY, datetime.min.time())
+    start = time.perf_counter()
+    for i in range(LOOKUPS // 10):
+        index.next_free(f"dr. doctor{i % 200}", now=now)
+    next_free_us = (time.perf_counter() - start) / (LOOKUPS // 10) * 1e6
+
+    result = {
+        "rows": rows,
+        "booked_slots": index.count,
+        "conflict_check_us": round(conflict_us, 3),
+        "next_free_us": round(next_free_us, 2),
+        "load_s": None,
+    }
+    if load:
+        folder = tempfile.mkdtemp(prefix="slot-bench-")
+        try:
+            session_factory = fill_db(os.path.join(folder, "appointments.db"), index, rows)
+            fresh = SlotIndex(extractor)
+            start = time.perf_counter()
+            fresh.load(session_factory, today=TODAY)
+            result["load_s"] = round(time.perf_counter() - start, 2)
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--load-max", type=int, default=100000,
+                        help="also time load() from a database up to this many rows")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        results.append(bench_size(size, load=size <= args.load_max))
+        if not args.json:
+            r = results[-1]
+            load = "-" if r["load_s"] is None else f"{r['load_s']}s"
+            print(f"{r['rows']:>8} rows | conflict check {r['conflict_check_us']}µs | "
+                  f"next_free {r['next_free_us']}µs | load {load}")
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
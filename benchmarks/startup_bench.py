@@ -0,0 +1,125 @@
+"""Startup benchmark: how long until a fresh worker serves, is ready, and can call an LLM.
+
+Each run starts a new Python process (so nothing is already imported) that
+imports bot-gemini.py in a temporary directory, runs its lifespan and polls
+/ready through httpx's ASGI transport. Per startup mode it reports the
+median over --runs of:
+  - import_ms: importing bot-gemini.py
+  - serving_ms: process spawn until the lifespan yields (requests accepted)
+  - ready_ms: process spawn until /ready returns 200
+  - first_client_ms: building the Groq + Gemini SDK clients after /ready,
+    i.e. what the first LLM call still pays (0 once warm-up built them)
+
+Modes: lazy (STARTUP_WARMUP=blocking, LLM_WARMUP=0 - SDKs load on first
+use), blocking (warm up before serving) and background (serve at once,
+warm up behind /ready). Dummy API keys are set so the SDK clients can be
+built; no request leaves the machine.
+
+    python benchmarks/startup_bench.py [--runs 5] [--modes lazy,blocking,background] [--json]
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = {
+    "lazy": {"STARTUP_WARMUP": "blocking", "LLM_WARMUP": "0"},
+    "blocking": {"STARTUP_WARMUP": "blocking", "LLM_WARMUP": "1"},
+    "background": {"STARTUP_WARMUP": "background", "LLM_WARMUP": "1"},
+}
+
+
+async def child_run(bot):
+    import httpx
+
+    timings = {}
+    async with bot.app.router.lifespan_context(bot.app):
+        timings["serving_at"] = time.time()
+        transport = httpx.ASGITransport(app=bot.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            while (await client.get("/ready")).status_code != 200:
+                await asyncio.sleep(0.005)
+        timings["ready_at"] = time.time()
+        start = time.perf_counter()
+        for name in ("groq", "gemini"):
+            bot.providers[name].client
+        timings["first_client_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return timings
+
+
+def child():
+    """One cold start, in this (fresh) process; prints a JSON line."""
+    workdir = tempfile.mkdtemp(prefix="startup-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'appointments.db')}"
+    os.environ.setdefault("DIRECTORY_PATH", os.path.join(ROOT, "directory.json"))
+    os.environ.setdefault("GROQ_API_KEY", "bench-dummy")
+    os.environ.setdefault("GEMINI_API_KEY", "bench-dummy")
+    os.symlink(os.path.join(ROOT, "static"), os.path.join(workdir, "static"))
+    os.chdir(workdir)
+
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    try:
+        start = time.perf_counter()
+        spec = importlib.util.spec_from_file_location("bot_gemini", os.path.join(ROOT, "bot-gemini.py"))
+        bot = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(bot)
+        import_ms = round((time.perf_counter() - start) * 1000, 1)
+        timings = asyncio.run(child_run(bot))
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps({"import_ms": import_ms, **timings}))
+
+
+def cold_start(mode):
+    env = dict(os.environ, **MODES[mode])
+    spawned = time.time()
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"], env=env,
+                         capture_output=True, text=True, check=True).stdout
+    timings = json.loads(out.strip().splitlines()[-1])
+    return {
+        "import_ms": timings["import_ms"],
+        "serving_ms": round((timings["serving_at"] - spawned) * 1000, 1),
+        "ready_ms": round((timings["ready_at"] - spawned) * 1000, 1),
+        "first_client_ms": timings["first_client_ms"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+
+    results = []
+    for mode in args.modes.split(","):
+        runs = [cold_start(mode) for _ in range(args.runs)]
+        results.append({"mode": mode, **{field: round(statistics.median(run[field] for run in runs), 1)
+                                         for field in runs[0]}})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(f"{r['mode']:>10}: import {r['import_ms']}ms | serving after {r['serving_ms']}ms | "
+              f"ready after {r['ready_ms']}ms | first LLM client {r['first_client_ms']}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Micro-benchmarks for the per-booking storage paths at large sizes.
+
+For each size N (rows already stored / live sessions) it measures:
+  - db: save_appointment_to_db's AppointmentWriter.save, one booking at a
+    time and as a burst of --burst concurrent bookings, against an
+    appointments table that already holds N rows (temporary SQLite file)
+  - excel: save_to_excel's ExcelExporter.submit plus one journal flush,
+    with N rows already in the journal
+  - sessions: SessionManager get_session + save_session with N live
+    sessions, for the memory and sqlite backends
+
+    python benchmarks/storage_bench.py [--sizes 10000,100000] [--burst 100] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix="storage-bench-")
+# database.py binds its engine at import time
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'appointments.db')}"
+
+import database  # noqa: E402
+import models  # noqa: E402
+from appointment_store import AppointmentWriter  # noqa: E402
+from excel_export import ExcelExporter, appointment_row  # noqa: E402
+from excel_export_bench import SAMPLE, fill_journal  # noqa: E402
+from session_manager import MemoryBackend, SessionManager, SQLiteBackend  # noqa: E402
+
+OPS = 2000
+EMAIL = ("patient@example.com", "Your Hospital Appointment Confirmation", "Dear Patient, ...")
+
+
+def fill_appointments(rows):
+    """Top the table up to `rows` rows with executemany (fast, no ORM)."""
+    with database.engine.begin() as conn:
+        have = conn.execute(models.Appointment.__table__.select().with_only_columns(
+            models.Appointment.id).order_by(models.Appointment.id.desc()).limit(1)).scalar() or 0
+        batch = []
+        for i in range(have, rows):
+            batch.append({**SAMPLE, "doctor": f"Dr. Doctor{i % 200}", "email": f"patient{i}@example.com"})
+            if len(batch) >= 10000:
+                conn.execute(models.Appointment.__table__.insert(), batch)
+                batch = []
+        if batch:
+            conn.execute(models.Appointment.__table__.insert(), batch)
+
+
+async def bench_db(burst):
+    writer = AppointmentWriter()
+    writer.start()
+    try:
+        start = time.perf_counter()
+        for _ in range(50):
+            await writer.save(SAMPLE, EMAIL)
+        sequential_ms = (time.perf_counter() - start) / 50 * 1000
+
+        start = time.perf_counter()
+        await asyncio.gather(*(writer.save(SAMPLE, EMAIL) for _ in range(burst)))
+        burst_ms = (time.perf_counter() - start) * 1000
+    finally:
+        await writer.stop()
+    return {"db_save_ms": round(sequential_ms, 3), "db_burst_ms": round(burst_ms, 1)}
+
+
+def bench_excel(rows, batch_rows=200):
+    folder = tempfile.mkdtemp(prefix="excel-", dir=WORKDIR)
+    exporter = ExcelExporter(folder=folder, flush_rows=batch_rows)
+    fill_journal(exporter.journal_file, rows)
+    start = time.perf_counter()
+    for _ in range(batch_rows):
+        exporter.submit(appointment_row(SAMPLE))
+    submit_us = (time.perf_counter() - start) / batch_rows * 1e6
+    batch = [exporter.queue.get_nowait() for _ in range(batch_rows)]
+    start = time.perf_counter()
+    exporter._flush(batch)
+    flush_ms = (time.perf_counter() - start) * 1000
+    shutil.rmtree(folder, ignore_errors=True)
+    return {"excel_submit_us": round(submit_us, 2), "excel_flush_ms": round(flush_ms, 3)}
+
+
+def session_payload(i):
+    return [{"role": "user", "content": f"My name is Patient {i}"},
+            {"role": "assistant", "content": "Thanks! Which department do you need?"}]
+
+
+async def bench_sessions(manager, sessions):
+    for i in range(sessions):
+        session = await manager.get_session(f"s{i}")
+        session["context"] = session_payload(i)
+        await manager.save_session(f"s{i}", session)
+    rng = random.Random(1)
+    ids = [f"s{rng.randrange(sessions)}" for _ in range(OPS)]
+    start = time.perf_counter()
+    for session_id in ids:
+        session = await manager.get_session(session_id)
+        session["context"].append({"role": "user", "content": "ok"})
+        await manager.save_session(session_id, session)
+    return round((time.perf_counter() - start) / OPS * 1e6, 2)
+
+
+def bench_size(rows, burst, sqlite_max):
+    fill_appointments(rows)
+    result = {"size": rows, **asyncio.run(bench_db(burst)), **bench_excel(rows)}
+
+    memory = SessionManager(MemoryBackend(max_sessions=rows, max_bytes=1 << 40))
+    result["session_memory_us"] = asyncio.run(bench_sessions(memory, rows))
+    result["session_memory_mb"] = round(memory.stats()["bytes"] / 1e6, 1)
+
+    result["session_sqlite_us"] = None
+    if rows <= sqlite_max:
+        path = os.path.join(WORKDIR, f"sessions-{rows}.db")
+        sqlite = SessionManager(SQLiteBackend(path))
+
+        async def run_sqlite():
+            try:
+                return await bench_sessions(sqlite, rows)
+            finally:
+                await sqlite.close()
+
+        result["session_sqlite_us"] = asyncio.run(run_sqlite())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--burst", type=int, default=100, help="concurrent bookings per burst")
+    parser.add_argument("--sqlite-max", type=int, default=100000, help="largest size run on the sqlite session backend")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    # AppointmentWriter logs every batch; keep the report clean
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    try:
+        database.create_tables()
+        results = [bench_size(int(size), args.burst, args.sqlite_max) for size in args.sizes.split(",")]
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        sqlite = f"{r['session_sqlite_us']}us" if r["session_sqlite_us"] is not None else "skipped"
+        print(f"N={r['size']:>8}: db save {r['db_save_ms']}ms, burst of {args.burst} {r['db_burst_ms']}ms | "
+              f"excel submit {r['excel_submit_us']}us flush {r['excel_flush_ms']}ms | "
+              f"session get+save memory {r['session_memory_us']}us ({r['session_memory_mb']}MB) sqlite {sqlite}")
+
+
+if __name__ == "__main__":
+    main()
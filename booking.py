@@ -0,0 +1,86 @@
+"""Per-session booking state and confirmation detection.
+
+A session's booking moves collecting -> awaiting_confirmation -> confirmed.
+It only awaits confirmation once every field is collected and the summary
+of exactly those details has been sent; a "yes" in any other state books
+nothing. Changing a detail while awaiting goes back to collecting (a new
+summary is shown). The booking is confirmed once its appointment is
+committed. The confirmed booking is identified by an
+idempotency key derived from who is booked into which slot; the same key is
+stored in the booking ledger (models.BookingLedger) in the appointment's
+transaction. A later "yes" / "confirm" for the same details is answered from
+the ledger instead of repeating the email, database and Excel writes.
+Changing the details after a confirmation makes a new key, i.e. a new
+booking.
+"""
+import hashlib
+import re
+from typing import Dict, Optional
+
+from extraction import APPOINTMENT_FIELDS
+
+COLLECTING = "collecting"
+AWAITING_CONFIRMATION = "awaiting_confirmation"
+CONFIRMED = "confirmed"
+
+# Whole words only: "ok" must not match "book" or "token", "yes" not "yesterday"
+CONFIRM_RE = re.compile(r"\b(?:confirm(?:ed)?|yes|yeah|yep|sure|ok|okay|book it|schedule it|schedule)\b", re.IGNORECASE)
+# Any of these makes a reply something other than a plain "yes": "not ok",
+# "no, don't confirm", "I'm not sure", "wait, change the time"
+NEGATION_RE = re.compile(
+    r"\b(?:no|not|nope|nah|never|dont|do not|cancel|stop|wait|hold on|change|wrong)\b|n't\b",
+    re.IGNORECASE,
+)
+
+
+def is_confirmation(text: str) -> bool:
+    """An unambiguous yes: a confirming word and no negation anywhere in the message."""
+    return CONFIRM_RE.search(text) is not None and NEGATION_RE.search(text) is None
+
+
+def booking_key(appointment_data: Dict[str, str], slot=None) -> str:
+    """Idempotency key: the patient's email plus the (normalized) slot."""
+    if slot is not None:
+        where = [slot.doctor, slot.date, str(slot.minute)]
+    else:
+        where = [appointment_data.get(field, "").strip().lower() for field in ("doctor", "date", "time")]
+    raw = "|".join([appointment_data.get("email", "").strip().lower()] + where)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def details_digest(appointment_data: Dict[str, str]) -> str:
+    """Fingerprint of every summarized field, to tell whether the summary is still current."""
+    raw = "|".join(appointment_data.get(field, "").strip().lower() for field in APPOINTMENT_FIELDS)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def booking_of(session) -> Dict:
+    """The session's booking record (sessions from before this field start collecting)."""
+    return session.setdefault("booking", {"state": COLLECTING})
+
+
+def confirmed_id(session, key: str) -> Optional[int]:
+    """Appointment ID if this session already confirmed the booking with this key."""
+    booking = booking_of(session)
+    if booking["state"] == CONFIRMED and booking.get("key") == key:
+        return booking.get("appointment_id")
+    return None
+
+
+def awaiting_confirmation(session, appointment_data: Dict[str, str]) -> bool:
+    """True if the summary of exactly these details was sent and not yet answered."""
+    booking = booking_of(session)
+    return booking["state"] == AWAITING_CONFIRMATION and booking.get("digest") == details_digest(appointment_data)
+
+
+def mark_awaiting(session, appointment_data: Dict[str, str]):
+    """Call once the summary of these (complete) details has been sent."""
+    session["booking"] = {"state": AWAITING_CONFIRMATION, "digest": details_digest(appointment_data)}
+
+
+def mark_collecting(session):
+    session["booking"] = {"state": COLLECTING}
+
+
+def mark_confirmed(session, key: str, appointment_id: int):
+    session["booking"] = {"state": CONFIRMED, "key": key, "appointment_id": appointment_id}
@@ -1,48 +1,182 @@
+import asyncio
 import os
-import smtplib
 import json
 import csv
-import pandas as pd
-from datetime import datetime
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from fastapi import FastAPI, Form, BackgroundTasks
-from fastapi.responses import JSONResponse, FileResponse
+import time
+import hmac
+from typing import Optional
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from fastapi import FastAPI, File, Form, BackgroundTasks, Request, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
+from compression import CompressionMiddleware
+import metrics
+from metrics import MetricsMiddleware, span
 
 from dotenv import load_dotenv
 
 # Load env vars
 load_dotenv()
 
-# ✅ Gmail credentials (from .env)
-FROM_EMAIL = os.getenv("GMAIL_ADDRESS")
-APP_PASSWORD = os.getenv("GMAIL_APP_PASSWORD")
+# ✅ Async LLM providers (Groq + Gemini) with pooled clients
+from llm_providers import DEFAULT_GROQ_MODEL, StreamInterrupted, get_provider, close_providers, providers, warm_up_providers
 
-# ✅ Groq client
-from groq import Groq
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+# ✅ Cache for deterministic (temperature 0) LLM calls
+from llm_cache import LLMCache, cache_key
+llm_cache = LLMCache()
 
-# ✅ Gemini client
-from google import genai
-genai_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+# ✅ Bounded prompts: recent turns verbatim, older ones folded into a summary
+from context_window import ContextWindow
 
-from session_manager import SessionManager
-from database import engine, get_db, SessionLocal
+# ✅ Structured extraction helpers
+from extraction import build_fused_messages, chat_turn_schema, clean_fields, parse_chat_turn, parse_extraction_text
+
+# ✅ Rule-based fast path (email, mobile, date, time, department, doctor)
+from fast_extractor import FastExtractor, load_directory
+fast_extractor = FastExtractor()
+
+# Confidence assigned to fields that came from the LLM / keyword fallback.
+# Fast-path matches carry their own score. Within one turn a field is only
+# overwritten by an equally or more confident source; a later turn always
+# wins, so a correction ("make it Dr. Rao") replaces a regex match.
+LLM_FIELD_CONFIDENCE = 0.7
+KEYWORD_FIELD_CONFIDENCE = 0.4
+
+# "fused": one structured call returns reply + extracted fields per turn.
+# "multi": legacy path with separate extraction and reply calls.
+CHAT_MODE = os.getenv("CHAT_MODE", "fused").lower()
+
+# "llm": every reply is generated. "fsm": replies to turns the rules fully
+# understand (next question, summary, bare confirmation) come from templates.
+DIALOG_MODE = os.getenv("DIALOG_MODE", "llm").lower()
+NAME_RULE_CONFIDENCE = 0.8
+
+from session_manager import create_session_manager
+from excel_export import ExcelExporter, appointment_row
+from outbox import Outbox, delivery_status
+from appointment_store import AppointmentWriter, DuplicateBooking, SlotTaken, find_booking
+from booking import (awaiting_confirmation, booking_key, confirmed_id, is_confirmation, mark_awaiting,
+                     mark_collecting, mark_confirmed)
+from database import create_tables, get_db, SessionLocal
 import models
 from sqlalchemy.orm import Session
 
-# Initialize Session Manager
-session_manager = SessionManager()
+# ✅ Booked doctor/date/time slots: conflict checks + "next free slot"
+from availability import NEXT_FREE_SLOTS_TOOL, SlotIndex, format_minute
+slot_index = SlotIndex(fast_extractor)
 
-# Create DB tables
-models.Base.metadata.create_all(bind=engine)
+# ✅ Template dialog for deterministic turns (DIALOG_MODE=fsm)
+from dialog import SUMMARY_LABELS, DialogEngine
+
+
+def free_slot_hint(data):
+    """Suffix for the time question: the doctor's next free slots, labelled with their date.
+
+    Searching never starts before today, so a past or fully booked date gets
+    slots from a later day; the hint says so instead of passing them off as
+    that day's.
+    """
+    if not (data.get("doctor") and data.get("date")):
+        return ""
+    _, slots = slot_index.suggest(data["doctor"], data["date"], limit=3)
+    if not slots:
+        return ""
+    wanted = fast_extractor.match_date(data["date"])
+    wanted = wanted.value if wanted else None
+    if slots[0].date == wanted:
+        times = ", ".join(format_minute(slot.minute) for slot in slots if slot.date == wanted)
+        return f"Free slots on {wanted}: {times}."
+    if wanted and wanted < date.today().isoformat():
+        return f"{wanted} has already passed. Next free slots: {slot_index.describe(slots)}."
+    if wanted:
+        return f"No free slots on {wanted}. Next free slots: {slot_index.describe(slots)}."
+    return f"Next free slots: {slot_index.describe(slots)}."
 
-# ✅ Local file configuration - DEPRECATED
-# APPOINTMENTS_FOLDER = "appointments_data"
 
-app = FastAPI()
+dialog_engine = DialogEngine(load_directory(), hints={"time": free_slot_hint})
+
+# Tools the LLM can call from a fused turn: name -> (description, handler)
+CHAT_TOOLS = {NEXT_FREE_SLOTS_TOOL["name"]: (NEXT_FREE_SLOTS_TOOL, slot_index.run_tool)}
+TOOL_MAX_ROUNDS = 2
+
+# ✅ Appointment inserts are group-committed by one writer task
+appointment_writer = AppointmentWriter()
+
+# ✅ Excel export: appends go through a write-behind journal
+excel_exporter = ExcelExporter()
+
+# ✅ Startup: schema setup and warm-up run in the lifespan, not at import.
+# "blocking": warm up before serving. "background": serve at once and warm
+# up behind /ready (faster container starts; route traffic on /ready).
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "blocking").lower()
+# Build the LLM SDK clients during warm-up instead of on the first call
+LLM_WARMUP = os.getenv("LLM_WARMUP", "1") == "1"
+
+readiness = {"ready": False, "mode": STARTUP_WARMUP, "steps": {}, "providers": {}, "error": None}
+
+
+async def warm_up():
+    """Slow startup work; /ready reports ready once it has finished."""
+    start = time.perf_counter()
+    try:
+        step = time.perf_counter()
+        await asyncio.to_thread(slot_index.load, SessionLocal)
+        readiness["steps"]["slot_index_ms"] = round((time.perf_counter() - step) * 1000, 1)
+        if LLM_WARMUP:
+            step = time.perf_counter()
+            readiness["providers"] = await warm_up_providers()
+            readiness["steps"]["providers_ms"] = round((time.perf_counter() - step) * 1000, 1)
+    except Exception as e:
+        readiness["error"] = str(e)
+        print(f"❌ Warm-up failed: {e}")
+        if STARTUP_WARMUP != "background":
+            raise
+        return
+    readiness["steps"]["warmup_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    readiness["ready"] = True
+    print(f"✅ Ready after {readiness['steps']['warmup_ms']}ms of warm-up")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create DB tables (and any indexes missing from an older database); this
+    # also opens the first pooled connection
+    step = time.perf_counter()
+    await asyncio.to_thread(create_tables)
+    readiness["steps"]["schema_ms"] = round((time.perf_counter() - step) * 1000, 1)
+    await asyncio.to_thread(static_assets.build)
+    # Expire idle sessions in the background
+    sweeper = asyncio.create_task(session_manager.run_sweeper())
+    appointment_writer.start()
+    excel_exporter.start()
+    outbox.start()
+    warmup = asyncio.create_task(warm_up())
+    if STARTUP_WARMUP != "background":
+        await warmup
+    yield
+    # Fail the readiness probe while draining
+    readiness["ready"] = False
+    warmup.cancel()
+    sweeper.cancel()
+    # A pending fold only saves tokens later: drop it
+    for task in list(fold_tasks):
+        task.cancel()
+    await asyncio.gather(*fold_tasks, return_exceptions=True)
+    # Commit queued bookings before the outbox workers stop
+    await appointment_writer.stop()
+    await asyncio.to_thread(outbox.stop)
+    # Flush queued Excel rows before exiting
+    await asyncio.to_thread(excel_exporter.stop)
+    # Release pooled LLM connections on shutdown
+    await close_providers()
+    llm_cache.close()
+    await session_manager.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS
 origins = ["*"]
@@ -54,12 +188,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ✅ Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# ✅ gzip / Brotli for larger responses (SSE streams are left alone)
+app.add_middleware(CompressionMiddleware)
+
+# ✅ Request IDs + per-request latency (outermost, so it times compression too)
+app.add_middleware(MetricsMiddleware)
+
+# ✅ Static files: fingerprinted, precompressed and cached (see static_assets.py)
+from static_assets import StaticAssets
+static_assets = StaticAssets("static")
+static_files = StaticFiles(directory="static")
+
+
+def asset_response(request, asset):
+    status, headers, body = static_assets.respond(asset, request.headers)
+    return Response(body, status_code=status, headers=headers)
+
 
 @app.get("/")
-async def read_root():
-    return FileResponse('static/index.html')
+async def read_root(request: Request):
+    return asset_response(request, static_assets.get("index.html"))
+
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+async def static_file(request: Request, path: str):
+    asset = static_assets.get(path)
+    if asset is None:
+        return await static_files.get_response(path, request.scope)
+    return asset_response(request, asset)
 
 # Initial context
 initial_context = [
@@ -104,206 +260,469 @@ initial_context = [
     }
 ]
 
-from session_manager import SessionManager
+# Store conversation + extracted details
+# global_context and appointment_data are managed by session_manager; the
+# shared system prompt is stored by reference in durable backends.
+session_manager = create_session_manager(shared_prefix=initial_context)
 
-# Initialize Session Manager
-session_manager = SessionManager()
+# ✅ Admission control: per-session / per-IP token buckets (kept in the
+# session store, so shared across workers) and a cap on concurrent turns
+from admission import AdmissionGate, RateLimiter, Rejected, client_ip
+rate_limiter = RateLimiter(session_manager)
+admission_gate = AdmissionGate()
 
-# Store conversation + extracted details
-# global_context and appointment_data are now managed by session_manager
+
+async def admit(session_id, ip):
+    """Rate-limit and admit one chat turn; returns the Ticket to release when it ends.
+
+    Raises Rejected (429 rate limited / 503 busy) without touching the session.
+    """
+    start = time.perf_counter()
+    try:
+        await rate_limiter.check(session_id, ip)
+        return await admission_gate.acquire()
+    finally:
+        metrics.observe_stage("admission", start)
+
+
+def rejected_response(rejected):
+    return JSONResponse(rejected.payload(), status_code=rejected.status, headers=rejected.headers())
 
 
 # === Email Function ===
-# === Email Function ===
-def send_email(to_email, subject, body):
-    print(f"📧 [Background] Attempting to send email to {to_email}...")
+# Emails go through the outbox table; see outbox.py for delivery and retries.
+outbox = Outbox()
+
+
+# ✅ Staff read API: keyset-paginated queries and streaming exports
+from appointment_query import EXPORT_FORMATS, QueryError, build_filters, export_chunks, fetch_page
+
+# Bearer token for the staff endpoints; they are disabled while it is unset
+STAFF_API_TOKEN = os.getenv("STAFF_API_TOKEN", "")
+
+
+def staff_denied(request):
+    """Error response unless the request carries the staff token."""
+    if not STAFF_API_TOKEN:
+        return JSONResponse({"error": "Staff API disabled: set STAFF_API_TOKEN"}, status_code=403)
+    if not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {STAFF_API_TOKEN}"):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401, headers={"WWW-Authenticate": "Bearer"})
+    return None
+
+
+@app.get("/appointments/{appointment_id}/email")
+async def appointment_email_status(request: Request, appointment_id: int):
+    """Delivery status of the confirmation email(s) for an appointment (staff only: it shows addresses)."""
+    denied = staff_denied(request)
+    if denied is not None:
+        return denied
+    emails = await asyncio.to_thread(delivery_status, appointment_id)
+    return JSONResponse({"appointment_id": appointment_id, "emails": emails})
+
+
+@app.get("/appointments")
+async def list_appointments(request: Request, doctor: str = "", department: str = "", date_from: str = "", date_to: str = "",
+                            email_prefix: str = "", mobile_prefix: str = "", after: Optional[int] = None, limit: int = 50):
+    """One page of appointments in booking order; pass next_cursor back as `after`."""
+    denied = staff_denied(request)
+    if denied is not None:
+        return denied
     try:
-        msg = MIMEMultipart()
-        msg["From"] = FROM_EMAIL
-        msg["To"] = to_email
-        msg["Subject"] = subject
-        msg.attach(MIMEText(body, "plain"))
-
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(FROM_EMAIL, APP_PASSWORD)
-            server.sendmail(FROM_EMAIL, to_email, msg.as_string())
-
-        print(f"✅ [Background] Email sent successfully to {to_email}")
-        return True
-    except Exception as e:
-        print(f"❌ [Background] Email Failed: {e}")
-        return False
+        filters = build_filters(doctor, department, date_from, date_to, email_prefix, mobile_prefix)
+        rows, next_cursor = await asyncio.to_thread(fetch_page, filters, after, limit)
+    except QueryError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return JSONResponse({"appointments": rows, "next_cursor": next_cursor})
 
 
-# === Local File Functions ===
-def ensure_appointments_folder():
-    """Create appointments folder if it doesn't exist"""
-    APPOINTMENTS_FOLDER = "appointments_data"
-    if not os.path.exists(APPOINTMENTS_FOLDER):
-        os.makedirs(APPOINTMENTS_FOLDER)
-        print(f"✅ Created folder: {APPOINTMENTS_FOLDER}")
+@app.get("/appointments/export")
+async def export_appointments(request: Request, format: str = "csv", doctor: str = "", department: str = "", date_from: str = "",
+                              date_to: str = "", email_prefix: str = "", mobile_prefix: str = ""):
+    """Stream every matching appointment as CSV, NDJSON or XLSX."""
+    denied = staff_denied(request)
+    if denied is not None:
+        return denied
+    try:
+        filters = build_filters(doctor, department, date_from, date_to, email_prefix, mobile_prefix)
+        body = export_chunks(filters, format)
+    except QueryError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    filename = f"appointments-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{format}"
+    # A plain iterator: Starlette pulls each chunk in its threadpool
+    return StreamingResponse(body, media_type=EXPORT_FORMATS[format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
 
-def save_to_excel(appointment_data):
-    """Save appointment data to single Excel file, appending new rows"""
+# ✅ Bulk import (phone desk / partner clinics): chunked, vectorized, batched
+from bulk_import import IMPORT_FOLDER, ImportFileError, detect_format, import_file
+
+
+@app.post("/appointments/import")
+async def import_appointments(request: Request, file: UploadFile = File(...), format: str = Form(default=""),
+                              dry_run: str = Form(default="no")):
+    """Import a CSV / XLSX / NDJSON file of appointments; returns the import report."""
+    denied = staff_denied(request)
+    if denied is not None:
+        return denied
+    dry_run = dry_run.lower() == "yes"
     try:
-        ensure_appointments_folder()
-        APPOINTMENTS_FOLDER = "appointments_data"
-        
-        # Prepare data
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Create data dictionary for new appointment
-        new_appointment = {
-            "Timestamp": timestamp,
-            "Name": appointment_data.get("name", ""),
-            "Department": appointment_data.get("department", ""),
-            "Doctor": appointment_data.get("doctor", ""),
-            "Date": appointment_data.get("date", ""),
-            "Time": appointment_data.get("time", ""),
-            "Email": appointment_data.get("email", ""),
-            "Mobile": appointment_data.get("mobile", "")
-        }
-        
-        # Single Excel file path
-        excel_file = os.path.join(APPOINTMENTS_FOLDER, "appointments.xlsx")
-        
-        # Check if file exists
-        if os.path.exists(excel_file):
-            # Read existing data
-            existing_df = pd.read_excel(excel_file, engine='openpyxl')
-            # Append new appointment
-            new_df = pd.DataFrame([new_appointment])
-            combined_df = pd.concat([existing_df, new_df], ignore_index=True)
+        # The upload is already spooled to disk; parsing runs off the event loop
+        report = await asyncio.to_thread(import_file, file.file, format or detect_format(file.filename),
+                                         dry_run=dry_run, slot_index=slot_index,
+                                         journal_file=excel_exporter.journal_file)
+    except (ImportFileError, UnicodeDecodeError) as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    finally:
+        await file.close()
+    if report["error_file"]:
+        report["error_file"] = f"/appointments/imports/{os.path.basename(report['error_file'])}"
+    if report["inserted"] and not dry_run:
+        # Imported bookings occupy their slots from now on
+        await asyncio.to_thread(slot_index.load, SessionLocal)
+        excel_exporter.mark_dirty()
+    print(f"✅ Imported {report['inserted']} of {report['rows']} rows ({report['rows_per_sec']} rows/s)")
+    return JSONResponse(report)
+
+
+@app.get("/appointments/imports/{name}")
+async def import_errors(request: Request, name: str):
+    """Download the error CSV of an import."""
+    denied = staff_denied(request)
+    if denied is not None:
+        return denied
+    path = os.path.join(IMPORT_FOLDER, os.path.basename(name))
+    if not name.endswith("-errors.csv") or not os.path.isfile(path):
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    return FileResponse(path, media_type="text/csv", filename=name)
+
+
+@app.get("/availability")
+async def availability(doctor: str, date: str = "", limit: int = 5):
+    """Next free slots for a doctor, from date (any format) or today."""
+    name, slots = slot_index.suggest(doctor, date, limit=min(limit, 50))
+    return JSONResponse({
+        "doctor": name,
+        "slots": [{"date": slot.date, "time": format_minute(slot.minute)} for slot in slots],
+    })
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once warm-up has finished, 503 before that and while shutting down."""
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
+
+@app.get("/usage")
+async def token_usage():
+    """Prompt tokens sent vs. the full-history baseline, plus API-reported usage."""
+    return JSONResponse({
+        "context": context_window.stats(),
+        "cache": llm_cache.stats(),
+        "router": llm_router.stats(),
+        "dialog": dict(dialog_engine.stats(), mode=DIALOG_MODE),
+        "admission": dict(admission_gate.stats(), rate_limits=rate_limiter.stats()),
+        "providers": {name: provider.usage for name, provider in providers.items()},
+    })
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus text exposition of request, stage and component metrics."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@metrics.registry.collector
+def component_metrics():
+    """Scrape-time samples from the components that keep their own counters."""
+    for name, value in session_manager.stats().items():
+        if name in ("sessions", "bytes"):
+            yield f"session_{name}", "gauge", "Live sessions / their estimated size", {}, value
         else:
-            # Create new file with first appointment
-            combined_df = pd.DataFrame([new_appointment])
-        
-        # Save to Excel file
-        combined_df.to_excel(excel_file, index=False, engine='openpyxl')
-        print(f"✅ Appointment saved to: {excel_file}")
+            yield f"session_{name}_total", "counter", "Session store lookups, evictions and expirations", {}, value
+    cache = llm_cache.stats()
+    for kind, counts in cache["classes"].items():
+        for result, value in counts.items():
+            yield "llm_cache_lookups_total", "counter", "LLM cache lookups by class and result", \
+                {"class": kind, "result": result.replace("_hits", "_hit").replace("misses", "miss")}, value
+    yield "llm_cache_entries", "gauge", "Entries in the in-memory LLM cache", {}, cache["entries"]
+    router = llm_router.stats()
+    for name in ("hedges", "hedge_wins", "failovers"):
+        yield f"llm_router_{name}_total", "counter", "Hedged requests, hedges that won, and failovers", {}, router[name]
+    for name, health in router["providers"].items():
+        yield "llm_provider_rate_limits_total", "counter", "429s per provider", {"provider": name}, health["rate_limits"]
+        yield "llm_provider_timeouts_total", "counter", "Timed-out calls per provider", {"provider": name}, health["timeouts"]
+        yield "llm_provider_breaker_open", "gauge", "1 while the provider's circuit breaker is not closed", \
+            {"provider": name}, int(health["breaker"] != "closed")
+    for name, provider in providers.items():
+        for field, value in provider.usage.items():
+            yield f"llm_{field}_total", "counter", "Provider-reported LLM usage", {"provider": name}, value
+    context = context_window.stats()
+    yield "prompt_tokens_sent_total", "counter", "Estimated prompt tokens sent", {}, context["prompt_tokens"]
+    yield "prompt_tokens_saved_total", "counter", "Tokens saved by the context window", {}, context["tokens_saved"]
+    yield "context_folds_total", "counter", "Old turns folded into summaries", {}, context["folds"]
+    dialog = dialog_engine.stats()
+    yield "dialog_turns_total", "counter", "Chat turns by reply source", {"source": "template"}, dialog["template_turns"]
+    yield "dialog_turns_total", "counter", "Chat turns by reply source", {"source": "llm"}, dialog["llm_turns"]
+    yield "booked_slots", "gauge", "Slots held in the availability index", {}, slot_index.stats()["booked_slots"]
+    yield "appointment_batches_total", "counter", "Group commits of appointments", {}, appointment_writer.batches_written
+    yield "excel_queue_rows", "gauge", "Rows waiting for the Excel journal", {}, excel_exporter.queue.qsize()
+    yield "emails_sent_total", "counter", "Confirmation emails delivered", {}, outbox.sent
+    yield "emails_failed_total", "counter", "Confirmation emails given up on", {}, outbox.failed
+    yield "ready", "gauge", "1 once startup warm-up has finished", {}, int(readiness["ready"])
+    gate = admission_gate.stats()
+    yield "admission_in_flight", "gauge", "Chat turns running", {}, gate["in_flight"]
+    yield "admission_waiting", "gauge", "Chat turns waiting for a slot", {}, gate["waiting"]
+    yield "admission_queued_total", "counter", "Chat turns that had to wait for a slot", {}, gate["queued"]
+    yield "admission_shed_total", "counter", "Chat turns shed with 503 (queue full or wait timed out)", {}, gate["shed"]
+    for scope, value in rate_limiter.stats()["limited"].items():
+        yield "rate_limited_total", "counter", "Chat turns refused with 429 by bucket", {"scope": scope}, value
+
+
+# === Local File Functions ===
+def save_to_excel(appointment_data):
+    """Queue appointment data for the Excel export (written in batches by a background writer)"""
+    try:
+        with span("excel.submit"):
+            excel_exporter.submit(appointment_row(appointment_data))
         return True
-        
     except Exception as e:
         print(f"❌ File save error: {e}")
         return False
 
 
 # === Database Function ===
-def save_appointment_to_db(appointment_data):
-    """Save appointment data to SQLite database"""
+async def save_appointment_to_db(appointment_data, email=None, key=None, slot=None):
+    """Save appointment data (and its queued email) to the database; returns the new row ID (None on failure).
+
+    Raises DuplicateBooking if the idempotency key is already in the ledger,
+    SlotTaken if the slot is already booked.
+    """
     try:
-        db = SessionLocal()
-        new_appointment = models.Appointment(
-            name=appointment_data.get("name", ""),
-            department=appointment_data.get("department", ""),
-            doctor=appointment_data.get("doctor", ""),
-            date=appointment_data.get("date", ""),
-            time=appointment_data.get("time", ""),
-            email=appointment_data.get("email", ""),
-            mobile=appointment_data.get("mobile", "")
-        )
-        db.add(new_appointment)
-        db.commit()
-        db.refresh(new_appointment)
-        db.close()
-        print(f"✅ Appointment saved to Database with ID: {new_appointment.id}")
-        return True
+        with span("db.save"):
+            appointment_id = await appointment_writer.save(appointment_data, email, key, slot)
+        print(f"✅ Appointment saved to Database with ID: {appointment_id}")
+        return appointment_id
+    except (DuplicateBooking, SlotTaken):
+        raise
     except Exception as e:
         print(f"❌ Database save error: {e}")
-        return False
+        metrics.events.inc(event="db_save_failed")
+        return None
 
 
 # === Chat Function ===
 # === Chat Function ===
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+# ✅ Provider router: breakers, failover and hedging between Groq and Gemini
+from llm_router import ProviderRouter
+llm_router = ProviderRouter()
 
 
-@retry(
-    retry=retry_if_exception_type(Exception), 
-    stop=stop_after_attempt(3), 
-    wait=wait_exponential(multiplier=1, min=2, max=10)
-)
-def get_completion_from_messages(messages, model="llama-3.3-70b-versatile", temperature=0):
+async def call_provider(messages, model=DEFAULT_GROQ_MODEL, temperature=0):
     """
-    Dual-Provider Dispatcher:
-    - If model name contains 'gemini', use Google GenAI SDK.
-    - Otherwise, use Groq SDK (Llama 3).
+    Async Dual-Provider Dispatcher:
+    - If model name contains 'gemini', Gemini is preferred.
+    - Otherwise, Groq (Llama 3).
+
+    The router fails over to the other provider on errors and hedges slow
+    calls, instead of sleeping and retrying the same provider.
     """
-    
-    # === GEMINI PROVIDER ===
-    if "gemini" in model.lower():
-        # Convert OpenAI format to Gemini prompt format
-        prompt = ""
-        for message in messages:
-            if message["role"] == "system":
-                prompt += f"System: {message['content']}\n\n"
-            elif message["role"] == "user":
-                prompt += f"User: {message['content']}\n\n"
-            elif message["role"] == "assistant":
-                prompt += f"Assistant: {message['content']}\n\n"
-        
-        try:
-            # Use specific Gemini Native Audio model if requested, else default fallback
-            target_model = model if "native-audio" in model else "gemini-2.5-flash"
-            
-            response = genai_client.models.generate_content(
-                model=target_model,
-                contents=prompt,
-                config=genai.types.GenerateContentConfig(
-                    temperature=temperature,
-                )
-            )
-            return response.text
-        except Exception as e:
-            print(f"❌ Gemini API Error: {e}")
-            if "429" in str(e) or "Resource exhausted" in str(e):
-                raise e # Trigger retry
-            return "I'm having trouble connecting to Gemini (Google) right now."
+    return await llm_router.complete(messages, model=model, temperature=temperature)
 
-    # === GROQ PROVIDER (Default) ===
-    else:
+
+async def call_provider_json(messages, schema, model=DEFAULT_GROQ_MODEL, temperature=0):
+    return await llm_router.complete_json(messages, model=model, temperature=temperature, schema=schema)
+
+
+async def get_completion_from_messages(messages, model=DEFAULT_GROQ_MODEL, temperature=0, cache_class=None):
+    """Cached front of call_provider.
+
+    cache_class names the kind of prompt ("reply", "extraction", ...); only
+    classes enabled in LLM_CACHE_CLASSES are served from / stored in the cache.
+    """
+    provider = get_provider(model)
+    metrics.count_llm_call()
+    with span(f"llm.{cache_class or 'call'}") as attrs:
+        if not (cache_class and llm_cache.caches(cache_class, temperature)):
+            return await call_provider(messages, model=model, temperature=temperature)
+        key = cache_key(model, cache_class, messages)
+        cached = await llm_cache.get(cache_class, key)
+        attrs["cache"] = "miss" if cached is None else "hit"
+        if cached is not None:
+            return cached
+        response = await call_provider(messages, model=model, temperature=temperature)
+        if response and response != provider.error_message:
+            await llm_cache.set(key, response)
+        return response
+
+
+async def get_structured_completion(messages, schema, model=DEFAULT_GROQ_MODEL, temperature=0, cache_class="fused"):
+    """JSON-constrained variant of get_completion_from_messages (None on failure)."""
+    metrics.count_llm_call()
+    with span(f"llm.{cache_class}") as attrs:
+        if not llm_cache.caches(cache_class, temperature):
+            return await call_provider_json(messages, schema, model=model, temperature=temperature)
+        key = cache_key(model, cache_class, messages, json.dumps(schema, sort_keys=True))
+        cached = await llm_cache.get(cache_class, key)
+        attrs["cache"] = "miss" if cached is None else "hit"
+        if cached is not None:
+            return cached
+        raw = await call_provider_json(messages, schema, model=model, temperature=temperature)
+        # Only valid turns are worth replaying
+        if raw and parse_chat_turn(raw) is not None:
+            await llm_cache.set(key, raw)
+        return raw
+
+
+async def stream_completion_from_messages(messages, model=DEFAULT_GROQ_MODEL, temperature=0, cache_class="reply"):
+    """Yield reply tokens as they are generated.
+
+    The router fails over to the other provider until the first token;
+    after that the stream is never restarted. A cached reply is sent as a
+    single token; a reply is only cached if its stream finished cleanly.
+    """
+    provider = get_provider(model)
+    metrics.count_llm_call()
+    start = time.perf_counter()
+    cacheable = llm_cache.caches(cache_class, temperature)
+    if cacheable:
+        key = cache_key(model, cache_class, messages)
+        cached = await llm_cache.get(cache_class, key)
+        if cached is not None:
+            metrics.observe_stage(f"llm.{cache_class}.first_token", start)
+            yield cached
+            return
+
+    parts = []
+    try:
+        async for token in llm_router.stream(messages, model=model, temperature=temperature):
+            if not parts:
+                metrics.observe_stage(f"llm.{cache_class}.first_token", start)
+            parts.append(token)
+            yield token
+    except StreamInterrupted:
+        metrics.events.inc(event="stream_interrupted")
+        return
+    # Whole stream, including the time the client took to read it
+    metrics.observe_stage(f"llm.{cache_class}.stream", start)
+    response = "".join(parts)
+    if cacheable and response and response != provider.error_message:
+        await llm_cache.set(key, response)
+
+
+async def summarize_turns(messages):
+    """Summary call used when old turns are folded out of a session's context."""
+    summary = await get_completion_from_messages(messages, cache_class="summary")
+    if summary == get_provider(DEFAULT_GROQ_MODEL).error_message:
+        raise RuntimeError("summary call failed")
+    return summary
+
+
+context_window = ContextWindow(summarize_turns)
+
+
+def prompt_for(session, model=DEFAULT_GROQ_MODEL):
+    """Budgeted messages for this turn's LLM call (and record their size)."""
+    with span("context.build") as attrs:
+        messages = context_window.build(session, get_provider(model).context_token_budget)
+        context_window.record(session, messages)
+        attrs["tokens"] = session["usage"]["last_prompt_tokens"]
+    return messages
+
+
+async def fold_session(session_id):
+    """Fold old turns into the rolling summary, after the reply has gone out.
+
+    The summary call runs outside the session lock, so it neither delays the
+    next turn nor outlives the lock's lease; the fold is then applied only if
+    the summarized turns are still the session's oldest (compare-and-set).
+    """
+    async with session_manager.lock(session_id):
+        snapshot = context_window.fold_snapshot(await load_session(session_id))
+    if snapshot is None:
+        return
+    with span("context.fold"):
+        summary = await context_window.summarize_fold(snapshot)
+    async with session_manager.lock(session_id):
+        session = await load_session(session_id)
+        if context_window.apply_fold(session, snapshot, summary):
+            await save_session(session_id, session)
+        else:
+            print(f"⚠️ Session {session_id} changed during the summary call; fold skipped")
+
+
+# Folds started by streaming turns (cancelled on shutdown)
+fold_tasks = set()
+
+
+def schedule_fold(session_id):
+    """Run fold_session detached, so it holds neither the turn's admission slot nor its connection."""
+    task = asyncio.create_task(fold_session(session_id))
+    fold_tasks.add(task)
+    task.add_done_callback(fold_tasks.discard)
+
+
+async def run_fused_turn(context):
+    """One LLM call that returns both the reply and the extracted fields.
+
+    If the model asks for a tool, the result is passed back and the call
+    repeated (at most TOOL_MAX_ROUNDS times).
+    """
+    tools = [tool for tool, _ in CHAT_TOOLS.values()]
+    messages = build_fused_messages(context, tools)
+    schema = chat_turn_schema(tools)
+    for attempt in range(TOOL_MAX_ROUNDS + 1):
         try:
-            # Ensure messages are in simple dict format (Groq/OpenAI standard)
-            response = groq_client.chat.completions.create(
-                messages=messages,
-                model=model,
-                temperature=temperature,
-            )
-            return response.choices[0].message.content
+            raw = await get_structured_completion(messages, schema)
         except Exception as e:
-            print(f"❌ Groq API Error: {e}")
-            if "429" in str(e) or "rate limit" in str(e).lower():
-                raise e # Trigger retry
-            return "I'm having trouble connecting to Groq (Llama 3) right now."
+            print(f"❌ Fused turn error: {e}")
+            return None
+        turn = parse_chat_turn(raw)
+        if turn is None or turn.tool_call is None or turn.tool_call.name not in CHAT_TOOLS:
+            return turn
+        if attempt == TOOL_MAX_ROUNDS:
+            turn.tool_call = None
+            return turn
+        _, handler = CHAT_TOOLS[turn.tool_call.name]
+        with span(f"tool.{turn.tool_call.name}"):
+            result = handler(turn.tool_call.arguments)
+        print(f"🔧 Tool {turn.tool_call.name}({turn.tool_call.arguments}) -> {result}")
+        messages = messages + [
+            {"role": "assistant", "content": raw},
+            {"role": "system", "content": f"Result of {turn.tool_call.name}: {result}\nNow answer the patient (no tool_call)."},
+        ]
 
 
-@app.post("/chat")
-async def chat(background_tasks: BackgroundTasks, input: str = Form(...), newchat: str = Form(default="no"), session_id: str = Form(default="guest")):
-    # Get or create session
-    session = session_manager.get_session(session_id)
-    
-    # Initialize context if empty
-    if not session["context"]:
-        session["context"] = initial_context.copy()
+def start_turn(session):
+    """Forget the previous turn's confidences: they only rank sources within a turn."""
+    session["confidence"] = {}
 
-    # Reset chat if requested
-    if newchat.lower() == "yes":
-        session_manager.clear_session(session_id)
-        session = session_manager.get_session(session_id) # Re-fetch clean session
-        session["context"] = initial_context.copy() # Re-init context
-        return JSONResponse({"response": "Chat cleared. How can I help you?", "context": session["context"], "data": {}})
 
-    global_context = session["context"]
-    appointment_data = session["data"]
+def set_field(session, key, value, confidence):
+    """Store an extracted field unless a more confident value was set this turn."""
+    if confidence >= session["confidence"].get(key, 0):
+        session["data"][key] = value
+        session["confidence"][key] = confidence
 
-    # Append user input
-    global_context.append({"role": "user", "content": input})
 
-    # Extract details from user input using AI
+def set_llm_fields(session, fields, confidence=LLM_FIELD_CONFIDENCE):
+    """Store LLM-extracted fields in the form the rules would store them.
+
+    The model restates every known detail each turn ("9:00 AM" for a stored
+    "09:00 AM"); normalizing keeps such a restatement from changing the
+    details (and with them the summary awaiting confirmation).
+    """
+    for key, value in fields.items():
+        match = fast_extractor.confident(fast_extractor.extract(value)).get(key)
+        set_field(session, key, match.value if match else value, confidence)
+
+
+async def extract_with_llm(input, global_context):
+    """Multi-call path: dedicated LLM extraction call with keyword fallback.
+
+    Returns (fields, confidence).
+    """
     lowered = input.lower()
-    
+
     # Use AI to extract appointment details from the conversation
     extraction_prompt = f"""
     From the following conversation, extract appointment details if any are mentioned:
@@ -325,182 +744,565 @@ async def chat(background_tasks: BackgroundTasks, input: str = Form(...), newcha
     """
     
     try:
-        extraction_response = get_completion_from_messages([
+        extraction_response = await get_completion_from_messages([
             {"role": "system", "content": "You are a data extraction assistant. Extract appointment details from conversations."},
             {"role": "user", "content": extraction_prompt}
-        ])
-        
-        # Parse the extraction response
-        lines = extraction_response.strip().split('\n')
-        for line in lines:
-            if ':' in line:
-                key, value = line.split(':', 1)
-                key = key.strip().lower()
-                value = value.strip()
-                if value and value != '(empty if not found)' and value != '(empty)':
-                    if key == 'name':
-                        appointment_data["name"] = value
-                    elif key == 'department':
-                        appointment_data["department"] = value
-                    elif key == 'doctor':
-                        appointment_data["doctor"] = value
-                    elif key == 'date':
-                        appointment_data["date"] = value
-                    elif key == 'time':
-                        appointment_data["time"] = value
-                    elif key == 'email':
-                        appointment_data["email"] = value
-                    elif key == 'mobile':
-                        appointment_data["mobile"] = value
+        ], cache_class="extraction")
+        return parse_extraction_text(extraction_response), LLM_FIELD_CONFIDENCE
     except Exception as e:
         print(f"❌ Data extraction error: {e}")
         # Fallback to simple keyword-based extraction
+        fields = {}
         if "@" in input and "." in input:
-            appointment_data["email"] = input.strip()
+            fields["email"] = input.strip()
         elif lowered.isdigit() and len(lowered) >= 10:
-            appointment_data["mobile"] = input.strip()
+            fields["mobile"] = input.strip()
         elif "department" in lowered or "cardiology" in lowered or "orthopedics" in lowered:
-            appointment_data["department"] = input.strip()
+            fields["department"] = input.strip()
         elif "dr" in lowered or "doctor" in lowered:
-            appointment_data["doctor"] = input.strip()
+            fields["doctor"] = input.strip()
         elif any(word in lowered for word in ["am", "pm", ":", "morning", "evening"]):
-            appointment_data["time"] = input.strip()
+            fields["time"] = input.strip()
         elif any(char.isdigit() for char in lowered) and "/" in lowered:
-            appointment_data["date"] = input.strip()
+            fields["date"] = input.strip()
         elif "name" in lowered or len(input.split()) >= 2:
-            appointment_data.setdefault("name", input.strip())
+            fields["name"] = input.strip()
+        return fields, KEYWORD_FIELD_CONFIDENCE
+
+
+CHAT_CLEARED_MESSAGE = "Chat cleared. How can I help you?"
+
+
+async def load_session(session_id):
+    """Get or create a session with its context initialised."""
+    with span("session.load"):
+        session = await session_manager.get_session(session_id)
+    if not session["context"]:
+        session["context"] = initial_context.copy()
+    return session
+
+
+async def save_session(session_id, session):
+    with span("session.save"):
+        await session_manager.save_session(session_id, session)
+
+
+@asynccontextmanager
+async def turn_lock(session_id):
+    """session_manager.lock, tagging the trace and timing the wait."""
+    metrics.set_session(session_id)
+    start = time.perf_counter()
+    async with session_manager.lock(session_id):
+        metrics.observe_stage("session.lock", start)
+        yield
+
+
+async def reset_session(session_id):
+    """Clear a session and start a fresh context."""
+    await session_manager.clear_session(session_id)
+    session = await session_manager.get_session(session_id) # Re-fetch clean session
+    session["context"] = initial_context.copy() # Re-init context
+    return session
+
+
+def apply_fast_path(session, input):
+    """Store confident rule-based matches; True if nothing is left for the LLM.
+
+    If the message holds more than the matches ("not 10 am, 11 am"), the LLM
+    reads it too and its values for this turn take precedence.
+    """
+    with span("fast_path") as attrs:
+        fast_matches = fast_extractor.extract(input)
+        attrs["resolved"] = fast_extractor.fully_resolved(input, fast_matches)
+        for key, match in fast_extractor.confident(fast_matches).items():
+            confidence = match.confidence if attrs["resolved"] else min(match.confidence, LLM_FIELD_CONFIDENCE)
+            set_field(session, key, match.value, confidence)
+        return attrs["resolved"]
+
+
+def templated_reply(session, input, fast_path):
+    """DIALOG_MODE=fsm: the reply for a turn the rules fully understand, else None."""
+    if DIALOG_MODE != "fsm":
+        return None
+    data = session["data"]
+    with span("dialog.template") as attrs:
+        missing = dialog_engine.missing(data)
+        confirming = dialog_engine.is_bare_confirmation(input)
+        # Thank the patient only for confirming a summary they were shown;
+        # with fields missing the next question is asked instead
+        if confirming and not missing and (awaiting_confirmation(session, data)
+                                           or confirmed_id(session, appointment_key(data)) is not None):
+            reply = f"Thank you, {data['name']}!"
+        elif confirming and missing:
+            reply = dialog_engine.next_prompt(data)
+        elif fast_path or (not data and dialog_engine.is_greeting(input)):
+            reply = dialog_engine.next_prompt(data)
+        elif missing and missing[0] == "name" and dialog_engine.match_name(input):
+            set_field(session, "name", dialog_engine.match_name(input), NAME_RULE_CONFIDENCE)
+            reply = dialog_engine.next_prompt(data)
+        else:
+            reply = None
+        attrs["hit"] = reply is not None
+    return reply
+
+
+def appointment_key(appointment_data):
+    """Idempotency key of the booking these details describe."""
+    slot = slot_index.slot_for(
+        appointment_data.get("doctor", ""), appointment_data.get("date", ""), appointment_data.get("time", "")
+    )
+    return booking_key(appointment_data, slot)
+
+
+async def already_confirmed_note(appointment_id):
+    """Reply note for a repeated confirmation, from the ledger and outbox."""
+    emails = await asyncio.to_thread(delivery_status, appointment_id)
+    status = emails[-1]["status"] if emails else None
+    note = f"\n\n✅ This appointment is already confirmed (booking #{appointment_id})."
+    if status == "sent":
+        note += " The confirmation email has been sent."
+    elif status in ("pending", "sending"):
+        note += " The confirmation email is on its way."
+    return note
+
 
-    # Get bot response
-    response = get_completion_from_messages(global_context)
+async def confirm_if_requested(session, input, response, templated=False):
+    """Run the confirmation side effects if the patient confirmed the summary.
+
+    A booking is only committed from the awaiting_confirmation state: every
+    field collected and the summary of exactly these details sent on an
+    earlier turn. Returns the notes (summary, email / save results) to
+    append to the reply.
+    """
+    appointment_data = session["data"]
+    missing = dialog_engine.missing(appointment_data)
+
+    # ✅ If patient confirms appointment
+    if is_confirmation(input):
+        if not missing:
+            # Same details as an already confirmed booking: nothing to redo
+            appointment_id = confirmed_id(session, appointment_key(appointment_data))
+            if appointment_id is not None:
+                return await already_confirmed_note(appointment_id)
+        if awaiting_confirmation(session, appointment_data):
+            return await book_appointment(session)
+        if missing and not templated:
+            # The reply is generated: make sure it can't read as a booking
+            fields = ", ".join(SUMMARY_LABELS[field].lower() for field in missing)
+            return f"\n\n⚠️ Nothing is booked yet. I still need your {fields}."
+
+    # ✅ All details in: show their summary and wait for a "yes" on a later turn
+    notes = ""
+    if (not missing and not awaiting_confirmation(session, appointment_data)
+            and confirmed_id(session, appointment_key(appointment_data)) is None):
+        if not dialog_engine.shows_summary(response, appointment_data):
+            notes += "\n\n" + dialog_engine.summary(appointment_data)
+        mark_awaiting(session, appointment_data)
+    return notes
+
+
+def slot_taken_note(session, slot):
+    """The slot went to someone else: ask for another time (back to collecting)."""
+    appointment_data = session["data"]
+    metrics.events.inc(event="slot_conflict")
+    doctor, alternatives = slot_index.suggest(appointment_data["doctor"], appointment_data["date"])
+    # Ask for a new time instead of keeping the taken one
+    appointment_data.pop("time", None)
+    session["confidence"].pop("time", None)
+    mark_collecting(session)
+    note = f"\n\n⚠️ {doctor} is already booked at that time on {slot.date}."
+    if alternatives:
+        note += f" Free slots: {slot_index.describe(alternatives)}. Which time would you like instead?"
+    return note
+
+
+def slot_unbookable_note(session, slot, field, reason):
+    """A past / off-grid slot: ask for another date or time (back to collecting)."""
+    appointment_data = session["data"]
+    metrics.events.inc(event="slot_rejected")
+    doctor, alternatives = slot_index.suggest(appointment_data["doctor"],
+                                              appointment_data["date"] if field == "time" else "")
+    appointment_data.pop(field, None)
+    session["confidence"].pop(field, None)
+    mark_collecting(session)
+    note = f"\n\n⚠️ I can't book {doctor} then: {reason}."
+    if alternatives:
+        note += f" Free slots: {slot_index.describe(alternatives)}. Which {field} would you like instead?"
+    return note
+
+
+async def book_appointment(session):
+    """Reserve the slot, save the appointment and queue its email; returns the notes."""
+    appointment_data = session["data"]
+    notes = ""
+    print(f"🔍 Final appointment data before saving: {appointment_data}")
+    missing = dialog_engine.missing(appointment_data)
+    if missing:
+        # Never commit (or announce an email for) an incomplete booking
+        mark_collecting(session)
+        return ""
+
+    # ✅ Refuse a doctor/date/time that is already booked
+    slot = slot_index.slot_for(
+        appointment_data.get("doctor", ""), appointment_data.get("date", ""), appointment_data.get("time", "")
+    )
+    # ✅ Exactly once per booking: answer repeats from the ledger
+    key = booking_key(appointment_data, slot)
+    appointment_id = confirmed_id(session, key) or await asyncio.to_thread(find_booking, key)
+    if appointment_id is not None:
+        mark_confirmed(session, key, appointment_id)
+        metrics.events.inc(event="duplicate_confirmation")
+        return notes + await already_confirmed_note(appointment_id)
+
+    if slot is not None:
+        problem = slot_index.unbookable(slot)
+        if problem:
+            return slot_unbookable_note(session, slot, *problem)
+        if not slot_index.reserve(slot):
+            return slot_taken_note(session, slot)
+
+    email_body = f"""Dear {appointment_data.get('name','Patient')},
+            Your appointment has been confirmed with the following details:
+
+            Doctor: {appointment_data.get('doctor','N/A').title()}
+            Email: {appointment_data.get('email','N/A')}
+            Mobile: {appointment_data.get('mobile','N/A')}
+            Time: {appointment_data.get('time','N/A')}
+            Date: {appointment_data.get('date','N/A')}
+            Department: {appointment_data.get('department','N/A')}
+
+            Thank you for choosing our hospital.
+            """
+    email = (appointment_data["email"].strip(), "Your Hospital Appointment Confirmation", email_body)
+
+    # Appointment + outbox row are committed together (batched with
+    # other confirmations); the outbox workers deliver the email
+    try:
+        appointment_id = await save_appointment_to_db(appointment_data, email, key, slot)
+    except DuplicateBooking as e:
+        # Committed by another worker / turn between our check and insert
+        mark_confirmed(session, key, e.appointment_id)
+        metrics.events.inc(event="duplicate_confirmation")
+        return notes + await already_confirmed_note(e.appointment_id)
+    except SlotTaken:
+        # Booked through another worker: our index now has it reserved too
+        return slot_taken_note(session, slot)
+    if appointment_id is None:
+        if slot is not None:
+            slot_index.release(slot)
+        # Nothing was recorded, so confirming again retries everything
+        return notes + "\n\n⚠️ Failed to save data. Please confirm again in a moment."
+
+    mark_confirmed(session, key, appointment_id)
+    dialog_engine.booking_completed(session)
+    metrics.events.inc(event="appointment_booked")
+    outbox.notify()
+    notes += "\n\n📧 A confirmation email is on its way."
+
+    # Save to Excel (User Requirement), once per committed booking
+    if save_to_excel(appointment_data):
+        notes += "\n\n💾 Appointment saved to Database & Excel."
+    else:
+        notes += "\n\n💾 Saved to Database (Excel failed)."
+
+    return notes
+
+
+async def run_chat_turn(session, input):
+    """Run one /chat turn against a loaded session; returns the reply text."""
+    global_context = session["context"]
+    appointment_data = session["data"]
+
+    # Append user input
+    global_context.append({"role": "user", "content": input})
+    start_turn(session)
+
+    # Deterministic fast path first; the LLM only handles what it cannot resolve
+    fast_path = apply_fast_path(session, input)
+    response = templated_reply(session, input, fast_path)
+    templated = response is not None
+    dialog_engine.record_turn(session, templated=templated)
+    if templated:
+        # Template reply: no LLM call at all
+        pass
+    elif fast_path:
+        # Every detail in the message is already extracted: reply call only
+        response = await get_completion_from_messages(prompt_for(session), cache_class="reply")
+    else:
+        messages = prompt_for(session)
+        # Single structured call: reply + extracted fields together
+        turn = await run_fused_turn(messages) if CHAT_MODE == "fused" else None
+
+        if turn is not None:
+            response = turn.reply
+            set_llm_fields(session, clean_fields(turn.appointment.model_dump()))
+        else:
+            # Multi-call fallback: extraction call, then reply call
+            fields, confidence = await extract_with_llm(input, global_context)
+            set_llm_fields(session, fields, confidence)
+            response = await get_completion_from_messages(messages, cache_class="reply")
 
     # Append assistant response
     global_context.append({"role": "assistant", "content": response})
 
     # Debug: Print extracted data
     print(f"🔍 Extracted appointment data: {appointment_data}")
-    print(f"👂 User input lowered: '{lowered}'")
+    print(f"👂 User input lowered: '{input.lower()}'")
 
-    
-    # ✅ If patient confirms appointment
-    confirms = ["confirm", "yes", "sure", "ok", "okay", "book it", "schedule"]
-    if any(word in lowered for word in confirms):
-        # Try to extract data from the summary if appointment_data is incomplete
-        if len(appointment_data) < 5:  # If we don't have most of the data
-            summary_extraction_prompt = f"""
-            Extract appointment details from this summary:
-            
-            {response}
-            
-            Extract and return ONLY the following details:
-            - Name: [full name]
-            - Department: [department name]
-            - Doctor: [doctor name]
-            - Date: [appointment date]
-            - Time: [appointment time]
-            - Email: [email address]
-            - Mobile: [mobile number]
-            
-            Format as: Name: [value]
-            """
-            
-            try:
-                summary_response = get_completion_from_messages([
-                    {"role": "system", "content": "You are a data extraction assistant. Extract appointment details from summaries."},
-                    {"role": "user", "content": summary_extraction_prompt}
-                ])
-                
-                # Parse the summary extraction response
-                lines = summary_response.strip().split('\n')
-                for line in lines:
-                    if ':' in line:
-                        key, value = line.split(':', 1)
-                        key = key.strip().lower()
-                        value = value.strip()
-                        if value and value != '(empty if not found)' and value != '(empty)':
-                            if key == 'name':
-                                appointment_data["name"] = value
-                            elif key == 'department':
-                                appointment_data["department"] = value
-                            elif key == 'doctor':
-                                appointment_data["doctor"] = value
-                            elif key == 'date':
-                                appointment_data["date"] = value
-                            elif key == 'time':
-                                appointment_data["time"] = value
-                            elif key == 'email':
-                                appointment_data["email"] = value
-                            elif key == 'mobile':
-                                appointment_data["mobile"] = value
-            except Exception as e:
-                print(f"❌ Summary extraction error: {e}")
-        
-        print(f"🔍 Final appointment data before saving: {appointment_data}")
-        
-        if "email" in appointment_data:
-            details = "\n".join([f"{k.capitalize()}: {v}" for k, v in appointment_data.items()])
-            
-            # Send email
-            email_success = False
-            try:
-                email_body = f"""Dear {appointment_data.get('name','Patient')},
-                    Your appointment has been confirmed with the following details:
-
-                    Doctor: {appointment_data.get('doctor','N/A').title()}
-                    Email: {appointment_data.get('email','N/A')}
-                    Mobile: {appointment_data.get('mobile','N/A')}
-                    Time: {appointment_data.get('time','N/A')}
-                    Date: {appointment_data.get('date','N/A')}
-                    Department: {appointment_data.get('department','N/A')}
-
-                    Thank you for choosing our hospital.
-                    """
-                # background_tasks.add_task(send_email, 
-                #     to_email=appointment_data["email"],
-                #     subject="Your Hospital Appointment Confirmation",
-                #     body=email_body
-                # )
-                
-                # DEBUG: Sending synchronously to catch errors
-                print(f"🔄 [Sync Logic] Sending email now...")
-                is_sent = send_email(
-                    to_email=appointment_data["email"].strip(),
-                    subject="Your Hospital Appointment Confirmation",
-                    body=email_body
-                )
-                
-                if is_sent:
-                    email_success = True
-                    response += "\n\n📧 A confirmation email has been sent."
-                else:
-                    response += "\n\n⚠️ Failed to send confirmation email (Check console)."
-            except Exception as e:
-                print("❌ Email error:", e)
-                response += "\n\n⚠️ Failed to send confirmation email."
-            
-            # Save to Database AND Excel
-            db_save_success = False
-            excel_save_success = False
-            
-            try:
-                # Save to DB (Scalable)
-                db_save_success = save_appointment_to_db(appointment_data)
-                
-                # Save to Excel (User Requirement)
-                excel_save_success = save_to_excel(appointment_data)
-                
-                if db_save_success and excel_save_success:
-                    response += "\n\n💾 Appointment saved to Database & Excel."
-                elif db_save_success:
-                     response += "\n\n💾 Saved to Database (Excel failed)."
-                elif excel_save_success:
-                     response += "\n\n💾 Saved to Excel (Database failed)."
-                else:
-                    response += "\n\n⚠️ Failed to save data."
-            except Exception as e:
-                print("❌ Save error:", e)
-                response += "\n\n⚠️ Failed to save data."
-                
+    with span("confirm"):
+        response += await confirm_if_requested(session, input, response, templated=templated)
+    return response
+
+
+# === Chat wire protocol ===
+# v2 (default) returns only what changed this turn: the reply, a JSON merge
+# patch of the appointment fields (null = cleared) and the session's turn
+# number. debug=yes adds the full state. v1 is the legacy full-state reply.
+CHAT_PROTOCOL_VERSION = 2
+
+
+def field_changes(before, after):
+    """JSON merge patch (RFC 7386) that turns before into after."""
+    patch = {key: value for key, value in after.items() if before.get(key) != value}
+    patch.update({key: None for key in before if key not in after})
+    return patch
+
+
+def turn_payload(session, response, before, protocol=CHAT_PROTOCOL_VERSION, debug=False):
+    """Response body for one turn in the requested protocol version."""
+    if protocol == 1:
+        return {"response": response, "context": session["context"], "data": session["data"]}
+    payload = {
+        "v": CHAT_PROTOCOL_VERSION,
+        "seq": session.get("seq", 0),
+        "response": response,
+        "changed": field_changes(before, session["data"]),
+    }
+    if debug:
+        payload.update(context=session["context"], summary=session.get("summary", ""), data=session["data"])
+    return payload
+
+
+def remember_turn(session, turn_id, response, changed):
+    """Keep a turn's result with the session, so a client retrying the same
+    turn_id (e.g. the POST fallback after a dropped stream) gets it back
+    instead of running the turn a second time."""
+    if turn_id:
+        session["last_turn"] = {"id": turn_id, "seq": session.get("seq", 0), "response": response, "changed": changed}
+
+
+def replayed_turn(session, turn_id):
+    """The remembered result if turn_id is the session's last turn, else None."""
+    last = session.get("last_turn")
+    return last if turn_id and last and last["id"] == turn_id else None
+
+
+def replay_payload(session, last, protocol=CHAT_PROTOCOL_VERSION, debug=False):
+    payload = turn_payload(session, last["response"], session["data"], protocol, debug)
+    if protocol != 1:
+        payload.update(seq=last["seq"], changed=last["changed"], replayed=True)
+    return payload
+
+
+def reset_payload(session, protocol=CHAT_PROTOCOL_VERSION, debug=False):
+    payload = turn_payload(session, CHAT_CLEARED_MESSAGE, {}, protocol, debug)
+    if protocol != 1:
+        payload["reset"] = True  # client drops its copy of the fields
+    return payload
+
+
+@app.post("/chat")
+async def chat(request: Request, background_tasks: BackgroundTasks, input: str = Form(...), newchat: str = Form(default="no"),
+               session_id: str = Form(default="guest"), protocol: int = Form(default=CHAT_PROTOCOL_VERSION), debug: str = Form(default="no"),
+               turn_id: str = Form(default="")):
+    debug = debug.lower() == "yes"
+    try:
+        ticket = await admit(session_id, client_ip(request.headers, request.client))
+    except Rejected as rejected:
+        return rejected_response(rejected)
+    try:
+        return await chat_turn(background_tasks, input, newchat, session_id, protocol, debug, turn_id)
+    finally:
+        ticket.release()
+
+
+async def chat_turn(background_tasks, input, newchat, session_id, protocol, debug, turn_id=""):
+    # One turn at a time per session, even across workers
+    async with turn_lock(session_id):
+        # Reset chat if requested
+        if newchat.lower() == "yes":
+            session = await reset_session(session_id)
+            await save_session(session_id, session)
+            return JSONResponse(reset_payload(session, protocol, debug))
+
+        # Get or create session
+        session = await load_session(session_id)
+        last = replayed_turn(session, turn_id)
+        if last is not None:
+            # Retry of a turn that already ran (its reply never arrived)
+            return JSONResponse(replay_payload(session, last, protocol, debug))
+        before = dict(session["data"])
+        session["seq"] = session.get("seq", 0) + 1
+        response = await run_chat_turn(session, input)
+        remember_turn(session, turn_id, response, field_changes(before, session["data"]))
+        await save_session(session_id, session)
+        payload = turn_payload(session, response, before, protocol, debug)
+        if context_window.needs_fold(session):
+            background_tasks.add_task(fold_session, session_id)
+
+    return JSONResponse(payload)
+
+
+# === Streaming chat (SSE + WebSocket) ===
+async def stream_turn(input, newchat="no", session_id="guest", debug=False, turn_id=""):
+    """Run one chat turn, yielding (event, payload) pairs as it progresses.
+
+    Events: "token" (reply text as generated), "data" (changed fields),
+    "notes" (confirmation side-effect results) and a final "done" carrying
+    the complete reply in the v2 protocol shape. The session is saved before
+    "notes" / "done" go out, so a client that drops right after still finds
+    the turn's state (and, with the same turn_id, its reply) on retry.
+    """
+    async with turn_lock(session_id):
+        if newchat.lower() == "yes":
+            session = await reset_session(session_id)
+            await save_session(session_id, session)
+            yield "token", {"text": CHAT_CLEARED_MESSAGE}
+            yield "done", reset_payload(session, debug=debug)
+            return
+
+        session = await load_session(session_id)
+        last = replayed_turn(session, turn_id)
+        if last is not None:
+            yield "token", {"text": last["response"]}
+            yield "done", replay_payload(session, last, debug=debug)
+            return
+
+        async def persist(done):
+            remember_turn(session, turn_id, done["response"], done["changed"])
+            await save_session(session_id, session)
+
+        async for event, payload in stream_session_turn(session, input, debug, persist):
+            yield event, payload
+
+    # The client already has "done"; fold outside the turn's lock and
+    # admission slot, without delaying the next turn on this WebSocket
+    if context_window.needs_fold(session):
+        schedule_fold(session_id)
+
+
+async def stream_session_turn(session, input, debug=False, persist=None):
+    """Streaming counterpart of run_chat_turn.
+
+    persist(done_payload) is awaited once the turn's state is final, before
+    the "notes" and "done" events are yielded.
+    """
+    global_context = session["context"]
+    appointment_data = session["data"]
+    before = dict(appointment_data)
+    session["seq"] = session.get("seq", 0) + 1
+    global_context.append({"role": "user", "content": input})
+    start_turn(session)
+
+    # The reply streams as plain text, so extraction runs alongside it
+    # instead of being fused into the same call.
+    extraction = None
+    fast_path = apply_fast_path(session, input)
+    templated = templated_reply(session, input, fast_path)
+    dialog_engine.record_turn(session, templated=templated is not None)
+    if templated is None and not fast_path:
+        extraction = asyncio.create_task(extract_with_llm(input, list(global_context)))
+
+    parts = []
+    try:
+        if templated is not None:
+            parts.append(templated)
+            yield "token", {"text": templated}
         else:
-            response += "\n\n⚠️ No email address found. Please provide your email."
+            async for token in stream_completion_from_messages(prompt_for(session)):
+                parts.append(token)
+                yield "token", {"text": token}
+    except BaseException:
+        if extraction is not None:
+            extraction.cancel()
+        raise
+    response = "".join(parts)
+    global_context.append({"role": "assistant", "content": response})
+
+    if extraction is not None:
+        fields, confidence = await extraction
+        set_llm_fields(session, fields, confidence)
+    yield "data", {"changed": field_changes(before, appointment_data)}
+
+    with span("confirm"):
+        notes = await confirm_if_requested(session, input, response, templated=templated is not None)
+    done = turn_payload(session, response + notes, before, debug=debug)
+    if persist is not None:
+        await persist(done)
+    if notes:
+        yield "notes", {"text": notes}
+    yield "done", done
 
-    return JSONResponse({"response": response, "context": global_context, "data": appointment_data})
+
+@app.post("/chat/stream")
+async def chat_stream(request: Request, input: str = Form(...), newchat: str = Form(default="no"), session_id: str = Form(default="guest"),
+                      debug: str = Form(default="no"), turn_id: str = Form(default="")):
+    """Server-Sent Events variant of /chat."""
+    try:
+        ticket = await admit(session_id, client_ip(request.headers, request.client))
+    except Rejected as rejected:
+        return rejected_response(rejected)
+
+    async def events():
+        # The slot is held until the stream ends
+        try:
+            async for event, payload in stream_turn(input, newchat, session_id, debug.lower() == "yes", turn_id):
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            ticket.release()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also runs if the body never started streaming
+        background=BackgroundTask(ticket.release),
+    )
+
+
+@app.websocket("/chat/ws")
+async def chat_ws(websocket: WebSocket):
+    """Persistent WebSocket variant of /chat: one JSON message per turn in,
+    a sequence of {"event": ..., ...} messages out."""
+    await websocket.accept()
+    ip = client_ip(websocket.headers, websocket.client)
+    try:
+        while True:
+            message = await websocket.receive_json()
+            session_id = message.get("session_id", "guest")
+            # One trace per turn; the connection itself can live for hours
+            with metrics.trace("WS /chat/ws", message.get("request_id"), transport="ws"):
+                try:
+                    ticket = await admit(session_id, ip)
+                except Rejected as rejected:
+                    payload = rejected.payload()
+                    await websocket.send_json({"event": "error", "message": payload.pop("response"), **payload})
+                    continue
+                try:
+                    async for event, payload in stream_turn(
+                        message.get("input", ""),
+                        message.get("newchat", "no"),
+                        session_id,
+                        str(message.get("debug", "no")).lower() == "yes",
+                        str(message.get("turn_id", "")),
+                    ):
+                        await websocket.send_json({"event": event, **payload})
+                except WebSocketDisconnect:
+                    raise
+                except Exception as e:
+                    print(f"❌ Streaming turn error: {e}")
+                    await websocket.send_json({"event": "error", "message": "Something went wrong."})
+                finally:
+                    ticket.release()
+    except WebSocketDisconnect:
+        pass
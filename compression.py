@@ -0,0 +1,77 @@
+"""Response compression: Brotli when the client accepts it, gzip otherwise.
+
+gzip is Starlette's GZipMiddleware. Brotli needs the optional `brotli`
+package and is only applied to responses sent in one piece (JSON, small
+files). Streamed responses such as SSE pass through untouched. The coding
+is chosen from Accept-Encoding with its q-values ("br;q=0" refuses br).
+"""
+import os
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipMiddleware
+
+from static_assets import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+HTTP_COMPRESS_MIN_BYTES = int(os.getenv("HTTP_COMPRESS_MIN_BYTES", "500"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+# 4-5 compresses JSON better than gzip -6 at similar CPU cost
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/javascript", "image/svg+xml", "text/")
+
+
+def compressible(content_type):
+    return content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith("text/event-stream")
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=HTTP_COMPRESS_MIN_BYTES, gzip_level=GZIP_LEVEL,
+                 brotli_quality=BROTLI_QUALITY):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.brotli_quality = brotli_quality
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli is None or "br" not in accepted:
+            # GZipMiddleware only looks for the substring "gzip"
+            await (self.gzip if "gzip" in accepted else self.app)(scope, receive, send)
+            return
+
+        start = None
+        started = False
+
+        async def send_brotli(message):
+            nonlocal start, started
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if started:
+                await send(message)
+                return
+            started = True
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start["headers"])
+            if (message["type"] != "http.response.body" or message.get("more_body")
+                    or len(body) < self.minimum_size or "content-encoding" in headers
+                    or not compressible(headers.get("content-type", ""))):
+                await send(start)
+                await send(message)
+                return
+            body = brotli.compress(body, quality=self.brotli_quality)
+            headers["Content-Encoding"] = "br"
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_brotli)
@@ -0,0 +1,156 @@
+"""Bounded conversation context sent to the LLM.
+
+A session's context keeps the system prompt plus the most recent turns
+verbatim. Older turns are folded into session["summary"], a rolling summary
+that an LLM call keeps up to date, with a plain-text fallback if that call
+fails. Every prompt is rebuilt the same way:
+
+    system prompt
+    system: summary of earlier turns + appointment details collected so far
+    last CONTEXT_KEEP_TURNS turns, trimmed further to the provider's budget
+
+Token counts are estimated from characters (no tokenizer dependency). They
+are close enough for budgeting and for comparing against the full history.
+"""
+import os
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Turns (user message + reply) kept verbatim
+CONTEXT_KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", "6"))
+# Fold this many turns at once, so the summary call runs every few turns
+CONTEXT_FOLD_TURNS = int(os.getenv("CONTEXT_FOLD_TURNS", "4"))
+CONTEXT_SUMMARY_MAX_CHARS = int(os.getenv("CONTEXT_SUMMARY_MAX_CHARS", "1500"))
+CHARS_PER_TOKEN = 4
+MESSAGE_TOKEN_OVERHEAD = 4
+
+SUMMARY_INSTRUCTIONS = """You maintain a running summary of a hospital appointment chat.
+Merge the new messages into the existing summary. Keep it under 80 words and
+note only what matters for the rest of the conversation (questions asked,
+preferences, problems, changes of mind). Appointment details are tracked
+separately: do not repeat them. Return only the summary text."""
+
+Message = Dict[str, str]
+
+
+def estimate_tokens(messages: List[Message]) -> int:
+    return sum(len(m.get("content") or "") // CHARS_PER_TOKEN + MESSAGE_TOKEN_OVERHEAD for m in messages)
+
+
+def fallback_summary(summary: str, messages: List[Message]) -> str:
+    """Plain-text fold used when the summary call fails: clipped lines, newest kept."""
+    lines = [f"{m['role'].capitalize()}: {(m.get('content') or '')[:200]}" for m in messages]
+    text = "\n".join(([summary] if summary else []) + lines)
+    return text[-CONTEXT_SUMMARY_MAX_CHARS:]
+
+
+def state_message(summary: str, appointment_data: Dict[str, str]) -> Optional[Message]:
+    """One system message carrying the folded history and the extracted fields."""
+    parts = []
+    if summary:
+        parts.append(f"Summary of the earlier conversation:\n{summary}")
+    if appointment_data:
+        details = "\n".join(f"- {key}: {value}" for key, value in appointment_data.items())
+        parts.append(f"Appointment details collected so far:\n{details}")
+    if not parts:
+        return None
+    return {"role": "system", "content": "\n\n".join(parts)}
+
+
+class ContextWindow:
+    """Builds budgeted prompts from sessions and folds old turns away."""
+
+    def __init__(self, summarize: Callable[[List[Message]], Awaitable[str]],
+                 keep_turns: int = CONTEXT_KEEP_TURNS, fold_turns: int = CONTEXT_FOLD_TURNS):
+        self.summarize = summarize
+        self.keep_turns = keep_turns
+        self.fold_turns = fold_turns
+        self.turns = 0
+        self.tokens_sent = 0
+        self.tokens_full_history = 0
+        self.folds = 0
+
+    def build(self, session, token_budget: int) -> List[Message]:
+        """Prompt for the next LLM call: system prompt, state, recent turns."""
+        context = session["context"]
+        system, history = context[:1], context[1:]
+        recent = history[-2 * self.keep_turns:]
+        state = state_message(session.get("summary", ""), session["data"])
+        head = system + ([state] if state else [])
+
+        # Drop the oldest verbatim messages until we fit (always keep the last one)
+        budget = token_budget - estimate_tokens(head)
+        while len(recent) > 1 and estimate_tokens(recent) > budget:
+            recent = recent[1:]
+        return head + recent
+
+    def record(self, session, messages: List[Message]):
+        """Per-turn token accounting: what we sent vs. the full history."""
+        sent = estimate_tokens(messages)
+        full = estimate_tokens(session["context"]) + session.get("usage", {}).get("folded_tokens", 0)
+        usage = session.setdefault("usage", {})
+        usage["turns"] = usage.get("turns", 0) + 1
+        usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + sent
+        usage["full_history_tokens"] = usage.get("full_history_tokens", 0) + full
+        usage["last_prompt_tokens"] = sent
+        self.turns += 1
+        self.tokens_sent += sent
+        self.tokens_full_history += full
+
+    def needs_fold(self, session) -> bool:
+        return len(session["context"]) - 1 > 2 * (self.keep_turns + self.fold_turns)
+
+    def fold_snapshot(self, session) -> Optional[Dict]:
+        """The turns a fold would replace, and the summary it would extend (None: nothing to fold)."""
+        if not self.needs_fold(session):
+            return None
+        context = session["context"]
+        cut = len(context) - 2 * self.keep_turns
+        return {"old": [dict(m) for m in context[1:cut]], "summary": session.get("summary", "")}
+
+    async def summarize_fold(self, snapshot: Dict) -> str:
+        """The new summary for a snapshot: the summary call, else the plain-text fold."""
+        summary, old = snapshot["summary"], snapshot["old"]
+        try:
+            new_summary = (await self.summarize([
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": fallback_summary(summary, old)},
+            ])).strip()
+        except Exception as e:
+            print(f"⚠️ Summary call failed ({e}); folding as plain text")
+            new_summary = ""
+        return new_summary[:CONTEXT_SUMMARY_MAX_CHARS] or fallback_summary(summary, old)
+
+    def apply_fold(self, session, snapshot: Dict, new_summary: str) -> bool:
+        """Compare-and-set: replace the snapshot's turns by new_summary; False if the session moved on.
+
+        Turns appended since the snapshot are kept. A reset or another fold
+        (different summary or leading turns) makes the snapshot stale.
+        """
+        old = snapshot["old"]
+        context = session["context"]
+        if session.get("summary", "") != snapshot["summary"] or context[1:1 + len(old)] != old:
+            return False
+        session["summary"] = new_summary
+        usage = session.setdefault("usage", {})
+        usage["folded_tokens"] = usage.get("folded_tokens", 0) + estimate_tokens(old)
+        del context[1:1 + len(old)]
+        self.folds += 1
+        return True
+
+    async def fold(self, session) -> bool:
+        """Fold turns beyond the verbatim window into the summary; True if changed."""
+        snapshot = self.fold_snapshot(session)
+        if snapshot is None:
+            return False
+        return self.apply_fold(session, snapshot, await self.summarize_fold(snapshot))
+
+    def stats(self) -> Dict[str, float]:
+        saved = self.tokens_full_history - self.tokens_sent
+        return {
+            "turns": self.turns,
+            "prompt_tokens": self.tokens_sent,
+            "full_history_tokens": self.tokens_full_history,
+            "tokens_saved": saved,
+            "saved_pct": round(100 * saved / self.tokens_full_history, 1) if self.tokens_full_history else 0.0,
+            "folds": self.folds,
+        }
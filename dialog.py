@@ -0,0 +1,157 @@
+"""Template-driven dialog for the fixed booking flow (DIALOG_MODE=fsm).
+
+Booking is slot filling: name -> department -> doctor -> date -> time ->
+email -> mobile -> summary -> confirmation. When the fast path (plus the
+name rule below) explains the patient's whole message, the next question or
+the summary is rendered from a template and no LLM call is made. Open-ended
+or ambiguous messages (questions, corrections, small talk) still go to the
+LLM. Per-session counters record how many turns each booking took on each
+path, so stats() can report LLM calls avoided per completed booking.
+"""
+import re
+from typing import Callable, Dict, List, Optional
+
+from extraction import APPOINTMENT_FIELDS
+
+QUESTIONS = {
+    "name": "What is your full name?",
+    "department": "Which department do you need? (e.g., {departments})",
+    "doctor": "Which doctor would you prefer?{doctors}",
+    "date": "What date would you like for your appointment?",
+    "time": "What time works best for you?",
+    "email": "What is your email address?",
+    "mobile": "What is your mobile number?",
+}
+
+SUMMARY_LABELS = {
+    "name": "Full Name",
+    "department": "Department",
+    "doctor": "Preferred Doctor",
+    "date": "Date",
+    "time": "Time",
+    "email": "Email",
+    "mobile": "Mobile number",
+}
+
+GREETING_RE = re.compile(
+    r"^\s*(?:(?:hi|hello|hey|good (?:morning|afternoon|evening)|namaste)[\s,!.]*)?"
+    r"(?:(?:i|we)(?:'d| would)? (?:want|need|like) (?:to (?:book|make|get|schedule) )?(?:an? )?appointment"
+    r"|(?:can|could) i (?:book|get|have) (?:an? )?appointment"
+    r"|book (?:me )?(?:an? )?appointment)?(?: please)?[\s,!.]*$",
+    re.IGNORECASE,
+)
+NAME_RE = re.compile(
+    r"^\s*(?:(?:my name is|my name's|name is|i am|i'm|this is|it's|name:)\s+)?"
+    r"([a-z][a-z.'-]*(?:\s+[a-z][a-z.'-]*){0,3})\s*[.!]?\s*$",
+    re.IGNORECASE,
+)
+# A message that only confirms ("yes please", "ok, book it") - nothing to interpret
+CONFIRM_ONLY_RE = re.compile(
+    r"^\s*(?:(?:yes|yeah|yep|sure|ok|okay|please|confirm|confirmed|book it|schedule it|go ahead|do it"
+    r"|that's right|correct|thanks|thank you)[\s,!.]*)+$",
+    re.IGNORECASE,
+)
+# Words that make a short reply something other than a name
+NOT_A_NAME = {"yes", "no", "ok", "okay", "sure", "thanks", "thank", "hi", "hello", "hey", "what", "why",
+              "how", "when", "where", "which", "who", "can", "could", "do", "does", "is", "are", "the",
+              "appointment", "doctor", "department", "confirm", "cancel", "change", "help", "please",
+              "i", "am", "me", "my", "have", "having", "need", "want", "feel", "feeling", "not", "sick", "pain",
+              "sorry", "fine", "good", "great", "there", "here", "today", "tomorrow", "yesterday", "since"}
+
+
+class DialogEngine:
+    def __init__(self, directory: Optional[Dict] = None, hints: Optional[Dict[str, Callable[[Dict], str]]] = None):
+        directory = directory or {}
+        self.departments = list(directory.get("departments", {}))
+        self.doctors_by_department: Dict[str, List[str]] = {}
+        for doctor in directory.get("doctors", []):
+            self.doctors_by_department.setdefault(doctor.get("department", "").lower(), []).append(doctor["name"])
+        # field -> callable(data) returning extra text for that question (e.g. free slots)
+        self.hints = hints or {}
+        self.template_turns = 0
+        self.llm_turns = 0
+        self.bookings = 0
+        self.booking_template_turns = 0
+        self.booking_llm_turns = 0
+
+    # === Understanding ===
+    @staticmethod
+    def missing(data: Dict) -> List[str]:
+        return [field for field in APPOINTMENT_FIELDS if not data.get(field)]
+
+    @staticmethod
+    def is_greeting(text: str) -> bool:
+        return bool(text.strip()) and GREETING_RE.match(text) is not None
+
+    @staticmethod
+    def is_bare_confirmation(text: str) -> bool:
+        return CONFIRM_ONLY_RE.match(text) is not None
+
+    @staticmethod
+    def match_name(text: str) -> Optional[str]:
+        """A bare name ("Asha Rao", "my name is asha rao") or None."""
+        match = NAME_RE.match(text)
+        if match is None:
+            return None
+        words = match.group(1).split()
+        if any(word.lower().strip(".'-") in NOT_A_NAME for word in words):
+            return None
+        if any(ch.isupper() for ch in match.group(1)):
+            return " ".join(words)  # the patient's own capitalization
+        return " ".join(word[:1].upper() + word[1:] for word in words)
+
+    # === Rendering ===
+    def question(self, field: str, data: Dict) -> str:
+        department = data.get("department", "").lower()
+        doctors = self.doctors_by_department.get(department, [])
+        text = QUESTIONS[field].format(
+            departments=", ".join(self.departments[:3]) or "Cardiology, Neurology, Orthopedics",
+            doctors=f" ({', '.join(doctors)})" if doctors else "",
+        )
+        hint = self.hints.get(field)
+        extra = hint(data) if hint is not None else ""
+        return f"{text} {extra}".strip()
+
+    @staticmethod
+    def summary(data: Dict) -> str:
+        lines = "\n".join(f"- {SUMMARY_LABELS[field]}: {data.get(field, '')}" for field in APPOINTMENT_FIELDS)
+        return ("Thank you for providing all the necessary details. Here is the summary of your appointment:\n"
+                f"{lines}\n\nDo you want to confirm this appointment?")
+
+    @staticmethod
+    def shows_summary(text: str, data: Dict) -> bool:
+        """True if a reply (e.g. the LLM's own summary) lists every field's value."""
+        lowered = text.lower()
+        return all(str(data.get(field, "")).lower() in lowered for field in APPOINTMENT_FIELDS)
+
+    def next_prompt(self, data: Dict) -> str:
+        """The question for the first missing field, or the summary."""
+        missing = self.missing(data)
+        return self.question(missing[0], data) if missing else self.summary(data)
+
+    # === Accounting ===
+    def record_turn(self, session, templated: bool):
+        counts = session.setdefault("dialog", {"template": 0, "llm": 0})
+        if templated:
+            self.template_turns += 1
+            counts["template"] += 1
+        else:
+            self.llm_turns += 1
+            counts["llm"] += 1
+
+    def booking_completed(self, session):
+        """Fold the session's turn counts into the per-booking stats and reset them."""
+        counts = session.pop("dialog", None) or {"template": 0, "llm": 0}
+        self.bookings += 1
+        self.booking_template_turns += counts["template"]
+        self.booking_llm_turns += counts["llm"]
+
+    def stats(self) -> Dict:
+        return {
+            "template_turns": self.template_turns,
+            "llm_turns": self.llm_turns,
+            "bookings": self.bookings,
+            # One templated turn is one reply call not made
+            "llm_calls_avoided_per_booking": round(self.booking_template_turns / self.bookings, 2) if self.bookings else None,
+            "llm_turns_per_booking": round(self.booking_llm_turns / self.bookings, 2) if self.bookings else None,
+        }
@@ -0,0 +1,247 @@
+"""Write-behind export of confirmed appointments to appointments.xlsx.
+
+Rows are queued and appended in batches to a CSV journal by one background
+writer; the workbook is rebuilt from the journal by periodic compaction
+(also runnable by hand: python excel_export.py compact).
+"""
+import csv
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process only
+    fcntl = None
+
+from metrics import span
+
+APPOINTMENTS_FOLDER = "appointments_data"
+EXCEL_FILE = os.path.join(APPOINTMENTS_FOLDER, "appointments.xlsx")
+JOURNAL_FILE = os.path.join(APPOINTMENTS_FOLDER, "appointments_journal.csv")
+COMPACT_LOCK_FILE = os.path.join(APPOINTMENTS_FOLDER, ".compact.lock")
+
+EXCEL_COLUMNS = ["Timestamp", "Name", "Department", "Doctor", "Date", "Time", "Email", "Mobile"]
+
+EXCEL_FLUSH_INTERVAL = float(os.getenv("EXCEL_FLUSH_INTERVAL", "2"))
+EXCEL_FLUSH_ROWS = int(os.getenv("EXCEL_FLUSH_ROWS", "200"))
+EXCEL_COMPACT_INTERVAL = float(os.getenv("EXCEL_COMPACT_INTERVAL", "300"))
+
+
+def ensure_appointments_folder(folder=APPOINTMENTS_FOLDER):
+    """Create appointments folder if it doesn't exist"""
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+        print(f"✅ Created folder: {folder}")
+
+
+def appointment_row(appointment_data, timestamp=None):
+    """One Excel row (in EXCEL_COLUMNS order) for an appointment."""
+    timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return [
+        timestamp,
+        appointment_data.get("name", ""),
+        appointment_data.get("department", ""),
+        appointment_data.get("doctor", ""),
+        appointment_data.get("date", ""),
+        appointment_data.get("time", ""),
+        appointment_data.get("email", ""),
+        appointment_data.get("mobile", ""),
+    ]
+
+
+@contextmanager
+def file_lock(f, exclusive=True, blocking=True):
+    """flock() a file so several worker processes can share the journal.
+
+    Yields False if blocking=False and the lock is held elsewhere.
+    """
+    if fcntl is None:
+        yield True
+        return
+    flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+    if not blocking:
+        flags |= fcntl.LOCK_NB
+    try:
+        fcntl.flock(f.fileno(), flags)
+    except BlockingIOError:
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def append_to_journal(rows, journal_file=JOURNAL_FILE):
+    """Append rows to the journal in one locked write + fsync."""
+    with open(journal_file, "a", newline="", encoding="utf-8") as f:
+        with file_lock(f):
+            if f.tell() == 0:
+                csv.writer(f).writerow(EXCEL_COLUMNS)
+            csv.writer(f).writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def seed_journal_from_workbook(excel_file=EXCEL_FILE, journal_file=JOURNAL_FILE):
+    """One-time migration: copy an existing workbook into a new journal."""
+    if os.path.exists(journal_file) or not os.path.exists(excel_file):
+        return 0
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(excel_file, read_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    next(rows, None)  # header
+    seeded = [["" if v is None else v for v in row[:len(EXCEL_COLUMNS)]] for row in rows]
+    workbook.close()
+    append_to_journal(seeded, journal_file)
+    print(f"✅ Seeded {len(seeded)} rows from {excel_file} into {journal_file}")
+    return len(seeded)
+
+
+def compact(journal_file=JOURNAL_FILE, excel_file=EXCEL_FILE, lock_file=COMPACT_LOCK_FILE):
+    """Rebuild the workbook from the journal in constant memory.
+
+    Writes to a temporary file and swaps it in atomically, so readers never
+    see a half-written workbook. Returns the row count, or None if another
+    process is already compacting.
+    """
+    from openpyxl import Workbook
+
+    if not os.path.exists(journal_file):
+        return 0
+    with open(lock_file, "a") as lock:
+        with file_lock(lock, blocking=False) as acquired:
+            if not acquired:
+                return None
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet("Sheet1")
+            count = 0
+            with open(journal_file, newline="", encoding="utf-8") as f:
+                with file_lock(f, exclusive=False):
+                    reader = csv.reader(f)
+                    sheet.append(next(reader, EXCEL_COLUMNS))
+                    for row in reader:
+                        sheet.append(row)
+                        count += 1
+            tmp_file = excel_file + ".tmp"
+            workbook.save(tmp_file)
+            os.replace(tmp_file, excel_file)
+    return count
+
+
+class ExcelExporter:
+    """Single background writer for the Excel export."""
+
+    def __init__(self, folder=APPOINTMENTS_FOLDER, flush_interval=EXCEL_FLUSH_INTERVAL,
+                 flush_rows=EXCEL_FLUSH_ROWS, compact_interval=EXCEL_COMPACT_INTERVAL):
+        self.folder = folder
+        self.journal_file = os.path.join(folder, os.path.basename(JOURNAL_FILE))
+        self.excel_file = os.path.join(folder, os.path.basename(EXCEL_FILE))
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.compact_interval = compact_interval
+        self.queue = queue.Queue()
+        self.rows_written = 0
+        self.batches_written = 0
+        self._dirty = False
+        self._last_compact = time.monotonic()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def submit(self, row):
+        """Queue one row; never blocks on disk."""
+        self.queue.put(row)
+
+    def mark_dirty(self):
+        """Rows were appended to the journal directly (bulk import): compact them in too."""
+        self._dirty = True
+
+    def start(self):
+        ensure_appointments_folder(self.folder)
+        seed_journal_from_workbook(self.excel_file, self.journal_file)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="excel-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, compact_now=True):
+        """Flush everything still queued and (optionally) compact once more."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        remaining = []
+        while True:
+            try:
+                remaining.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        self._flush(remaining)
+        if compact_now and self._dirty:
+            self._compact()
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        try:
+            with span("excel.flush", rows=len(batch)):
+                append_to_journal(batch, self.journal_file)
+            self.rows_written += len(batch)
+            self.batches_written += 1
+            self._dirty = True
+        except Exception as e:
+            print(f"❌ Excel journal write error: {e}")
+            # Put the rows back so the next flush retries them
+            for row in batch:
+                self.queue.put(row)
+
+    def _compact(self):
+        # Child process: openpyxl is pure Python and would hold our GIL
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "compact", self.folder],
+            capture_output=True, text=True,
+        )
+        if result.returncode == 0:
+            self._dirty = False
+            print(f"✅ Excel compaction: {result.stdout.strip()}")
+        else:
+            print(f"❌ Excel compaction failed: {result.stderr.strip()}")
+        self._last_compact = time.monotonic()
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining > 0 and len(batch) < self.flush_rows:
+                try:
+                    batch.append(self.queue.get(timeout=min(remaining, 0.5)))
+                except queue.Empty:
+                    pass
+                continue
+
+            # Interval elapsed or batch full
+            self._flush(batch)
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            if self._dirty and time.monotonic() - self._last_compact >= self.compact_interval:
+                self._compact()
+        self._flush(batch)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "compact":
+        print(__doc__)
+        sys.exit(1)
+    folder = sys.argv[2] if len(sys.argv) > 2 else APPOINTMENTS_FOLDER
+    rows = compact(
+        os.path.join(folder, os.path.basename(JOURNAL_FILE)),
+        os.path.join(folder, os.path.basename(EXCEL_FILE)),
+        os.path.join(folder, os.path.basename(COMPACT_LOCK_FILE)),
+    )
+    print("skipped (another compaction is running)" if rows is None else f"{rows} rows written")
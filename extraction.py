@@ -0,0 +1,134 @@
+import copy
+import json
+from typing import Dict, Optional
+
+from pydantic import BaseModel, ValidationError
+
+# Order matters: it is the order the bot collects the details in.
+APPOINTMENT_FIELDS = ["name", "department", "doctor", "date", "time", "email", "mobile"]
+
+EMPTY_VALUES = {"", "(empty if not found)", "(empty)", "n/a", "none", "null"}
+
+
+class AppointmentFields(BaseModel):
+    name: str = ""
+    department: str = ""
+    doctor: str = ""
+    date: str = ""
+    time: str = ""
+    email: str = ""
+    mobile: str = ""
+
+
+class ToolCall(BaseModel):
+    """A tool the model wants run before it answers the patient."""
+
+    name: str = ""
+    arguments: Dict[str, str] = {}
+
+
+class ChatTurn(BaseModel):
+    """Structured output of a fused turn: the reply plus extracted fields."""
+
+    reply: str
+    appointment: AppointmentFields = AppointmentFields()
+    tool_call: Optional[ToolCall] = None
+
+
+# JSON schema handed to providers that support schema-constrained output.
+CHAT_TURN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "reply": {"type": "string"},
+        "appointment": {
+            "type": "object",
+            "properties": {field: {"type": "string"} for field in APPOINTMENT_FIELDS},
+            "required": APPOINTMENT_FIELDS,
+        },
+    },
+    "required": ["reply", "appointment"],
+}
+
+FUSED_INSTRUCTIONS = f"""
+Respond ONLY with a JSON object of this shape:
+{{"reply": "<your next message to the patient>",
+  "appointment": {{{", ".join(f'"{field}": ""' for field in APPOINTMENT_FIELDS)}}}}}
+
+"reply" is exactly what you would normally say to the patient.
+"appointment" holds every appointment detail the patient has given so far in
+this conversation. Use an empty string for details that are not known yet.
+"""
+
+
+def chat_turn_schema(tools=None):
+    """CHAT_TURN_SCHEMA plus an optional tool_call for the given tools."""
+    if not tools:
+        return CHAT_TURN_SCHEMA
+    arguments = {}
+    for tool in tools:
+        arguments.update(tool["parameters"])
+    schema = copy.deepcopy(CHAT_TURN_SCHEMA)
+    schema["properties"]["tool_call"] = {
+        "type": "object",
+        "properties": {
+            "name": {"type": "string", "enum": [tool["name"] for tool in tools]},
+            "arguments": {"type": "object", "properties": arguments},
+        },
+        "required": ["name", "arguments"],
+    }
+    return schema
+
+
+def tool_instructions(tools):
+    """Describe the callable tools (name, purpose, arguments) for the prompt."""
+    lines = [
+        "",
+        'If you need one of these tools to answer, add "tool_call": {"name": ..., "arguments": {...}}',
+        "to the JSON object. The tool result is sent back to you before the patient sees a reply.",
+    ]
+    for tool in tools:
+        args = ", ".join(f"{name} ({spec['description']})" for name, spec in tool["parameters"].items())
+        lines.append(f"- {tool['name']}: {tool['description']} Arguments: {args}")
+    return "\n".join(lines) + "\n"
+
+
+def build_fused_messages(context, tools=None):
+    """Insert the structured-output instructions after the system prompt."""
+    instructions = FUSED_INSTRUCTIONS + tool_instructions(tools) if tools else FUSED_INSTRUCTIONS
+    return [context[0], {"role": "system", "content": instructions}] + context[1:]
+
+
+def parse_chat_turn(raw: str) -> Optional[ChatTurn]:
+    """Validate a fused JSON response; None if it does not match the schema."""
+    if not raw:
+        return None
+    text = raw.strip()
+    # Some models still wrap JSON in a markdown fence
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[text.find("{"):]
+    try:
+        return ChatTurn.model_validate(json.loads(text))
+    except (ValueError, ValidationError) as e:
+        print(f"❌ Structured output invalid: {e}")
+        return None
+
+
+def clean_fields(fields: Dict[str, str]) -> Dict[str, str]:
+    """Keep only known, non-empty appointment fields."""
+    cleaned = {}
+    for key, value in fields.items():
+        value = (value or "").strip()
+        if key in APPOINTMENT_FIELDS and value.lower() not in EMPTY_VALUES:
+            cleaned[key] = value
+    return cleaned
+
+
+def parse_extraction_text(text: str) -> Dict[str, str]:
+    """Parse 'Name: value' lines from a free-text extraction response."""
+    fields = {}
+    for line in text.strip().split("\n"):
+        if ":" in line:
+            key, value = line.split(":", 1)
+            fields[key.strip().lstrip("-* ").lower()] = value
+    return clean_fields(fields)
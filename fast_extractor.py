@@ -0,0 +1,246 @@
+import json
+import os
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+DIRECTORY_PATH = os.getenv("DIRECTORY_PATH", "directory.json")
+
+# Matches at or above this confidence are written to the session without
+# asking the LLM.
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.8"))
+
+# Indian convention: 05/10/2026 is 5 October.
+DATE_DAYFIRST = os.getenv("DATE_DAYFIRST", "1") != "0"
+
+MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+PHONE_RE = re.compile(r"(?<![\d/.:-])(?:\+91[\s-]?|0)?(\d[\d\s-]{8,12}\d)(?![\d/.:-])")
+ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+NUMERIC_DATE_RE = re.compile(r"\b(\d{1,2})[/.-](\d{1,2})[/.-](\d{2,4})\b")
+_MONTH = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?"
+_DAY = r"(\d{1,2})(?:st|nd|rd|th)?"
+DAY_MONTH_RE = re.compile(rf"\b{_DAY}\s+(?:of\s+)?{_MONTH},?(?:\s+(\d{{4}}))?\b", re.IGNORECASE)
+MONTH_DAY_RE = re.compile(rf"\b{_MONTH}\s+{_DAY},?(?:\s+(\d{{4}}))?\b", re.IGNORECASE)
+RELATIVE_DATE_RE = re.compile(r"\b(day after tomorrow|tomorrow|today)\b", re.IGNORECASE)
+WEEKDAY_RE = re.compile(rf"\b(?:(next|this)\s+)?({'|'.join(WEEKDAYS)})\b", re.IGNORECASE)
+TIME_12H_RE = re.compile(r"\b(1[0-2]|0?[1-9])(?:[:.]([0-5]\d))?\s*(a\.?m\.?|p\.?m\.?)(?![a-z])", re.IGNORECASE)
+TIME_24H_RE = re.compile(r"\b([01]?\d|2[0-3]):([0-5]\d)\b")
+TIME_VAGUE_RE = re.compile(r"\b(morning|afternoon|evening|noon)\b", re.IGNORECASE)
+DOCTOR_PREFIX = r"(?:dr\.?|doctor)\s*"
+
+# Words that may surround a value without carrying any appointment detail.
+FILLER_WORDS = {
+    "my", "is", "it", "it's", "its", "at", "on", "the", "a", "an", "please", "pls", "for", "with",
+    "email", "e-mail", "mail", "id", "address", "mobile", "phone", "number", "no", "contact",
+    "date", "time", "slot", "appointment", "department", "dept", "doctor", "dr", "i", "i'd",
+    "want", "would", "like", "to", "see", "book", "need", "prefer", "preferred", "in", "of",
+    "and", "ok", "okay", "sure", "yes", "you", "can", "use", "here", "this", "that", "be",
+    "call", "me", "or", "reach", "send", "thanks", "thank",
+}
+_TOKEN_RE = re.compile(r"[a-z'@.-]+|\d+")
+
+
+@dataclass
+class FieldMatch:
+    value: str
+    confidence: float
+    span: Tuple[int, int]
+
+
+def load_directory(path: str = DIRECTORY_PATH) -> Dict:
+    """Load the department/doctor directory (empty if the file is missing)."""
+    if not os.path.exists(path):
+        print(f"⚠️ Directory file not found: {path}")
+        return {"departments": {}, "doctors": []}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _alternation(words: List[str]) -> str:
+    # Longest first so "general medicine" wins over "general"
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+
+class FastExtractor:
+    """Compiled rule-based extractor for fields that do not need an LLM."""
+
+    def __init__(self, directory: Optional[Dict] = None, dayfirst: bool = DATE_DAYFIRST):
+        directory = directory if directory is not None else load_directory()
+        self.dayfirst = dayfirst
+
+        self.department_lookup: Dict[str, Tuple[str, float]] = {}
+        for department, entry in directory.get("departments", {}).items():
+            self.department_lookup[department.lower()] = (department, 0.95)
+            for alias in entry.get("aliases", []):
+                self.department_lookup.setdefault(alias.lower(), (department, 0.9))
+            for keyword in entry.get("keywords", []):
+                self.department_lookup.setdefault(keyword.lower(), (department, 0.6))
+
+        self.doctor_lookup: Dict[str, str] = {}
+        for doctor in directory.get("doctors", []):
+            surname = re.sub(r"^(dr\.?|doctor)\s*", "", doctor["name"], flags=re.IGNORECASE)
+            for alias in [surname] + doctor.get("aliases", []):
+                self.doctor_lookup[alias.lower()] = doctor["name"]
+
+        self.department_re = (
+            re.compile(rf"\b({_alternation(list(self.department_lookup))})\b", re.IGNORECASE)
+            if self.department_lookup else None
+        )
+        self.doctor_re = (
+            re.compile(rf"(?:\b({DOCTOR_PREFIX}))?\b({_alternation(list(self.doctor_lookup))})\b", re.IGNORECASE)
+            if self.doctor_lookup else None
+        )
+
+    @staticmethod
+    def _make_date(year: int, month: int, day: int) -> Optional[date]:
+        try:
+            return date(year, month, day)
+        except ValueError:
+            return None
+
+    # === Individual fields ===
+    def match_email(self, text: str) -> Optional[FieldMatch]:
+        m = EMAIL_RE.search(text)
+        if m:
+            return FieldMatch(m.group(0), 0.99, m.span())
+        return None
+
+    def match_mobile(self, text: str) -> Optional[FieldMatch]:
+        for m in PHONE_RE.finditer(text):
+            digits = re.sub(r"\D", "", m.group(1))
+            if len(digits) == 10:
+                confidence = 0.95 if digits[0] in "6789" else 0.75
+                return FieldMatch(digits, confidence, m.span())
+        return None
+
+    def match_date(self, text: str, today: Optional[date] = None) -> Optional[FieldMatch]:
+        today = today or date.today()
+
+        m = ISO_DATE_RE.search(text)
+        if m:
+            parsed = self._make_date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+            if parsed:
+                return FieldMatch(parsed.isoformat(), 0.98, m.span())
+
+        m = NUMERIC_DATE_RE.search(text)
+        if m:
+            first, second, year = int(m.group(1)), int(m.group(2)), int(m.group(3))
+            year = year + 2000 if year < 100 else year
+            day, month = (first, second) if self.dayfirst else (second, first)
+            parsed = self._make_date(year, month, day)
+            if parsed is None:
+                # 10/25/2026 can only be month-first
+                parsed = self._make_date(year, day, month)
+            if parsed:
+                ambiguous = first <= 12 and second <= 12 and first != second
+                return FieldMatch(parsed.isoformat(), 0.85 if ambiguous else 0.95, m.span())
+
+        for regex, day_group, month_group in ((DAY_MONTH_RE, 1, 2), (MONTH_DAY_RE, 2, 1)):
+            m = regex.search(text)
+            if m:
+                day = int(m.group(day_group))
+                month = MONTHS[m.group(month_group).lower()[:3]]
+                year = int(m.group(3)) if m.group(3) else today.year
+                parsed = self._make_date(year, month, day)
+                if parsed and not m.group(3) and parsed < today:
+                    parsed = self._make_date(year + 1, month, day)
+                if parsed:
+                    return FieldMatch(parsed.isoformat(), 0.97, m.span())
+
+        m = RELATIVE_DATE_RE.search(text)
+        if m:
+            offset = {"today": 0, "tomorrow": 1, "day after tomorrow": 2}[m.group(1).lower()]
+            return FieldMatch((today + timedelta(days=offset)).isoformat(), 0.9, m.span())
+
+        m = WEEKDAY_RE.search(text)
+        if m:
+            days_ahead = (WEEKDAYS.index(m.group(2).lower()) - today.weekday()) % 7
+            if days_ahead == 0 and (m.group(1) or "").lower() != "this":
+                days_ahead = 7
+            return FieldMatch((today + timedelta(days=days_ahead)).isoformat(), 0.85, m.span())
+        return None
+
+    def match_time(self, text: str) -> Optional[FieldMatch]:
+        m = TIME_12H_RE.search(text)
+        if m:
+            hour, minute = int(m.group(1)), int(m.group(2) or 0)
+            meridiem = "AM" if m.group(3).lower().startswith("a") else "PM"
+            return FieldMatch(f"{hour:02d}:{minute:02d} {meridiem}", 0.95, m.span())
+
+        m = TIME_24H_RE.search(text)
+        if m:
+            parsed = datetime.strptime(f"{m.group(1)}:{m.group(2)}", "%H:%M")
+            return FieldMatch(parsed.strftime("%I:%M %p"), 0.9, m.span())
+
+        m = TIME_VAGUE_RE.search(text)
+        if m:
+            return FieldMatch(m.group(1).lower(), 0.5, m.span())
+        return None
+
+    def match_department(self, text: str) -> Optional[FieldMatch]:
+        if self.department_re is None:
+            return None
+        best = None
+        for m in self.department_re.finditer(text):
+            department, confidence = self.department_lookup[m.group(1).lower()]
+            if best is None or confidence > best.confidence:
+                best = FieldMatch(department, confidence, m.span())
+        return best
+
+    def match_doctor(self, text: str) -> Optional[FieldMatch]:
+        if self.doctor_re is None:
+            return None
+        best = None
+        for m in self.doctor_re.finditer(text):
+            # A bare surname may just as well be the patient's own name
+            confidence = 0.95 if m.group(1) else 0.6
+            if best is None or confidence > best.confidence:
+                best = FieldMatch(self.doctor_lookup[m.group(2).lower()], confidence, m.span())
+        return best
+
+    # === Whole message ===
+    def extract(self, text: str, today: Optional[date] = None) -> Dict[str, FieldMatch]:
+        """Return every field found in text, with confidence scores."""
+        matches = {}
+        email = self.match_email(text)
+        if email:
+            matches["email"] = email
+            # Don't read digits inside the address as a phone number or date
+            text = text[:email.span[0]] + " " * (email.span[1] - email.span[0]) + text[email.span[1]:]
+        candidates = {
+            "mobile": self.match_mobile(text),
+            "date": self.match_date(text, today),
+            "time": self.match_time(text),
+            "department": self.match_department(text),
+            "doctor": self.match_doctor(text),
+        }
+        matches.update({field: m for field, m in candidates.items() if m is not None})
+        return matches
+
+    def confident(self, matches: Dict[str, FieldMatch],
+                  min_confidence: float = FAST_PATH_MIN_CONFIDENCE) -> Dict[str, FieldMatch]:
+        return {field: m for field, m in matches.items() if m.confidence >= min_confidence}
+
+    def fully_resolved(self, text: str, matches: Dict[str, FieldMatch],
+                       min_confidence: float = FAST_PATH_MIN_CONFIDENCE) -> bool:
+        """True when confident matches explain the whole message.
+
+        Anything left over after removing matched spans and filler words
+        (a name, a question, a correction...) still needs the LLM.
+        """
+        confident = self.confident(matches, min_confidence)
+        if not confident:
+            return False
+        chars = list(text.lower())
+        for m in confident.values():
+            start, end = m.span
+            chars[start:end] = " " * (end - start)
+        leftover = [t for t in _TOKEN_RE.findall("".join(chars)) if t.strip(".-'") and t.strip(".-'") not in FILLER_WORDS]
+        return not leftover
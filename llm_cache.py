@@ -0,0 +1,153 @@
+"""Response cache in front of the LLM providers.
+
+At temperature 0 the same prompt gets the same answer, and many prompts
+repeat across patients (first-turn greetings, "which department?",
+extraction of one-word answers). Responses are cached under a hash of
+the requested model, call kind, call parameters and the
+whitespace-normalized messages. The provider is not part of the key: the
+router may fail over, and the answer is stored and looked up under the
+same key whichever provider gave it.
+
+    tier 1: in-process LRU with TTL (LLM_CACHE_MAX_ENTRIES)
+    tier 2: optional SQLite file shared across restarts and workers
+            (LLM_CACHE_DISK_PATH, empty = off)
+
+Only prompt classes listed in LLM_CACHE_CLASSES are cached.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") != "0"
+LLM_CACHE_CLASSES = {c.strip() for c in os.getenv("LLM_CACHE_CLASSES", "reply,fused,extraction").split(",") if c.strip()}
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_DISK_PATH = os.getenv("LLM_CACHE_DISK_PATH", "")
+LLM_CACHE_DISK_MAX_ENTRIES = int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", "100000"))
+# Fraction of disk writes that also prune expired / excess rows
+DISK_PRUNE_PROBABILITY = 0.01
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def cache_key(model: str, kind: str, messages: List[Dict[str, str]], extra: str = "") -> str:
+    """Stable hash of a call; whitespace differences do not change it."""
+    normalized = [(m["role"], _WHITESPACE_RE.sub(" ", m.get("content") or "").strip()) for m in messages]
+    raw = json.dumps([model, kind, extra, normalized], separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class DiskTier:
+    """SQLite key/value table with expiry, in WAL mode."""
+
+    def __init__(self, path: str, max_entries: int = LLM_CACHE_DISK_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_llm_cache_expires_at ON llm_cache (expires_at);
+        """)
+
+    def get(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return row
+
+    def set(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            if random.random() < DISK_PRUNE_PROBABILITY:
+                self.conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),))
+                self.conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache "
+                    "ORDER BY expires_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+                )
+
+    def close(self):
+        self.conn.close()
+
+
+class LLMCache:
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES, ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+                 disk_path: str = LLM_CACHE_DISK_PATH, classes=LLM_CACHE_CLASSES, enabled: bool = LLM_CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.classes = set(classes)
+        self.enabled = enabled
+        self.memory = OrderedDict()  # key -> (value, expires_at)
+        self.disk = DiskTier(disk_path) if enabled and disk_path else None
+        self.counts = defaultdict(lambda: {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+
+    def caches(self, kind: str, temperature: float) -> bool:
+        """Is this call cacheable? Only deterministic calls of opted-in classes."""
+        return self.enabled and temperature == 0 and kind in self.classes
+
+    def _remember(self, key: str, value: str, expires_at: float):
+        self.memory[key] = (value, expires_at)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    async def get(self, kind: str, key: str) -> Optional[str]:
+        entry = self.memory.get(key)
+        if entry is not None:
+            if entry[1] > time.time():
+                self.memory.move_to_end(key)
+                self.counts[kind]["memory_hits"] += 1
+                return entry[0]
+            del self.memory[key]
+        if self.disk is not None:
+            row = await asyncio.to_thread(self.disk.get, key)
+            if row is not None:
+                self._remember(key, row[0], row[1])
+                self.counts[kind]["disk_hits"] += 1
+                return row[0]
+        self.counts[kind]["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, value, expires_at)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.set, key, value, expires_at)
+            except sqlite3.Error as e:
+                print(f"⚠️ LLM cache disk write failed: {e}")
+
+    def stats(self) -> Dict:
+        totals = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        for counts in self.counts.values():
+            for name, value in counts.items():
+                totals[name] += value
+        lookups = sum(totals.values())
+        hits = totals["memory_hits"] + totals["disk_hits"]
+        return {
+            **totals,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self.memory),
+            "classes": {kind: dict(counts) for kind, counts in self.counts.items()},
+        }
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
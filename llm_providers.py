@@ -0,0 +1,387 @@
+import asyncio
+import json
+import os
+import random
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+DEFAULT_GROQ_MODEL = "llama-3.3-70b-versatile"
+DEFAULT_GEMINI_MODEL = "gemini-2.5-flash"
+
+# Per-provider limits. Each provider owns one pooled HTTP client that is shared
+# by every session on this worker, plus a semaphore capping in-flight calls.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+# Prompt token budget per provider (see context_window.py)
+GROQ_CONTEXT_TOKENS = int(os.getenv("GROQ_CONTEXT_TOKENS", "6000"))
+GEMINI_CONTEXT_TOKENS = int(os.getenv("GEMINI_CONTEXT_TOKENS", "32000"))
+
+
+class StreamInterrupted(Exception):
+    """A stream failed after some text was already sent (never retried)."""
+
+
+class LLMProvider:
+    """Base class for async chat-completion providers."""
+
+    name = "base"
+    error_message = "I'm having trouble connecting to the AI service right now."
+    context_token_budget = GROQ_CONTEXT_TOKENS
+    # Model used when a call for another provider's model is routed here
+    default_model = DEFAULT_GROQ_MODEL
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._http_client = None
+        self._client = None
+        # Token usage reported by the API (non-streaming calls)
+        self.usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def record_usage(self, prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+        self.usage["calls"] += 1
+        self.usage["prompt_tokens"] += prompt_tokens or 0
+        self.usage["completion_tokens"] += completion_tokens or 0
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """Pooled keep-alive HTTP client, created on first use."""
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                ),
+                timeout=LLM_TIMEOUT_SECONDS,
+            )
+        return self._http_client
+
+    @property
+    def client(self):
+        """SDK client bound to the pooled HTTP client, created on first use."""
+        if self._client is None:
+            self._client = self._build_client()
+        return self._client
+
+    def _build_client(self):
+        raise NotImplementedError
+
+    def warm_up(self) -> Optional[str]:
+        """Build the SDK client now (importing the SDK) instead of on the first call.
+
+        Returns None, or why the provider can't be used (e.g. a missing API
+        key); the router then fails its calls over to the other provider.
+        """
+        try:
+            self.client
+        except Exception as e:
+            return str(e)
+        return None
+
+    async def _complete(self, messages: List[Dict[str, str]], model: str, temperature: float) -> str:
+        raise NotImplementedError
+
+    async def _complete_json(self, messages: List[Dict[str, str]], model: str, temperature: float, schema: Dict) -> str:
+        raise NotImplementedError
+
+    def _stream(self, messages: List[Dict[str, str]], model: str, temperature: float) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+    def is_rate_limited(self, error: Exception) -> bool:
+        text = str(error)
+        return "429" in text or "rate limit" in text.lower() or "Resource exhausted" in text
+
+    async def call(self, messages: List[Dict[str, str]], model: str, temperature: float = 0,
+                   structured: bool = False, schema: Optional[Dict] = None) -> str:
+        """Raw completion (JSON-constrained if structured) under the
+        concurrency limit. Errors propagate; the router handles them."""
+        async with self._semaphore:
+            if structured:
+                return await self._complete_json(messages, model, temperature, schema)
+            return await self._complete(messages, model, temperature)
+
+    async def open_stream(self, messages: List[Dict[str, str]], model: str, temperature: float = 0) -> AsyncIterator[str]:
+        """Raw streaming counterpart of call(): yields non-empty chunks."""
+        async with self._semaphore:
+            async for chunk in self._stream(messages, model, temperature):
+                if chunk:
+                    yield chunk
+
+    async def complete(self, messages: List[Dict[str, str]], model: str, temperature: float = 0) -> str:
+        """Run one completion under the provider's concurrency limit.
+
+        Rate-limit errors are re-raised so the caller's retry policy can back
+        off; any other error is turned into a friendly fallback reply.
+        """
+        try:
+            return await self.call(messages, model, temperature)
+        except Exception as e:
+            print(f"❌ {self.name} API Error: {e}")
+            if self.is_rate_limited(e):
+                raise
+            return self.error_message
+
+    async def complete_json(self, messages: List[Dict[str, str]], model: str, temperature: float = 0,
+                            schema: Optional[Dict] = None) -> Optional[str]:
+        """Run one completion constrained to JSON output.
+
+        Returns the raw JSON text, or None on a non-rate-limit error so the
+        caller can fall back to the multi-call path.
+        """
+        try:
+            return await self.call(messages, model, temperature, structured=True, schema=schema)
+        except Exception as e:
+            print(f"❌ {self.name} structured output error: {e}")
+            if self.is_rate_limited(e):
+                raise
+            return None
+
+    async def stream(self, messages: List[Dict[str, str]], model: str, temperature: float = 0) -> AsyncIterator[str]:
+        """Yield reply text chunks as the provider generates them.
+
+        Errors before the first chunk behave like complete(): rate limits are
+        raised (so the caller may retry), anything else yields the fallback
+        reply. Errors after the first chunk raise StreamInterrupted, so the
+        caller can end the stream without treating the text as complete.
+        """
+        emitted = False
+        try:
+            async for chunk in self.open_stream(messages, model, temperature):
+                emitted = True
+                yield chunk
+        except Exception as e:
+            print(f"❌ {self.name} streaming error: {e}")
+            if emitted:
+                raise StreamInterrupted(str(e)) from e
+            if self.is_rate_limited(e):
+                raise
+            yield self.error_message
+
+    async def aclose(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+            self._client = None
+
+
+class GroqProvider(LLMProvider):
+    name = "Groq"
+    error_message = "I'm having trouble connecting to Groq (Llama 3) right now."
+
+    def _build_client(self):
+        from groq import AsyncGroq
+
+        # Retries are handled by our own async backoff, not the SDK's.
+        return AsyncGroq(
+            api_key=os.getenv("GROQ_API_KEY"),
+            http_client=self.http_client,
+            max_retries=0,
+        )
+
+    def _record(self, response):
+        if response.usage is not None:
+            self.record_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
+
+    async def _complete(self, messages, model, temperature):
+        response = await self.client.chat.completions.create(
+            messages=messages,
+            model=model,
+            temperature=temperature,
+        )
+        self._record(response)
+        return response.choices[0].message.content
+
+    async def _complete_json(self, messages, model, temperature, schema):
+        # Groq's JSON mode guarantees valid JSON; the shape comes from the prompt
+        response = await self.client.chat.completions.create(
+            messages=messages,
+            model=model,
+            temperature=temperature,
+            response_format={"type": "json_object"},
+        )
+        self._record(response)
+        return response.choices[0].message.content
+
+    async def _stream(self, messages, model, temperature):
+        stream = await self.client.chat.completions.create(
+            messages=messages,
+            model=model,
+            temperature=temperature,
+            stream=True,
+        )
+        async for chunk in stream:
+            if chunk.choices:
+                yield chunk.choices[0].delta.content
+
+
+class GeminiProvider(LLMProvider):
+    name = "Gemini"
+    error_message = "I'm having trouble connecting to Gemini (Google) right now."
+    context_token_budget = GEMINI_CONTEXT_TOKENS
+    default_model = DEFAULT_GEMINI_MODEL
+
+    def _build_client(self):
+        from google import genai
+        from google.genai import types
+
+        return genai.Client(
+            api_key=os.getenv("GEMINI_API_KEY"),
+            http_options=types.HttpOptions(httpx_async_client=self.http_client),
+        )
+
+    @staticmethod
+    def to_contents(messages: List[Dict[str, str]]):
+        """Split OpenAI-style messages into Gemini's system instruction + turns.
+
+        Turns are passed as structured contents instead of one concatenated
+        prompt string, so nothing is re-flattened on every call.
+        """
+        system = [m["content"] for m in messages if m["role"] == "system"]
+        contents = [
+            {"role": "model" if m["role"] == "assistant" else "user", "parts": [{"text": m["content"]}]}
+            for m in messages if m["role"] in ("user", "assistant")
+        ]
+        if not contents:
+            contents = [{"role": "user", "parts": [{"text": "Hello"}]}]
+        return "\n\n".join(system) or None, contents
+
+    def _record(self, response):
+        metadata = response.usage_metadata
+        if metadata is not None:
+            self.record_usage(metadata.prompt_token_count, metadata.candidates_token_count)
+
+    async def _complete(self, messages, model, temperature):
+        from google.genai import types
+
+        # Use specific Gemini Native Audio model if requested, else default fallback
+        target_model = model if "native-audio" in model else DEFAULT_GEMINI_MODEL
+        system, contents = self.to_contents(messages)
+        response = await self.client.aio.models.generate_content(
+            model=target_model,
+            contents=contents,
+            config=types.GenerateContentConfig(temperature=temperature, system_instruction=system),
+        )
+        self._record(response)
+        return response.text
+
+    async def _complete_json(self, messages, model, temperature, schema):
+        from google.genai import types
+
+        target_model = model if "native-audio" in model else DEFAULT_GEMINI_MODEL
+        system, contents = self.to_contents(messages)
+        response = await self.client.aio.models.generate_content(
+            model=target_model,
+            contents=contents,
+            config=types.GenerateContentConfig(
+                temperature=temperature,
+                system_instruction=system,
+                response_mime_type="application/json",
+                response_json_schema=schema,
+            ),
+        )
+        self._record(response)
+        return response.text
+
+    async def _stream(self, messages, model, temperature):
+        from google.genai import types
+
+        target_model = model if "native-audio" in model else DEFAULT_GEMINI_MODEL
+        system, contents = self.to_contents(messages)
+        stream = await self.client.aio.models.generate_content_stream(
+            model=target_model,
+            contents=contents,
+            config=types.GenerateContentConfig(temperature=temperature, system_instruction=system),
+        )
+        async for chunk in stream:
+            yield chunk.text
+
+
+class FakeProvider(LLMProvider):
+    """Local stand-in with injectable latency and errors (tests, load tests).
+
+    Latency is `latency` plus up to `jitter` seconds, or `tail_latency` with
+    probability `tail_rate`. Calls fail with a 429 with probability
+    `rate_limit_rate` and with another error with probability `error_rate`.
+    """
+
+    def __init__(self, name: str = "fake", latency: float = 0.05, jitter: float = 0.02,
+                 tail_rate: float = 0.0, tail_latency: float = 2.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, reply: str = "Sure. What is your full name?",
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, seed: Optional[int] = None):
+        super().__init__(max_concurrency)
+        self.name = name
+        self.error_message = f"I'm having trouble connecting to {name} right now."
+        self.latency = latency
+        self.jitter = jitter
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.reply = reply
+        self.random = random.Random(seed)
+
+    def _build_client(self):
+        return None
+
+    async def _respond(self):
+        roll = self.random.random()
+        if roll < self.rate_limit_rate:
+            # Real APIs reject rate-limited calls quickly
+            await asyncio.sleep(self.latency / 5)
+            raise RuntimeError(f"429 rate limit exceeded ({self.name}, injected)")
+        if roll < self.rate_limit_rate + self.error_rate:
+            await asyncio.sleep(self.latency)
+            raise RuntimeError(f"{self.name} upstream error (injected)")
+        slow = self.random.random() < self.tail_rate
+        await asyncio.sleep(self.tail_latency if slow else self.latency + self.random.random() * self.jitter)
+        self.record_usage(100, 20)
+
+    async def _complete(self, messages, model, temperature):
+        await self._respond()
+        return self.reply
+
+    async def _complete_json(self, messages, model, temperature, schema):
+        await self._respond()
+        return json.dumps({"reply": self.reply, "appointment": {}})
+
+    async def _stream(self, messages, model, temperature):
+        await self._respond()
+        for word in self.reply.split(" "):
+            yield word + " "
+
+
+providers: Dict[str, LLMProvider] = {
+    "groq": GroqProvider(),
+    "gemini": GeminiProvider(),
+}
+
+# e.g. LLM_FAKE_PROVIDERS='{"groq": {"latency": 0.3, "rate_limit_rate": 0.2}, "gemini": {}}'
+LLM_FAKE_PROVIDERS = os.getenv("LLM_FAKE_PROVIDERS", "")
+if LLM_FAKE_PROVIDERS:
+    for _name, _options in json.loads(LLM_FAKE_PROVIDERS).items():
+        providers[_name] = FakeProvider(name=_name, **_options)
+
+
+def get_provider(model: str) -> LLMProvider:
+    """Pick a provider from the model name ('gemini*' -> Gemini, else Groq)."""
+    if "gemini" in model.lower():
+        return providers["gemini"]
+    return providers["groq"]
+
+
+async def warm_up_providers() -> Dict[str, str]:
+    """Build every provider's client off the event loop; name -> "ok" or the error."""
+    errors = await asyncio.gather(*(asyncio.to_thread(provider.warm_up) for provider in providers.values()))
+    status = {}
+    for name, error in zip(providers, errors):
+        if error:
+            print(f"⚠️ LLM provider {name} unavailable: {error}")
+        status[name] = error or "ok"
+    return status
+
+
+async def close_providers():
+    """Release pooled connections (called from the app lifespan)."""
+    await asyncio.gather(*(provider.aclose() for provider in providers.values()))
@@ -0,0 +1,301 @@
+"""Routing of LLM calls across providers.
+
+Every provider gets a rolling window of latencies and outcomes plus a
+circuit breaker. A call goes to the preferred provider for its model unless
+that provider's breaker is open (or it is much slower than the alternative);
+errors fail over to the next provider immediately instead of sleeping and
+retrying the same one. Non-streaming calls are hedged: if the primary has
+not answered by its rolling p95 latency, the same request is sent to the
+next provider and whichever answers first wins.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional
+
+from llm_providers import LLMProvider, StreamInterrupted, get_provider, providers
+
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", "100"))
+# Rolling percentiles are trusted once a provider has this many samples
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "20"))
+ROUTER_TIMEOUT_SECONDS = float(os.getenv("ROUTER_TIMEOUT_SECONDS", "20"))
+ROUTER_HEDGING = os.getenv("ROUTER_HEDGING", "1") != "0"
+ROUTER_HEDGE_MIN_DELAY = float(os.getenv("ROUTER_HEDGE_MIN_DELAY", "0.25"))
+# Hedge delay before a provider has enough samples for a p95
+ROUTER_HEDGE_DEFAULT_DELAY = float(os.getenv("ROUTER_HEDGE_DEFAULT_DELAY", "3"))
+# Prefer the other provider when the preferred one's p50 is this many times slower
+ROUTER_SLOW_FACTOR = float(os.getenv("ROUTER_SLOW_FACTOR", "3"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("BREAKER_COOLDOWN_SECONDS", "30"))
+
+
+class AllProvidersFailed(Exception):
+    pass
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class CircuitBreaker:
+    """closed -> open after BREAKER_FAILURES consecutive failures; after the
+    cooldown one trial call is let through (half-open) and its outcome
+    closes or re-opens the breaker."""
+
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN_SECONDS):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.opens = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allows(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self.trial_running)
+
+    def before_call(self):
+        if self.state == "half-open":
+            self.trial_running = True
+
+    def record(self, ok: bool):
+        self.trial_running = False
+        if ok:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            return
+        self.consecutive_failures += 1
+        if self.opened_at is not None or self.consecutive_failures >= self.failures:
+            if self.opened_at is None or self.state == "half-open":
+                self.opens += 1
+            self.opened_at = time.monotonic()
+
+
+class ProviderHealth:
+    """Rolling latency / error window and circuit breaker for one provider."""
+
+    def __init__(self, window: int = ROUTER_WINDOW):
+        # Full-call latencies (they set the hedge delay); streams keep their
+        # time to first token apart, it is not comparable
+        self.latencies = deque(maxlen=window)
+        self.first_token_latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.breaker = CircuitBreaker()
+        self.rate_limits = 0
+        self.timeouts = 0
+
+    def record(self, ok: bool, latency: Optional[float] = None):
+        self.outcomes.append(ok)
+        if ok and latency is not None:
+            self.latencies.append(latency)
+        self.breaker.record(ok)
+
+    def p(self, fraction: float) -> Optional[float]:
+        if len(self.latencies) < ROUTER_MIN_SAMPLES:
+            return None
+        return percentile(list(self.latencies), fraction)
+
+    def hedge_delay(self) -> float:
+        p95 = self.p(0.95)
+        return ROUTER_HEDGE_DEFAULT_DELAY if p95 is None else max(ROUTER_HEDGE_MIN_DELAY, p95)
+
+    def stats(self) -> Dict:
+        errors = self.outcomes.count(False)
+        return {
+            "breaker": self.breaker.state,
+            "breaker_opens": self.breaker.opens,
+            "error_rate": round(errors / len(self.outcomes), 3) if self.outcomes else 0.0,
+            "p50_ms": None if self.p(0.5) is None else round(self.p(0.5) * 1000),
+            "p95_ms": None if self.p(0.95) is None else round(self.p(0.95) * 1000),
+            "stream_ttft_p50_ms": (None if not self.first_token_latencies
+                                   else round(percentile(list(self.first_token_latencies), 0.5) * 1000)),
+            "rate_limits": self.rate_limits,
+            "timeouts": self.timeouts,
+        }
+
+
+class ProviderRouter:
+    def __init__(self, provider_map: Dict[str, LLMProvider] = providers, hedging: bool = ROUTER_HEDGING,
+                 timeout: float = ROUTER_TIMEOUT_SECONDS):
+        self.providers = provider_map
+        self.hedging = hedging
+        self.timeout = timeout
+        self.health = {name: ProviderHealth() for name in provider_map}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    # === Provider choice ===
+    def preferred(self, model: str) -> str:
+        provider = get_provider(model)
+        for name, candidate in self.providers.items():
+            if candidate is provider:
+                return name
+        return next(iter(self.providers))
+
+    def order(self, model: str) -> List[str]:
+        """Providers to try, best first: breakers closed, then preference/latency."""
+        first = self.preferred(model)
+        names = [first] + [name for name in self.providers if name != first]
+        available = [name for name in names if self.health[name].breaker.allows()]
+        if len(available) > 1:
+            p50 = {name: self.health[name].p(0.5) for name in available}
+            best = min((name for name in available if p50[name] is not None), key=p50.get, default=None)
+            if (best is not None and best != available[0] and p50[available[0]] is not None
+                    and p50[available[0]] > ROUTER_SLOW_FACTOR * p50[best]):
+                available.remove(best)
+                available.insert(0, best)
+        # Every breaker open: still try the preferred provider rather than fail outright
+        return available or [first]
+
+    def model_for(self, name: str, model: str) -> str:
+        provider = self.providers[name]
+        return model if get_provider(model) is provider else provider.default_model
+
+    def _record_error(self, name: str, error: Exception):
+        health = self.health[name]
+        if isinstance(error, asyncio.TimeoutError):
+            health.timeouts += 1
+        elif self.providers[name].is_rate_limited(error):
+            health.rate_limits += 1
+        health.record(False)
+
+    # === Calls ===
+    async def _attempt(self, name, messages, model, temperature, structured, schema):
+        provider = self.providers[name]
+        health = self.health[name]
+        health.breaker.before_call()
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(
+                provider.call(messages, self.model_for(name, model), temperature, structured, schema),
+                self.timeout,
+            )
+        except asyncio.CancelledError:
+            # Lost a hedge race: no verdict on this provider
+            health.breaker.trial_running = False
+            raise
+        except Exception as e:
+            print(f"❌ {provider.name} API Error: {e}")
+            self._record_error(name, e)
+            raise
+        health.record(True, time.monotonic() - start)
+        return result
+
+    async def call(self, messages, model, temperature=0, structured=False, schema=None) -> str:
+        """First successful answer from the ordered providers (hedged)."""
+        names = self.order(model)
+        pending = {}
+        errors = []
+        launched = 0
+
+        def launch():
+            nonlocal launched
+            name = names[launched]
+            launched += 1
+            task = asyncio.create_task(self._attempt(name, messages, model, temperature, structured, schema))
+            pending[task] = name
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if self.hedging and launched < len(names) and len(pending) == 1:
+                    timeout = self.health[names[launched - 1]].hedge_delay()
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Primary is past its p95: race the next provider
+                    self.hedges += 1
+                    launch()
+                    continue
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        if names[0] in pending.values():
+                            self.hedge_wins += 1  # the hedge beat a still-running primary
+                        return task.result()
+                    errors.append(f"{name}: {task.exception()}")
+                if not pending and launched < len(names):
+                    self.failovers += 1
+                    launch()
+            raise AllProvidersFailed("; ".join(errors))
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def complete(self, messages, model, temperature=0) -> str:
+        """Text completion; the preferred provider's fallback reply if all fail."""
+        try:
+            return await self.call(messages, model, temperature)
+        except AllProvidersFailed:
+            return get_provider(model).error_message
+
+    async def complete_json(self, messages, model, temperature=0, schema=None) -> Optional[str]:
+        """JSON completion; None if every provider failed."""
+        try:
+            return await self.call(messages, model, temperature, structured=True, schema=schema)
+        except AllProvidersFailed:
+            return None
+
+    async def stream(self, messages, model, temperature=0) -> AsyncIterator[str]:
+        """Stream from the first provider that produces a chunk.
+
+        Failures before the first chunk (including no chunk within the
+        timeout) fail over; later failures raise StreamInterrupted. Streams
+        are not hedged: two providers would both be billed for the reply.
+        """
+        for name in self.order(model):
+            provider = self.providers[name]
+            health = self.health[name]
+            health.breaker.before_call()
+            start = time.monotonic()
+            stream = provider.open_stream(messages, self.model_for(name, model), temperature)
+            try:
+                first = await asyncio.wait_for(stream.__anext__(), self.timeout)
+            except StopAsyncIteration:
+                health.record(True)
+                return
+            except asyncio.CancelledError:
+                # The client went away before the first chunk: no verdict
+                health.breaker.trial_running = False
+                raise
+            except Exception as e:
+                print(f"❌ {provider.name} streaming error: {e}")
+                self._record_error(name, e)
+                await stream.aclose()
+                self.failovers += 1
+                continue
+            # Time to first token is the latency that matters for streams
+            health.record(True)
+            health.first_token_latencies.append(time.monotonic() - start)
+            try:
+                yield first
+                async for chunk in stream:
+                    yield chunk
+            except Exception as e:
+                print(f"❌ {provider.name} streaming error: {e}")
+                raise StreamInterrupted(str(e)) from e
+            finally:
+                await stream.aclose()
+            return
+        yield get_provider(model).error_message
+
+    def stats(self) -> Dict:
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "providers": {name: health.stats() for name, health in self.health.items()},
+        }
@@ -0,0 +1,317 @@
+"""Request tracing and Prometheus metrics (no client library needed).
+
+Each HTTP request (or WebSocket turn) runs inside a Trace carrying a request
+ID and, once known, the session ID. Code marks pipeline stages with
+
+    with span("llm.reply"):
+        ...
+
+which times the stage into the chat_stage_seconds histogram and appends it
+to the trace. Counters and histograms can also be updated directly; values
+owned by other components (cache hits, router failovers, live sessions) are
+read at scrape time through registered collectors. GET /metrics renders the
+lot in the Prometheus text format.
+
+A sample of finished traces (TRACE_SAMPLE_RATE) can be appended as JSON
+lines to TRACE_EXPORT_PATH.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "traces.jsonl")
+METRICS_PREFIX = "chatbot_"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 6, 8)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = METRICS_PREFIX + name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self.values.items())
+        return self.header() + [f"{self.name}{_labels(self.label_names, key)} {value}" for key, value in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self.values: Dict[LabelValues, list] = {}  # key -> [bucket counts..., count, sum]
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            data = self.values.get(key)
+            if data is None:
+                data = self.values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += 1
+            data[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(data)) for key, data in self.values.items()]
+        lines = self.header()
+        for key, data in items:
+            bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, data[:-1]):
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {count}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {data[-2]}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {round(data[-1], 6)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self.collectors: List[Callable[[], Iterable[Tuple]]] = []
+
+    def add(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, fn: Callable[[], Iterable[Tuple]]):
+        """Register fn() yielding (name, kind, help, {labels}, value) at scrape time."""
+        self.collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        seen = set()
+        for fn in self.collectors:
+            try:
+                samples = list(fn())
+            except Exception as e:
+                print(f"⚠️ Metrics collector {fn.__name__} failed: {e}")
+                continue
+            for name, kind, help, labels, value in samples:
+                if value is None:
+                    continue
+                full_name = METRICS_PREFIX + name
+                if full_name not in seen:
+                    seen.add(full_name)
+                    lines += [f"# HELP {full_name} {help}", f"# TYPE {full_name} {kind}"]
+                lines.append(f"{full_name}{_labels(labels.keys(), labels.values())} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.add(Histogram(
+    "http_request_seconds", "HTTP request latency (streams: until the last byte)", ["method", "path", "status"]))
+stage_seconds = registry.add(Histogram(
+    "chat_stage_seconds", "Latency of one chat pipeline stage", ["stage"]))
+stage_errors = registry.add(Counter(
+    "chat_stage_errors_total", "Chat pipeline stages that raised", ["stage"]))
+llm_calls_per_turn = registry.add(Histogram(
+    "chat_llm_calls_per_turn", "LLM calls (incl. cache hits) made by one chat turn", buckets=COUNT_BUCKETS))
+chat_turns = registry.add(Counter(
+    "chat_turns_total", "Chat turns handled", ["transport"]))
+events = registry.add(Counter(
+    "events_total", "Notable pipeline events (bookings, slot conflicts, failed saves)", ["event"]))
+
+
+class Trace:
+    def __init__(self, request_id: Optional[str] = None, name: str = ""):
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.name = name
+        self.session_id = None
+        self.start = time.perf_counter()
+        self.started_at = time.time()
+        self.spans = []
+        self.llm_calls = 0
+        self.is_turn = False
+
+    def to_dict(self) -> Dict:
+        return {
+            "request_id": self.request_id,
+            "name": self.name,
+            "session_id": self.session_id,
+            "started_at": self.started_at,
+            "duration_ms": round((time.perf_counter() - self.start) * 1000, 2),
+            "llm_calls": self.llm_calls,
+            "spans": self.spans,
+        }
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+_export_lock = threading.Lock()
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def set_session(session_id: str):
+    """Tag the current trace with its session and count it as a chat turn."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.session_id = session_id
+        trace.is_turn = True
+
+
+def count_llm_call():
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.llm_calls += 1
+
+
+def _record_span(stage: str, start: float, error: Optional[str] = None, attrs: Optional[Dict] = None):
+    duration = time.perf_counter() - start
+    stage_seconds.observe(duration, stage=stage)
+    if error is not None:
+        stage_errors.inc(stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        record = {"stage": stage, "offset_ms": round((start - trace.start) * 1000, 2),
+                  "duration_ms": round(duration * 1000, 2), **(attrs or {})}
+        if error is not None:
+            record["error"] = error
+        trace.spans.append(record)
+
+
+def observe_stage(stage: str, start: float):
+    """Record a stage that began at start (perf_counter) and ends now."""
+    _record_span(stage, start)
+
+
+@contextmanager
+def span(stage: str, **attrs):
+    """Time one pipeline stage (sync or async code).
+
+    Yields the span's attribute dict so the body can add details
+    (e.g. attrs["cache"] = "hit") that end up in the exported trace.
+    """
+    start = time.perf_counter()
+    error = None
+    try:
+        yield attrs
+    except (GeneratorExit, asyncio.CancelledError):
+        raise
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _record_span(stage, start, error, attrs)
+
+
+def export_trace(trace: Trace, path: str = TRACE_EXPORT_PATH):
+    line = json.dumps(trace.to_dict(), separators=(",", ":"), ensure_ascii=False)
+    with _export_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+@contextmanager
+def trace(name: str = "", request_id: Optional[str] = None, transport: str = "http"):
+    """Run a request or WebSocket turn inside a fresh Trace."""
+    current = Trace(request_id, name)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+        if current.is_turn:
+            chat_turns.inc(transport=transport)
+            llm_calls_per_turn.observe(current.llm_calls)
+        if TRACE_SAMPLE_RATE and current.spans and random.random() < TRACE_SAMPLE_RATE:
+            try:
+                export_trace(current)
+            except OSError as e:
+                print(f"⚠️ Trace export failed: {e}")
+
+
+class MetricsMiddleware:
+    """Trace every HTTP request and time it until its last byte is sent."""
+
+    def __init__(self, app, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or None
+        status = {"code": 500}
+        finished = {}
+
+        with trace(f"{scope['method']} {scope['path']}", request_id) as current:
+            async def send_with_id(message):
+                if message["type"] == "http.response.start":
+                    status["code"] = message["status"]
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"x-request-id", current.request_id.encode("latin-1"))
+                    ]
+                elif message["type"] == "http.response.body" and not message.get("more_body"):
+                    finished["at"] = time.perf_counter()
+                await send(message)
+
+            start = time.perf_counter()
+            try:
+                await self.app(scope, receive, send_with_id)
+            finally:
+                # Background tasks run after the last byte; they are not request latency
+                end = finished.get("at") or time.perf_counter()
+                # Label by route template, not raw path, to keep cardinality bounded
+                route = scope.get("route")
+                path = getattr(route, "path", None) or ("/static" if scope["path"].startswith("/static") else "other")
+                http_request_seconds.observe(
+                    end - start, method=scope["method"], path=path, status=status["code"]
+                )
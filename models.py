@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index, UniqueConstraint, func
 from database import Base
 from datetime import datetime
 
@@ -12,5 +12,69 @@ class Appointment(Base):
     doctor = Column(String)
     date = Column(String)
     time = Column(String)
-    email = Column(String)
-    mobile = Column(String)
+    email = Column(String, index=True)
+    mobile = Column(String, index=True)
+
+    __table_args__ = (
+        # Slot lookups: bookings for one doctor on one day
+        Index("ix_appointments_doctor_date", "doctor", "date"),
+        # Query / export API filters (appointment_query.py)
+        Index("ix_appointments_department_date", "department", "date"),
+        Index("ix_appointments_date", "date"),
+        # Case-insensitive email lookups (bulk_import.existing_appointments)
+        Index("ix_appointments_email_normalized", func.lower(func.trim(email))),
+    )
+
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    appointment_id = Column(Integer, index=True)
+    to_email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    # pending -> sending -> sent, or back to pending (retry) / failed
+    status = Column(String, default="pending", nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    claimed_by = Column(String)
+    claimed_at = Column(DateTime)
+    last_error = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+
+class BookingLedger(Base):
+    """One row per confirmed booking, keyed by its idempotency key."""
+    __tablename__ = "booking_ledger"
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String, unique=True, nullable=False)
+    appointment_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class BookedSlot(Base):
+    """One row per booked slot (availability.Slot: doctor key, ISO date, minute).
+
+    The unique constraint is what keeps two workers from booking the same
+    doctor/date/time; each worker's SlotIndex only answers the common case
+    without a round-trip.
+    """
+    __tablename__ = "booked_slots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    doctor = Column(String, nullable=False)
+    date = Column(String, nullable=False)
+    minute = Column(Integer, nullable=False)
+    appointment_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("doctor", "date", "minute", name="uq_booked_slots_slot"),
+    )
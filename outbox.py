@@ -0,0 +1,275 @@
+import os
+import smtplib
+import threading
+import uuid
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from sqlalchemy import select, update
+
+import models
+from database import SessionLocal
+from metrics import span
+
+# ✅ SMTP settings (default: Gmail with the credentials from .env)
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") != "0"
+FROM_EMAIL = os.getenv("GMAIL_ADDRESS")
+SMTP_USERNAME = os.getenv("SMTP_USERNAME", FROM_EMAIL)
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", os.getenv("GMAIL_APP_PASSWORD"))
+
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "5"))
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", "900"))
+# Rows stuck in "sending" this long (crashed worker) are picked up again
+OUTBOX_CLAIM_TIMEOUT = float(os.getenv("OUTBOX_CLAIM_TIMEOUT", "300"))
+# A worker whose claim / delivery fails (database down) retries after
+# poll_interval, doubling up to this
+OUTBOX_ERROR_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_ERROR_BACKOFF_MAX_SECONDS", "60"))
+# Close an authenticated connection after this long without traffic
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "60"))
+
+
+def build_message(to_email, subject, body, from_email=FROM_EMAIL):
+    msg = MIMEMultipart()
+    msg["From"] = from_email
+    msg["To"] = to_email
+    msg["Subject"] = subject
+    msg.attach(MIMEText(body, "plain"))
+    return msg
+
+
+def email_row(to_email, subject, body, appointment_id=None):
+    """Outbox row for one email; add it in the transaction that makes the email due."""
+    return models.EmailOutbox(appointment_id=appointment_id, to_email=to_email, subject=subject, body=body)
+
+
+def delivery_status(appointment_id):
+    """Outbox rows for one appointment, oldest first."""
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(models.EmailOutbox)
+            .where(models.EmailOutbox.appointment_id == appointment_id)
+            .order_by(models.EmailOutbox.id)
+        ).scalars().all()
+        return [
+            {
+                "id": row.id,
+                "to_email": row.to_email,
+                "status": row.status,
+                "attempts": row.attempts,
+                "last_error": row.last_error,
+                "sent_at": row.sent_at.isoformat() if row.sent_at else None,
+            }
+            for row in rows
+        ]
+    finally:
+        db.close()
+
+
+def retry_delay(attempts):
+    return min(OUTBOX_RETRY_MAX_SECONDS, OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+
+
+class SMTPConnection:
+    """One authenticated SMTP connection, reused across messages."""
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, starttls=SMTP_STARTTLS,
+                 username=SMTP_USERNAME, password=SMTP_PASSWORD, from_email=FROM_EMAIL):
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.username = username
+        self.password = password
+        self.from_email = from_email
+        self.server = None
+        self.last_used = None
+        self.connects = 0
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.starttls:
+            server.starttls()
+        if self.username and self.password:
+            server.login(self.username, self.password)
+        self.server = server
+        self.connects += 1
+
+    def send(self, to_email, subject, body):
+        if self.server is not None and datetime.utcnow() - self.last_used > timedelta(seconds=SMTP_IDLE_TIMEOUT):
+            self.close()
+        if self.server is None:
+            self._connect()
+        msg = build_message(to_email, subject, body, self.from_email)
+        try:
+            self.server.sendmail(self.from_email, to_email, msg.as_string())
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped our idle connection: reconnect once
+            self.server = None
+            self._connect()
+            self.server.sendmail(self.from_email, to_email, msg.as_string())
+        self.last_used = datetime.utcnow()
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+
+class Outbox:
+    """Pool of worker threads delivering queued emails.
+
+    Each worker claims a batch of due rows (status pending, next_attempt_at
+    reached), sends them over its own persistent SMTP connection and records
+    the outcome per row. Failed sends are retried with exponential backoff
+    until OUTBOX_MAX_ATTEMPTS, then marked failed.
+    """
+
+    def __init__(self, workers=OUTBOX_WORKERS, batch_size=OUTBOX_BATCH_SIZE,
+                 poll_interval=OUTBOX_POLL_INTERVAL, connection_factory=SMTPConnection):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.connection_factory = connection_factory
+        self.sent = 0
+        self.failed = 0
+        self._threads = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def start(self):
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"outbox-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def notify(self):
+        """Wake idle workers right away (after committing outbox rows)."""
+        self._wake.set()
+
+    def claim(self, worker_id):
+        """Atomically mark a batch of due rows as ours; returns them."""
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=OUTBOX_CLAIM_TIMEOUT)
+        claim_token = f"{worker_id}-{uuid.uuid4().hex[:8]}"
+        db = SessionLocal()
+        try:
+            due = (
+                select(models.EmailOutbox.id)
+                .where(
+                    ((models.EmailOutbox.status == "pending") & (models.EmailOutbox.next_attempt_at <= now))
+                    | ((models.EmailOutbox.status == "sending") & (models.EmailOutbox.claimed_at < stale))
+                )
+                .order_by(models.EmailOutbox.id)
+                .limit(self.batch_size)
+            )
+            ids = db.execute(due).scalars().all()
+            if not ids:
+                return []
+            # The status guard makes the claim safe against other workers
+            db.execute(
+                update(models.EmailOutbox)
+                .where(models.EmailOutbox.id.in_(ids))
+                .where(
+                    (models.EmailOutbox.status == "pending")
+                    | ((models.EmailOutbox.status == "sending") & (models.EmailOutbox.claimed_at < stale))
+                )
+                .values(status="sending", claimed_by=claim_token, claimed_at=now)
+            )
+            db.commit()
+            rows = db.execute(
+                select(models.EmailOutbox)
+                .where(models.EmailOutbox.claimed_by == claim_token)
+            ).scalars().all()
+            db.expunge_all()
+            return rows
+        finally:
+            db.close()
+
+    def deliver(self, rows, connection):
+        """Send a claimed batch and record each outcome in one transaction.
+
+        An outcome is only recorded while the row is still claimed by us: a
+        batch that outlived OUTBOX_CLAIM_TIMEOUT may have been taken over.
+        """
+        results = []
+        for row in rows:
+            try:
+                with span("email.send"):
+                    connection.send(row.to_email, row.subject, row.body)
+                results.append((row, None))
+            except Exception as e:
+                print(f"❌ [Outbox] Email to {row.to_email} failed: {e}")
+                connection.close()
+                results.append((row, str(e)[:500]))
+
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            for row, error in results:
+                values = {"attempts": row.attempts + 1, "claimed_by": None, "claimed_at": None}
+                if error is None:
+                    values.update(status="sent", sent_at=now, last_error=None)
+                elif row.attempts + 1 >= OUTBOX_MAX_ATTEMPTS:
+                    values.update(status="failed", last_error=error)
+                else:
+                    values.update(
+                        status="pending",
+                        last_error=error,
+                        next_attempt_at=now + timedelta(seconds=retry_delay(row.attempts + 1)),
+                    )
+                result = db.execute(
+                    update(models.EmailOutbox)
+                    .where(models.EmailOutbox.id == row.id, models.EmailOutbox.claimed_by == row.claimed_by)
+                    .values(**values)
+                )
+                if not result.rowcount:
+                    print(f"⚠️ [Outbox] Email {row.id} was re-claimed mid-batch; outcome not recorded")
+                elif values["status"] == "sent":
+                    self.sent += 1
+                elif values["status"] == "failed":
+                    self.failed += 1
+            db.commit()
+        finally:
+            db.close()
+
+    def _run(self):
+        worker_id = f"{os.getpid()}-{threading.current_thread().name}"
+        connection = self.connection_factory()
+        errors = 0
+        try:
+            while not self._stop.is_set():
+                try:
+                    rows = self.claim(worker_id)
+                    if rows:
+                        self.deliver(rows, connection)
+                    errors = 0
+                except Exception as e:
+                    # Unrecorded rows stay claimed and are retried once stale
+                    errors += 1
+                    print(f"❌ [Outbox] Worker error: {e}")
+                    self._stop.wait(min(OUTBOX_ERROR_BACKOFF_MAX_SECONDS, self.poll_interval * 2 ** errors))
+                    continue
+                if rows:
+                    continue
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+        finally:
+            connection.close()
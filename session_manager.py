@@ -1,38 +1,603 @@
+import asyncio
+import json
+import os
+import sqlite3
 import time
-from typing import Dict, List, Any
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "10000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+
+# Cross-worker session locks are leases: a crashed worker's lock is taken
+# over once it expires. The holder renews it every third of the TTL, so only
+# a dead (or stalled) worker loses it.
+SESSION_LOCK_TTL = float(os.getenv("SESSION_LOCK_TTL", "60"))
+SESSION_LOCK_POLL = 0.02
+
+# Rough per-message / per-session overhead of the Python objects, in bytes.
+MESSAGE_OVERHEAD = 200
+SESSION_OVERHEAD = 1000
+
+# Payloads larger than this are zlib-compressed before hitting the backend.
+COMPRESS_MIN_BYTES = 512
+
+# Idle rate-limit buckets are dropped after this long (they would be full anyway)
+RATE_BUCKET_TTL = float(os.getenv("RATE_BUCKET_TTL", "3600"))
+
+
+def new_session() -> Dict[str, Any]:
+    return {
+        "context": [],
+        # Rolling summary of turns folded out of context (context_window.py)
+        "summary": "",
+        "data": {},
+        "confidence": {},
+        # Turn number, echoed to clients by the v2 /chat protocol
+        "seq": 0,
+        # collecting -> confirmed (booking.py)
+        "booking": {"state": "collecting"},
+        "last_accessed": time.time()
+    }
+
+
+def buckets_take(states, limits, now: float):
+    """Token bucket step over several buckets: refill each, then take one token from all or none.
+
+    states: (tokens, updated) per bucket, None for a new (full) one; limits:
+    (rate, capacity) per bucket. Returns (new token counts, index of the
+    first empty bucket or None, retry_after); retry_after is 0 if the tokens
+    were taken, else the seconds until that bucket has one.
+    """
+    tokens = [capacity if state is None else min(capacity, state[0] + (now - state[1]) * rate)
+              for state, (rate, capacity) in zip(states, limits)]
+    for index, (rate, _) in enumerate(limits):
+        if tokens[index] < 1:
+            return tokens, index, (1 - tokens[index]) / rate
+    return [count - 1 for count in tokens], None, 0.0
+
+
+def estimate_session_size(session: Dict[str, Any]) -> int:
+    """Approximate memory footprint of a session."""
+    size = SESSION_OVERHEAD + len(session.get("summary", ""))
+    for message in session["context"]:
+        size += MESSAGE_OVERHEAD + len(message.get("content") or "")
+    for key, value in session["data"].items():
+        size += len(key) + len(str(value))
+    return size
+
+
+class SessionCodec:
+    """Compact serialization for shared backends.
+
+    Every context starts with the same system prompt, so a leading run of
+    messages equal to shared_prefix is stored as a count instead of text.
+    """
+
+    def __init__(self, shared_prefix: Optional[List[Dict[str, str]]] = None):
+        self.shared_prefix = shared_prefix or []
+
+    def encode(self, session: Dict[str, Any]) -> bytes:
+        context = session["context"]
+        prefix = 0
+        while (prefix < len(self.shared_prefix) and prefix < len(context)
+               and context[prefix] == self.shared_prefix[prefix]):
+            prefix += 1
+        payload = dict(session, context=context[prefix:], prefix=prefix)
+        raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        if len(raw) >= COMPRESS_MIN_BYTES:
+            return b"z" + zlib.compress(raw)
+        return b"j" + raw
+
+    def decode(self, blob: bytes) -> Dict[str, Any]:
+        raw = zlib.decompress(blob[1:]) if blob[:1] == b"z" else blob[1:]
+        payload = json.loads(raw)
+        prefix = payload.pop("prefix", 0)
+        payload["context"] = [dict(m) for m in self.shared_prefix[:prefix]] + payload["context"]
+        return payload
+
+
+class SessionBackend:
+    """Storage behind SessionManager.
+
+    load() returns None for unknown or expired sessions. Backends that hand
+    out copies (everything except memory) need save() after each change.
+    Everything that does I/O is a coroutine, so a slow or locked store never
+    blocks the event loop; stats() only reports counters kept in memory.
+    """
+
+    # True if load() returns the stored object itself rather than a copy
+    in_process = False
+
+    async def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def save(self, session_id: str, session: Dict[str, Any]):
+        raise NotImplementedError
+
+    async def delete(self, session_id: str):
+        raise NotImplementedError
+
+    async def sweep(self) -> int:
+        """Drop expired sessions; returns how many were removed."""
+        return 0
+
+    async def acquire_lock(self, session_id: str, token: str) -> bool:
+        """Try to take the cross-worker lease for a session."""
+        return True
+
+    async def renew_lock(self, session_id: str, token: str) -> bool:
+        """Extend a lease we hold; False if it expired and was taken over."""
+        return True
+
+    async def release_lock(self, session_id: str, token: str):
+        pass
+
+    async def take_tokens(self, buckets: List[Tuple[str, float, float]]) -> Tuple[Optional[int], float]:
+        """Take one token from each (key, rate, capacity) rate-limit bucket, all or none.
+
+        Returns (None, 0) if taken, else (index of the first empty bucket,
+        seconds until it has a token).
+        """
+        return None, 0.0
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+    async def close(self):
+        pass
+
+
+class MemoryBackend(SessionBackend):
+    """Bounded in-process store (single worker only).
+
+    Sessions are kept in an OrderedDict in last-access order, so it doubles as
+    the LRU list and the expiry index (every session has the same TTL): both
+    eviction and expiry pop from the front in amortized O(1).
+    """
+
+    in_process = True
+
+    def __init__(self, ttl_seconds: int = SESSION_TTL_SECONDS, max_sessions: int = SESSION_MAX_COUNT,
+                 max_bytes: int = SESSION_MAX_BYTES):
+        self.sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._sizes: Dict[str, int] = {}
+        self.total_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.buckets: Dict[str, tuple] = {}  # key -> (tokens, updated)
+
+    def _remove(self, session_id: str):
+        del self.sessions[session_id]
+        self.total_bytes -= self._sizes.pop(session_id, 0)
+
+    async def load(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is not None and time.time() - session["last_accessed"] > self.ttl_seconds:
+            self._remove(session_id)
+            self.expirations += 1
+            return None
+        return session
+
+    async def save(self, session_id, session):
+        # Sessions are mutated in place by the caller, so sizes are refreshed
+        # whenever a session is saved again.
+        self.sessions[session_id] = session
+        self.sessions.move_to_end(session_id)
+        size = estimate_session_size(session)
+        self.total_bytes += size - self._sizes.get(session_id, 0)
+        self._sizes[session_id] = size
+
+        while self.sessions and (len(self.sessions) > self.max_sessions or self.total_bytes > self.max_bytes):
+            oldest = next(iter(self.sessions))
+            if oldest == session_id:
+                break
+            self._remove(oldest)
+            self.evictions += 1
+
+    async def delete(self, session_id):
+        if session_id in self.sessions:
+            self._remove(session_id)
+
+    async def sweep(self, max_age_seconds: Optional[int] = None):
+        max_age = self.ttl_seconds if max_age_seconds is None else max_age_seconds
+        cutoff = time.time() - max_age
+        removed = 0
+        # Oldest first: stop at the first session that is still live
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if session["last_accessed"] >= cutoff:
+                break
+            self._remove(session_id)
+            removed += 1
+        self.expirations += removed
+        bucket_cutoff = time.time() - RATE_BUCKET_TTL
+        self.buckets = {key: bucket for key, bucket in self.buckets.items() if bucket[1] >= bucket_cutoff}
+        return removed
+
+    async def take_tokens(self, buckets):
+        now = time.time()
+        states = [self.buckets.get(key) for key, _, _ in buckets]
+        tokens, empty, retry_after = buckets_take(states, [limit for _, *limit in buckets], now)
+        for (key, _, _), count in zip(buckets, tokens):
+            self.buckets[key] = (count, now)
+        return empty, retry_after
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "bytes": self.total_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SQLiteBackend(SessionBackend):
+    """Sessions in a local SQLite database in WAL mode.
+
+    Shared by every worker process on the host; expiry uses an index on
+    last_accessed so sweeps never scan live sessions. The connection is only
+    used from one thread of its own: calls queue there, so the event loop
+    never waits on the database (or its busy timeout) and one call's
+    transaction never interleaves with another's. Rate-limit buckets have a
+    second connection and thread, so admission checks never queue behind
+    session loads and saves.
+    """
+
+    def __init__(self, path: str = SESSION_DB_PATH, codec: Optional[SessionCodec] = None,
+                 ttl_seconds: int = SESSION_TTL_SECONDS):
+        self.codec = codec or SessionCodec()
+        self.ttl_seconds = ttl_seconds
+        self.expirations = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-sqlite")
+        self._bucket_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ratelimit-sqlite")
+        self.conn = self._connect(path)
+        self.bucket_conn = self._connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                payload BLOB NOT NULL,
+                last_accessed REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_sessions_last_accessed ON sessions (last_accessed);
+            CREATE TABLE IF NOT EXISTS session_locks (
+                session_id TEXT PRIMARY KEY,
+                token TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+        """)
+        # Refreshed by each sweep, so stats() needs no query
+        self.session_count = self._count()
+
+    @staticmethod
+    def _connect(path):
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    async def _run(self, fn, *args, executor=None):
+        return await asyncio.get_running_loop().run_in_executor(executor or self._executor, fn, *args)
+
+    def _count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def _load(self, session_id):
+        row = self.conn.execute(
+            "SELECT payload, last_accessed FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if time.time() - row[1] > self.ttl_seconds:
+            self._delete(session_id)
+            self.expirations += 1
+            return None
+        return self.codec.decode(row[0])
+
+    def _save(self, session_id, session):
+        self.conn.execute(
+            "INSERT INTO sessions (session_id, payload, last_accessed) VALUES (?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET payload = excluded.payload, "
+            "last_accessed = excluded.last_accessed",
+            (session_id, self.codec.encode(session), session["last_accessed"]),
+        )
+
+    def _delete(self, session_id):
+        self.conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def _sweep(self):
+        now = time.time()
+        removed = self.conn.execute(
+            "DELETE FROM sessions WHERE last_accessed < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        self.conn.execute("DELETE FROM session_locks WHERE expires_at < ?", (now,))
+        self.expirations += removed
+        self.session_count = self._count()
+        return removed
+
+    def _acquire_lock(self, session_id, token):
+        now = time.time()
+        # Insert a new lease, or take over one that has expired
+        cursor = self.conn.execute(
+            "INSERT INTO session_locks (session_id, token, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET token = excluded.token, expires_at = excluded.expires_at "
+            "WHERE session_locks.expires_at < ?",
+            (session_id, token, now + SESSION_LOCK_TTL, now),
+        )
+        return cursor.rowcount == 1
+
+    def _renew_lock(self, session_id, token):
+        cursor = self.conn.execute(
+            "UPDATE session_locks SET expires_at = ? WHERE session_id = ? AND token = ?",
+            (time.time() + SESSION_LOCK_TTL, session_id, token),
+        )
+        return cursor.rowcount == 1
+
+    def _release_lock(self, session_id, token):
+        self.conn.execute("DELETE FROM session_locks WHERE session_id = ? AND token = ?", (session_id, token))
+
+    def _sweep_buckets(self):
+        self.bucket_conn.execute("DELETE FROM rate_buckets WHERE updated < ?", (time.time() - RATE_BUCKET_TTL,))
+
+    def _take_tokens(self, buckets):
+        now = time.time()
+        keys = [key for key, _, _ in buckets]
+        # IMMEDIATE: read-modify-write under the write lock, so workers never
+        # both spend the same token; one transaction for all the buckets
+        self.bucket_conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.bucket_conn.execute(
+                f"SELECT key, tokens, updated FROM rate_buckets WHERE key IN ({', '.join('?' * len(keys))})", keys
+            ).fetchall()
+            stored = {key: (tokens, updated) for key, tokens, updated in rows}
+            tokens, empty, retry_after = buckets_take(
+                [stored.get(key) for key in keys], [limit for _, *limit in buckets], now
+            )
+            self.bucket_conn.executemany(
+                "INSERT INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                [(key, count, now) for key, count in zip(keys, tokens)],
+            )
+            self.bucket_conn.execute("COMMIT")
+        except Exception:
+            self.bucket_conn.execute("ROLLBACK")
+            raise
+        return empty, retry_after
+
+    async def load(self, session_id):
+        return await self._run(self._load, session_id)
+
+    async def save(self, session_id, session):
+        await self._run(self._save, session_id, session)
+
+    async def delete(self, session_id):
+        await self._run(self._delete, session_id)
+
+    async def sweep(self):
+        await self._run(self._sweep_buckets, executor=self._bucket_executor)
+        return await self._run(self._sweep)
+
+    async def acquire_lock(self, session_id, token):
+        return await self._run(self._acquire_lock, session_id, token)
+
+    async def renew_lock(self, session_id, token):
+        return await self._run(self._renew_lock, session_id, token)
+
+    async def release_lock(self, session_id, token):
+        await self._run(self._release_lock, session_id, token)
+
+    async def take_tokens(self, buckets):
+        return await self._run(self._take_tokens, buckets, executor=self._bucket_executor)
+
+    def stats(self):
+        return {"sessions": self.session_count, "expirations": self.expirations}
+
+    async def close(self):
+        await self._run(self.bucket_conn.close, executor=self._bucket_executor)
+        await self._run(self.conn.close)
+        self._bucket_executor.shutdown(wait=False)
+        self._executor.shutdown(wait=False)
+
+
+class RedisBackend(SessionBackend):
+    """Sessions in Redis (or anything speaking its protocol), via redis.asyncio.
+
+    Keys expire natively after the TTL; locks are SET NX PX leases renewed and
+    released with WATCH/MULTI compare-and-set (no Lua needed, so simple
+    stand-ins work too).
+    """
+
+    def __init__(self, url: str = REDIS_URL, codec: Optional[SessionCodec] = None,
+                 ttl_seconds: int = SESSION_TTL_SECONDS, client=None):
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError("SESSION_BACKEND=redis needs the redis package: pip install redis") from None
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.codec = codec or SessionCodec()
+        self.ttl_seconds = ttl_seconds
+
+    async def load(self, session_id):
+        blob = await self.client.get(f"session:{session_id}")
+        return self.codec.decode(blob) if blob is not None else None
+
+    async def save(self, session_id, session):
+        await self.client.set(f"session:{session_id}", self.codec.encode(session), ex=self.ttl_seconds)
+
+    async def delete(self, session_id):
+        await self.client.delete(f"session:{session_id}")
+
+    async def acquire_lock(self, session_id, token):
+        lease = await self.client.set(f"lock:session:{session_id}", token, nx=True, px=int(SESSION_LOCK_TTL * 1000))
+        return bool(lease)
+
+    async def renew_lock(self, session_id, token):
+        key = f"lock:session:{session_id}"
+        renewed = []
+
+        async def renew(pipe):
+            renewed.clear()
+            if await pipe.get(key) == token.encode():
+                pipe.multi()
+                pipe.pexpire(key, int(SESSION_LOCK_TTL * 1000))
+                renewed.append(True)
+
+        await self.client.transaction(renew, key)
+        return bool(renewed)
+
+    async def release_lock(self, session_id, token):
+        key = f"lock:session:{session_id}"
+
+        async def release(pipe):
+            # Only delete our own lease, never one taken over after expiry
+            if await pipe.get(key) == token.encode():
+                pipe.multi()
+                pipe.delete(key)
+
+        await self.client.transaction(release, key)
+
+    async def take_tokens(self, buckets):
+        keys = [f"ratelimit:{key}" for key, _, _ in buckets]
+        limits = [limit for _, *limit in buckets]
+        result = {}
+
+        async def take(pipe):
+            now = time.time()
+            states = []
+            for key in keys:
+                stored = await pipe.hmget(key, "tokens", "updated")
+                states.append((float(stored[0]), float(stored[1])) if stored[0] is not None else None)
+            tokens, result["empty"], result["retry_after"] = buckets_take(states, limits, now)
+            pipe.multi()
+            for key, count, (rate, capacity) in zip(keys, tokens, limits):
+                pipe.hset(key, mapping={"tokens": count, "updated": now})
+                # Gone once it would have refilled completely
+                pipe.expire(key, max(1, int(capacity / rate) + 1))
+
+        # One WATCH/MULTI round for every bucket of the request
+        await self.client.transaction(take, *keys)
+        return result["empty"], result["retry_after"]
+
+    async def close(self):
+        await self.client.aclose()
+
 
 class SessionManager:
-    def __init__(self):
-        # Format: {session_id: {"context": [], "data": {}, "last_accessed": timestamp}}
-        self.sessions: Dict[str, Dict[str, Any]] = {}
+    def __init__(self, backend: Optional[SessionBackend] = None):
+        self.backend = backend or MemoryBackend()
+        self.hits = 0
+        self.misses = 0
+        # In-process locks (with waiter counts so idle ones can be dropped)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}
 
-    def get_session(self, session_id: str) -> Dict[str, Any]:
+    async def get_session(self, session_id: str) -> Dict[str, Any]:
         """Retrieve or create a session."""
-        if session_id not in self.sessions:
-            self.sessions[session_id] = {
-                "context": [],
-                "data": {},
-                "last_accessed": time.time()
-            }
+        session = await self.backend.load(session_id)
+        if session is None:
+            self.misses += 1
+            session = new_session()
         else:
-            self.sessions[session_id]["last_accessed"] = time.time()
-        return self.sessions[session_id]
+            self.hits += 1
+            session["last_accessed"] = time.time()
+        if self.backend.in_process:
+            # Registers new sessions and refreshes LRU order; shared backends
+            # are written once, by save_session at the end of the turn.
+            await self.backend.save(session_id, session)
+        return session
 
-    def clear_session(self, session_id: str):
+    async def save_session(self, session_id: str, session: Dict[str, Any]):
+        """Persist changes made to a session returned by get_session."""
+        session["last_accessed"] = time.time()
+        await self.backend.save(session_id, session)
+
+    async def clear_session(self, session_id: str):
         """Reset a session's data."""
-        if session_id in self.sessions:
-            self.sessions[session_id] = {
-                "context": [],
-                "data": {},
-                "last_accessed": time.time()
-            }
-
-    def cleanup_old_sessions(self, max_age_seconds: int = 3600):
-        """Remove sessions older than max_age_seconds."""
-        current_time = time.time()
-        expired_sessions = [
-            sid for sid, data in self.sessions.items() 
-            if current_time - data["last_accessed"] > max_age_seconds
-        ]
-        for sid in expired_sessions:
-            del self.sessions[sid]
+        await self.backend.delete(session_id)
+
+    async def cleanup_old_sessions(self) -> int:
+        """Remove sessions idle for longer than the TTL."""
+        return await self.backend.sweep()
+
+    @asynccontextmanager
+    async def lock(self, session_id: str):
+        """Serialize turns of one session across tasks and workers."""
+        local = self._locks.setdefault(session_id, asyncio.Lock())
+        self._lock_users[session_id] = self._lock_users.get(session_id, 0) + 1
+        try:
+            async with local:
+                token = uuid.uuid4().hex
+                while not await self.backend.acquire_lock(session_id, token):
+                    await asyncio.sleep(SESSION_LOCK_POLL)
+                renewer = asyncio.create_task(self._renew_lease(session_id, token))
+                try:
+                    yield
+                finally:
+                    renewer.cancel()
+                    await asyncio.gather(renewer, return_exceptions=True)
+                    await self.backend.release_lock(session_id, token)
+        finally:
+            self._lock_users[session_id] -= 1
+            if not self._lock_users[session_id]:
+                del self._lock_users[session_id]
+                del self._locks[session_id]
+
+    async def _renew_lease(self, session_id: str, token: str):
+        """Keep a held lease alive for as long as the turn runs."""
+        while True:
+            await asyncio.sleep(SESSION_LOCK_TTL / 3)
+            try:
+                if not await self.backend.renew_lock(session_id, token):
+                    print(f"⚠️ Lost the lock lease of session {session_id}")
+                    return
+            except Exception as e:
+                # Retried on the next tick, well before the lease runs out
+                print(f"⚠️ Could not renew the lock lease of session {session_id}: {e}")
+
+    async def run_sweeper(self, interval: float = SESSION_SWEEP_INTERVAL):
+        """Expire idle sessions periodically (run as a background task)."""
+        while True:
+            await asyncio.sleep(interval)
+            removed = await self.cleanup_old_sessions()
+            if removed:
+                print(f"🧹 Expired {removed} idle sessions")
+
+    async def take_tokens(self, buckets: List[Tuple[str, float, float]]) -> Tuple[Optional[int], float]:
+        """Rate-limit buckets shared through the session store (see admission.py)."""
+        return await self.backend.take_tokens(buckets)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, **self.backend.stats()}
+
+    async def close(self):
+        await self.backend.close()
+
+
+def create_session_manager(shared_prefix: Optional[List[Dict[str, str]]] = None) -> SessionManager:
+    """Build the SessionManager selected by SESSION_BACKEND (memory|sqlite|redis)."""
+    codec = SessionCodec(shared_prefix)
+    if SESSION_BACKEND == "sqlite":
+        return SessionManager(SQLiteBackend(SESSION_DB_PATH, codec))
+    if SESSION_BACKEND == "redis":
+        return SessionManager(RedisBackend(REDIS_URL, codec))
+    return SessionManager(MemoryBackend())
@@ -9,6 +9,8 @@ const refreshBtn = document.querySelector("#refresh-btn"); // Ensure refresh but
 
 let userMessage = null; // Variable to store user's message
 const API_URL = "/chat";
+const STREAM_URL = "/chat/stream";
+const WS_URL = `${location.protocol === "https:" ? "wss:" : "ws:"}//${location.host}/chat/ws`;
 const inputInitHeight = chatInput.scrollHeight;
 
 // === Session Management ===
@@ -53,10 +55,14 @@ const speakText = (text) => {
 };
 
 // === Send message to backend ===
-const sendMessageToAPI = (input) => {
+// turnId identifies one message: resending it (e.g. after a dropped
+// stream) returns the reply of the turn that already ran instead of
+// running it again.
+const sendMessageToAPI = (input, turnId = crypto.randomUUID()) => {
   const formData = new FormData();
   formData.append("input", input);
   formData.append("session_id", sessionId);
+  formData.append("turn_id", turnId);
 
   fetch(API_URL, {
     method: "POST",
@@ -65,7 +71,8 @@ const sendMessageToAPI = (input) => {
     .then((response) => response.json())
     .then((data) => {
       const responseMessage = data.response;
-      const li = createChatLi(responseMessage, "incoming");
+      // Rate limited / busy: show the "retry in N s" message as an error
+      const li = createChatLi(responseMessage, data.retry_after ? "error" : "incoming");
       chatbox.appendChild(li);
       chatbox.scrollTo(0, chatbox.scrollHeight);
 
@@ -82,6 +89,139 @@ const sendMessageToAPI = (input) => {
     });
 };
 
+// Turned away by the server (429 / 503): show the message, don't retry
+class RetryLaterError extends Error {
+  constructor(message, retryAfter) {
+    super(message);
+    this.retryAfter = retryAfter;
+  }
+}
+
+// === Streaming transports ===
+// Preferred: one persistent WebSocket. Otherwise Server-Sent Events over a
+// streaming fetch. If neither works we fall back to the plain POST above.
+let socket = null;
+let socketTurn = null; // event handler of the turn currently streaming over the socket
+
+const connectSocket = () => {
+  if (!("WebSocket" in window) || socket) return;
+  socket = new WebSocket(WS_URL);
+  socket.onmessage = (e) => {
+    const message = JSON.parse(e.data);
+    if (socketTurn) socketTurn(message.event, message);
+  };
+  socket.onclose = () => {
+    socket = null;
+    if (socketTurn) socketTurn("error", { message: "connection closed" });
+  };
+};
+
+const streamOverSocket = (input, turnId, onEvent) =>
+  new Promise((resolve, reject) => {
+    socketTurn = (event, payload) => {
+      if (event === "error") {
+        socketTurn = null;
+        reject(payload.retry_after ? new RetryLaterError(payload.message, payload.retry_after) : new Error(payload.message));
+        return;
+      }
+      onEvent(event, payload);
+      if (event === "done") {
+        socketTurn = null;
+        resolve();
+      }
+    };
+    socket.send(JSON.stringify({ input, session_id: sessionId, turn_id: turnId }));
+  });
+
+const streamOverSSE = async (input, turnId, onEvent) => {
+  const formData = new FormData();
+  formData.append("input", input);
+  formData.append("session_id", sessionId);
+  formData.append("turn_id", turnId);
+
+  const response = await fetch(STREAM_URL, { method: "POST", body: formData });
+  if (response.status === 429 || response.status === 503) {
+    const data = await response.json();
+    throw new RetryLaterError(data.response, data.retry_after);
+  }
+  if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = "message";
+      let data = "";
+      frame.split("\n").forEach((line) => {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      });
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
+};
+
+// === Send message, rendering tokens as they arrive ===
+const sendMessageStreaming = (input) => {
+  const li = createChatLi("", "incoming");
+  const p = li.querySelector("p");
+  chatbox.appendChild(li);
+  chatbox.scrollTo(0, chatbox.scrollHeight);
+
+  let text = "";
+  const render = (value) => {
+    text = value;
+    p.textContent = text;
+    chatbox.scrollTo(0, chatbox.scrollHeight);
+  };
+
+  const onEvent = (event, payload) => {
+    if (event === "token") render(text + payload.text);
+    else if (event === "notes") render(text + payload.text);
+    else if (event === "done") render(payload.response);
+  };
+
+  const transport =
+    socket && socket.readyState === WebSocket.OPEN ? streamOverSocket : streamOverSSE;
+  const turnId = crypto.randomUUID();
+
+  transport(input, turnId, onEvent)
+    .then(() => {
+      const speakBtn = li.querySelector(".speak-btn");
+      if (speakBtn) {
+        speakBtn.addEventListener("click", () => speakText(text));
+      }
+    })
+    .catch((error) => {
+      console.warn("Streaming failed:", error);
+      if (error instanceof RetryLaterError) {
+        li.remove();
+        chatbox.appendChild(createChatLi(error.message, "error"));
+        chatbox.scrollTo(0, chatbox.scrollHeight);
+      } else if (!text) {
+        // Nothing rendered yet: retry over the plain POST endpoint. Same
+        // turn id, so a turn that finished server-side is not run twice.
+        li.remove();
+        sendMessageToAPI(input, turnId);
+      } else {
+        chatbox.appendChild(createChatLi("Oops! Something went wrong.", "error"));
+        chatbox.scrollTo(0, chatbox.scrollHeight);
+      }
+    });
+
+  // Re-open the socket in the background for the next turn
+  connectSocket();
+};
+
 // === Handle user sending message ===
 const handleChat = () => {
   const input = chatInput.value.trim();
@@ -93,7 +233,7 @@ const handleChat = () => {
   chatbox.appendChild(createChatLi(input, "outgoing"));
   chatbox.scrollTo(0, chatbox.scrollHeight);
 
-  sendMessageToAPI(input);
+  sendMessageStreaming(input);
 };
 
 // === Reset conversation ===
@@ -162,6 +302,8 @@ if (SpeechRecognition) {
 }
 
 // === Event Listeners ===
+connectSocket();
+
 document.querySelector("#refresh-btn").addEventListener("click", () => {
   sendMessagesToAPI("True");
 });
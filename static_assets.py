@@ -0,0 +1,169 @@
+"""Fingerprinted, precompressed serving of the chat widget's static files.
+
+At startup every file in static/ is read once. api.js and style.css (and
+any other FINGERPRINTED file) get a content-hash name such as
+api.3f2a9c1b7d4e.js. index.html has its references rewritten to those
+names, so the hashed files can be cached for a year (immutable): a new
+deploy changes the hash and therefore the URL. Each file is held in
+memory as identity, gzip and (with the optional `brotli` package) Brotli
+variants, compressed once at the highest level, and the variant is picked
+per request from Accept-Encoding. Everything carries a strong ETag, so
+index.html and the unhashed names are revalidated with a cheap 304.
+
+Files that are not in the table (added after startup, subdirectories)
+fall through to Starlette's StaticFiles.
+"""
+import gzip
+import hashlib
+import os
+import re
+from typing import Dict, Optional
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+STATIC_DIR = "static"
+INDEX_FILE = "index.html"
+FINGERPRINTED = ("api.js", "style.css")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".json": "application/json",
+    ".svg": "image/svg+xml",
+    ".png": "image/png",
+    ".ico": "image/x-icon",
+}
+COMPRESSIBLE = (".html", ".js", ".css", ".json", ".svg")
+
+# src="static/api.js" / href="/static/style.css"
+REFERENCE_RE = re.compile(r"""((?:src|href)=["'])(/?static/)([^"'?#]+)""")
+
+
+def accepted_encodings(header: str):
+    """Codings the client accepts (q > 0), from an Accept-Encoding header.
+
+    "*" stands for br and gzip unless they are listed themselves; a
+    malformed q-value refuses its coding.
+    """
+    accepted, listed = set(), set()
+    for part in header.split(","):
+        coding, *params = [piece.strip() for piece in part.split(";")]
+        coding = coding.lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        listed.add(coding)
+        if quality > 0:
+            accepted.add(coding)
+    if "*" in accepted:
+        accepted |= {"br", "gzip"} - listed
+    return accepted
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as If-None-Match requires
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+class Asset:
+    def __init__(self, name: str, body: bytes, cache_control: str):
+        self.name = name
+        self.cache_control = cache_control
+        self.content_type = CONTENT_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {"identity": body}
+        if name.endswith(COMPRESSIBLE):
+            # mtime=0: the same input always gives the same bytes
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants["gzip"] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.variants["br"] = compressed
+
+    def etag(self, coding: str) -> str:
+        # One strong ETag per representation (RFC 9110 8.8.3)
+        return '"%s"' % self.digest if coding == "identity" else '"%s-%s"' % (self.digest, coding)
+
+    def pick(self, accept_encoding: str):
+        """(content coding, body) for a request's Accept-Encoding."""
+        accepted = accepted_encodings(accept_encoding)
+        for coding in ("br", "gzip"):
+            if coding in self.variants and coding in accepted:
+                return coding, self.variants[coding]
+        return "identity", self.variants["identity"]
+
+
+class StaticAssets:
+    def __init__(self, directory: str = STATIC_DIR, fingerprinted=FINGERPRINTED, index: str = INDEX_FILE):
+        self.directory = directory
+        self.fingerprinted = set(fingerprinted)
+        self.index = index
+        self.assets: Optional[Dict[str, Asset]] = None
+        self.urls: Dict[str, str] = {}  # original name -> fingerprinted name
+
+    def build(self):
+        """Read, fingerprint and compress every top-level file (once, at startup)."""
+        assets, urls = {}, {}
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if not os.path.isfile(path) or name == self.index:
+                continue
+            with open(path, "rb") as f:
+                body = f.read()
+            if name in self.fingerprinted:
+                stem, ext = os.path.splitext(name)
+                hashed = f"{stem}.{hashlib.sha256(body).hexdigest()[:12]}{ext}"
+                assets[hashed] = Asset(hashed, body, IMMUTABLE)
+                urls[name] = hashed
+            # The plain name stays reachable for pages cached before a deploy
+            assets[name] = Asset(name, body, REVALIDATE)
+
+        index_path = os.path.join(self.directory, self.index)
+        if os.path.exists(index_path):
+            with open(index_path, encoding="utf-8") as f:
+                html = f.read()
+            html = REFERENCE_RE.sub(lambda m: m.group(1) + m.group(2) + urls.get(m.group(3), m.group(3)), html)
+            assets[self.index] = Asset(self.index, html.encode("utf-8"), REVALIDATE)
+
+        self.assets, self.urls = assets, urls
+        variants = sum(len(asset.variants) for asset in assets.values())
+        print(f"✅ Static assets: {len(assets)} files, {variants} variants ({', '.join(urls.values())})")
+
+    def get(self, name: str) -> Optional[Asset]:
+        if self.assets is None:
+            self.build()
+        return self.assets.get(name)
+
+    @staticmethod
+    def respond(asset: Asset, headers):
+        """(status, headers, body) for a GET of `asset` with these request headers."""
+        coding, body = asset.pick(headers.get("accept-encoding", ""))
+        response_headers = {
+            "ETag": asset.etag(coding),
+            "Cache-Control": asset.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if etag_matches(headers.get("if-none-match", ""), asset.etag(coding)):
+            return 304, response_headers, b""
+        if coding != "identity":
+            response_headers["Content-Encoding"] = coding
+        response_headers["Content-Type"] = asset.content_type
+        return 200, response_headers, body
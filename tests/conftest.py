@@ -0,0 +1,56 @@
+"""Shared test setup: the repo root on sys.path, a throwaway database and
+fake LLM providers (no request leaves the machine).
+
+    pip install -r requirements-dev.txt
+    python -m pytest -q
+"""
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix="chatbot-tests-")
+# database.py binds its engine at import time
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'appointments.db')}"
+os.environ["DIRECTORY_PATH"] = os.path.join(ROOT, "directory.json")
+os.environ.setdefault("LLM_FAKE_PROVIDERS", '{"groq": {"latency": 0.01, "jitter": 0}, "gemini": {"latency": 0.01, "jitter": 0}}')
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture
+def tables():
+    """Empty appointment / outbox / ledger tables for one test."""
+    import database
+    import models  # noqa: F401 (registers the tables)
+
+    database.create_tables()
+    yield
+    with database.engine.begin() as conn:
+        for table in reversed(database.Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+
+
+@pytest.fixture(scope="session")
+def bot():
+    """bot-gemini.py, imported once and run from the scratch directory
+    (its Excel journal and static/ lookups are relative to the cwd)."""
+    cwd = os.getcwd()
+    os.symlink(os.path.join(ROOT, "static"), os.path.join(WORKDIR, "static"))
+    os.chdir(WORKDIR)
+    try:
+        spec = importlib.util.spec_from_file_location("bot_gemini", os.path.join(ROOT, "bot-gemini.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        yield module
+    finally:
+        os.chdir(cwd)
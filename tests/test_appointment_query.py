@@ -0,0 +1,46 @@
+"""Query / export filters: case-insensitive email prefixes and ISO date ranges."""
+import pytest
+
+from appointment_query import QueryError, build_filters, fetch_page
+from appointment_store import insert_batch
+from availability import SlotIndex
+from fast_extractor import FastExtractor
+
+DIRECTORY = {"departments": {"Cardiology": {}}, "doctors": [{"name": "Dr. Mehta", "department": "Cardiology"}]}
+
+
+def book(slot_index=None, **fields):
+    data = {"name": "Asha", "department": "Cardiology", "doctor": "Dr. Mehta", "date": "2031-03-04",
+            "time": "10:00 AM", "email": "asha@example.com", "mobile": "9876543210", **fields}
+    slot = slot_index.slot_for(data["doctor"], data["date"], data["time"]) if slot_index else None
+    return insert_batch([(data, None, None, slot)])[0]
+
+
+def ids(**filters):
+    rows, _ = fetch_page(build_filters(**filters))
+    return [row["id"] for row in rows]
+
+
+def test_email_prefix_ignores_case_and_spaces(tables):
+    mixed = book(email=" Asha.Rao@Example.COM")
+    lower = book(email="asha@example.com")
+    book(email="ravi@example.com")
+    assert ids(email_prefix="asha") == [mixed, lower]
+    assert ids(email_prefix="ASHA.R") == [mixed]
+
+
+def test_bookings_store_the_slot_date(tables):
+    slot_index = SlotIndex(FastExtractor(DIRECTORY))
+    booked = book(slot_index, date="4 March 2031")
+    rows, _ = fetch_page(build_filters(date_from="2031-03-04", date_to="2031-03-04"))
+    assert [(row["id"], row["date"]) for row in rows] == [(booked, "2031-03-04")]
+
+
+def test_date_filters_skip_free_form_dates(tables):
+    iso = book(date="2031-03-04")
+    legacy = book(date="next monday")
+    # "next monday" sorts after every ISO date as a string
+    assert ids(date_from="2031-01-01") == [iso]
+    assert ids() == [iso, legacy]
+    with pytest.raises(QueryError):
+        build_filters(date_to="04/03/2031")
@@ -0,0 +1,83 @@
+"""Slot index: normalization, conflicts, next free slots and what can't be booked."""
+import asyncio
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from availability import Slot, SlotIndex
+from booking import AWAITING_CONFIRMATION, COLLECTING, mark_awaiting
+from fast_extractor import FastExtractor
+from session_manager import new_session
+
+DIRECTORY = {"departments": {"Cardiology": {}}, "doctors": [{"name": "Dr. Mehta", "department": "Cardiology"}]}
+# A Monday, 10:05
+NOW = datetime(2031, 3, 3, 10, 5)
+
+
+@pytest.fixture
+def slot_index():
+    return SlotIndex(FastExtractor(DIRECTORY))
+
+
+def test_slot_for_normalizes_free_form_fields(slot_index):
+    slot = Slot("dr. mehta", "2031-03-04", 600)
+    assert slot_index.slot_for("Dr. Mehta", "2031-03-04", "10:00 AM") == slot
+    assert slot_index.slot_for(" dr mehta ", "4 March 2031", "10 am") == slot
+    # Off-grid times occupy the slot they fall in
+    assert slot_index.slot_for("Doctor Mehta", "2031-03-04", "10:20") == slot
+    assert slot_index.slot_for("Dr. Mehta", "tomorrow", "10 am", today=date(2031, 3, 3)) == slot
+    assert slot_index.slot_for("Dr. Mehta", "2031-03-04", "morning") is None
+    assert slot_index.slot_for("Dr. Mehta", "", "10 am") is None
+
+
+def test_reserve_refuses_a_taken_slot(slot_index):
+    slot = slot_index.slot_for("Dr. Mehta", "2031-03-04", "10:00 AM")
+    assert slot_index.reserve(slot)
+    assert not slot_index.reserve(slot_index.slot_for("dr mehta", "2031-03-04", "10:15 am"))
+    assert not slot_index.is_free(slot) and slot_index.count == 1
+    slot_index.release(slot)
+    assert slot_index.reserve(slot)
+
+
+def test_next_free_skips_booked_past_and_days_off(slot_index):
+    slot_index.reserve(Slot("dr. mehta", "2031-03-03", 630))
+    # Today: past times and the booked 10:30 are skipped
+    assert [slot.minute for slot in slot_index.next_free("dr. mehta", now=NOW)] == [660, 690, 720]
+    # A past start is searched from today
+    assert slot_index.next_free("dr. mehta", date(2031, 2, 1), limit=1, now=NOW) == [Slot("dr. mehta", "2031-03-03", 660)]
+    # Saturday's grid is full: Sunday is a day off, so Monday comes next
+    for minute in slot_index.grid:
+        slot_index.reserve(Slot("dr. mehta", "2031-03-08", minute))
+    assert slot_index.next_free("dr. mehta", date(2031, 3, 8), limit=1, now=NOW) == [Slot("dr. mehta", "2031-03-10", 540)]
+
+
+def test_unbookable_slots(slot_index):
+    assert slot_index.unbookable(Slot("dr. mehta", "2031-03-02", 600), now=NOW)[0] == "date"
+    assert slot_index.unbookable(Slot("dr. mehta", "2031-03-03", 600), now=NOW)[0] == "time"
+    assert slot_index.unbookable(Slot("dr. mehta", "2031-03-09", 600), now=NOW)[0] == "date"  # Sunday
+    assert slot_index.unbookable(Slot("dr. mehta", "2031-03-04", 1200), now=NOW)[0] == "time"  # 8 PM
+    assert slot_index.unbookable(Slot("dr. mehta", "2031-03-03", 630), now=NOW) is None
+
+
+def test_past_date_is_refused_at_confirmation(bot, tables):
+    past = (date.today() - timedelta(days=5)).isoformat()
+    session = new_session()
+    session["data"] = {"name": "Asha Rao", "department": "Cardiology", "doctor": "Dr. Mehta", "date": past,
+                       "time": "10:00 AM", "email": "asha@example.com", "mobile": "9876543210"}
+    mark_awaiting(session, session["data"])
+    assert session["booking"]["state"] == AWAITING_CONFIRMATION
+
+    note = asyncio.run(bot.book_appointment(session))
+    assert f"{past} has already passed" in note
+    assert "date" not in session["data"]
+    assert session["booking"]["state"] == COLLECTING
+
+
+def test_free_slot_hint_names_its_date(bot):
+    past = date.today() - timedelta(days=5)
+    hint = bot.free_slot_hint({"doctor": "Dr. Mehta", "date": past.isoformat()})
+    assert hint.startswith(f"{past.isoformat()} has already passed. Next free slots: ")
+
+    day = date.today() + timedelta(days=7 - date.today().weekday())  # next Monday
+    assert bot.free_slot_hint({"doctor": "Dr. Mehta", "date": day.isoformat()}) == (
+        f"Free slots on {day.isoformat()}: 09:00 AM, 09:30 AM, 10:00 AM.")
@@ -0,0 +1,86 @@
+"""Booking state machine: confirmation words, transitions and exactly-once bookings."""
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+import models
+from booking import AWAITING_CONFIRMATION, COLLECTING, CONFIRMED, is_confirmation
+from database import SessionLocal
+from session_manager import new_session
+
+# Next Monday: a future consulting day
+DAY = (date.today() + timedelta(days=7 - date.today().weekday())).isoformat()
+
+
+@pytest.mark.parametrize("text", ["yes", "Yes, please confirm", "ok, book it", "Sure, schedule it", "confirmed!"])
+def test_affirmatives_confirm(text):
+    assert is_confirmation(text)
+
+
+@pytest.mark.parametrize("text", ["not ok", "no, don't confirm", "I'm not sure", "yes but wait, change the time",
+                                  "don't book it", "can't make it, ok?", "the booking", "yesterday"])
+def test_negations_and_lookalikes_do_not_confirm(text):
+    assert not is_confirmation(text)
+
+
+def details(time):
+    return {"name": "Asha Rao", "department": "Cardiology", "doctor": "Dr. Sharma", "date": DAY,
+            "time": time, "email": "asha@example.com", "mobile": "9876543210"}
+
+
+def confirm(bot, session, text):
+    return asyncio.run(bot.confirm_if_requested(session, text, "Noted."))
+
+
+def count(model):
+    db = SessionLocal()
+    try:
+        return db.execute(select(func.count()).select_from(model)).scalar()
+    finally:
+        db.close()
+
+
+def test_collecting_awaiting_confirmed(bot, tables):
+    session = new_session()
+    assert "Nothing is booked yet" in confirm(bot, session, "yes")
+    assert session["booking"]["state"] == COLLECTING
+
+    session["data"] = details("11:00 AM")
+    assert "Asha Rao" in confirm(bot, session, "9876543210")
+    assert session["booking"]["state"] == AWAITING_CONFIRMATION
+
+    assert confirm(bot, session, "not ok") == ""
+    assert session["booking"]["state"] == AWAITING_CONFIRMATION
+    assert count(models.Appointment) == 0
+
+    assert "confirmation email is on its way" in confirm(bot, session, "Yes, please confirm")
+    assert session["booking"]["state"] == CONFIRMED
+    assert (count(models.Appointment), count(models.EmailOutbox), count(models.BookingLedger)) == (1, 1, 1)
+
+
+def test_repeated_yes_is_answered_from_the_booking(bot, tables):
+    session = new_session()
+    session["data"] = details("11:30 AM")
+    confirm(bot, session, "all set")
+    confirm(bot, session, "yes")
+    appointment_id = session["booking"]["appointment_id"]
+
+    note = confirm(bot, session, "yes")
+    assert f"already confirmed (booking #{appointment_id})" in note
+    assert (count(models.Appointment), count(models.EmailOutbox)) == (1, 1)
+
+
+def test_ledger_stops_a_second_session_booking_again(bot, tables):
+    first, second = new_session(), new_session()
+    for session in (first, second):
+        session["data"] = details("12:00 PM")
+        confirm(bot, session, "all set")
+    confirm(bot, first, "yes")
+
+    # Same patient and slot from another session (or worker): found in the ledger
+    note = confirm(bot, second, "yes")
+    assert f"already confirmed (booking #{first['booking']['appointment_id']})" in note
+    assert second["booking"] == first["booking"]
+    assert (count(models.Appointment), count(models.EmailOutbox), count(models.BookingLedger)) == (1, 1, 1)
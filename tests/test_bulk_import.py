@@ -0,0 +1,95 @@
+"""Bulk import: dedupe against chat bookings, ledger / slot / journal bookkeeping."""
+import asyncio
+import csv
+import io
+
+import pytest
+
+pytest.importorskip("pandas")
+from sqlalchemy import select  # noqa: E402
+
+import models  # noqa: E402
+from appointment_store import AppointmentWriter  # noqa: E402
+from availability import SlotIndex  # noqa: E402
+from booking import booking_key  # noqa: E402
+from bulk_import import import_file  # noqa: E402
+from database import SessionLocal  # noqa: E402
+from fast_extractor import FastExtractor  # noqa: E402
+
+DIRECTORY = {
+    "departments": {"Cardiology": {}},
+    "doctors": [{"name": "Dr. Mehta", "department": "Cardiology"}, {"name": "Dr. Rao", "department": "Cardiology"}],
+}
+HEADER = "Name,Department,Doctor,Date,Time,Email,Mobile\n"
+
+
+@pytest.fixture
+def slot_index():
+    return SlotIndex(FastExtractor(DIRECTORY))
+
+
+def chat_booking(slot_index, **fields):
+    """A booking confirmed through the chat (AppointmentWriter, as save_appointment_to_db does)."""
+    data = {"name": "Asha", "department": "Cardiology", "doctor": "Dr. Mehta", "date": "2031-03-04",
+            "time": "10:00 AM", "email": "asha@example.com", "mobile": "9876543210", **fields}
+    slot = slot_index.slot_for(data["doctor"], data["date"], data["time"])
+    return asyncio.run(AppointmentWriter().save(data, key=booking_key(data, slot), slot=slot))
+
+
+def run_import(tmp_path, slot_index, rows):
+    report = import_file(io.BytesIO((HEADER + rows).encode()), "csv", str(tmp_path / "errors.csv"),
+                         directory=DIRECTORY, slot_index=slot_index, journal_file=str(tmp_path / "journal.csv"))
+    errors = {}
+    if report["error_file"]:
+        with open(report["error_file"], newline="") as f:
+            errors = {int(row["row"]): row["error"] for row in csv.DictReader(f)}
+    return report, errors
+
+
+def fetch(*columns):
+    db = SessionLocal()
+    try:
+        return db.execute(select(*columns)).all()
+    finally:
+        db.close()
+
+
+def test_email_dedupe_ignores_case_and_spaces(tables, tmp_path, slot_index):
+    appointment_id = chat_booking(slot_index, email=" Asha@Example.COM")
+    report, errors = run_import(tmp_path, slot_index, (
+        "Asha,Cardiology,Dr. Mehta,2031-03-04,10:00 AM,asha@example.com,9876543210\n"
+        "Ravi,Cardiology,Dr. Rao,2031-03-05,09:00 AM,Ravi@Example.com,9876543211\n"
+        "Ravi,Cardiology,Dr. Rao,2031-03-05,09:00 AM, ravi@example.com ,9876543211\n"
+    ))
+    assert (report["inserted"], report["duplicates"]) == (1, 2)
+    assert errors == {1: f"already booked as appointment #{appointment_id}",
+                      3: "duplicate of an earlier row in the file"}
+    assert fetch(models.Appointment.email)[-1] == ("ravi@example.com",)
+
+
+def test_imported_rows_take_slots_ledger_and_journal(tables, tmp_path, slot_index):
+    appointment_id = chat_booking(slot_index)
+    report, errors = run_import(tmp_path, slot_index, (
+        "Ravi,Cardiology,dr mehta,2031-03-04,10:10 am,ravi@example.com,9876543211\n"
+        "Meena,Cardiology,Dr. Mehta,2031-03-04,11:00,meena@example.com,9876543212\n"
+        "Kiran,Cardiology,Dr. Mehta,2031-03-04,11:15 AM,kiran@example.com,9876543213\n"
+    ))
+    assert (report["inserted"], report["duplicates"]) == (1, 2)
+    assert errors == {1: f"slot already booked by appointment #{appointment_id}",
+                      3: "slot already booked by an earlier row in the file"}
+
+    meena_id = fetch(models.Appointment.id)[-1][0]
+    assert fetch(models.BookedSlot.doctor, models.BookedSlot.minute, models.BookedSlot.appointment_id) == [
+        ("dr. mehta", 600, appointment_id), ("dr. mehta", 660, meena_id)]
+    meena_slot = slot_index.slot_for("Dr. Mehta", "2031-03-04", "11:00 AM")
+    assert (booking_key({"email": "meena@example.com"}, meena_slot), meena_id) in fetch(
+        models.BookingLedger.key, models.BookingLedger.appointment_id)
+    with open(tmp_path / "journal.csv", newline="") as f:
+        journal = list(csv.reader(f))
+    assert journal[0][1:] == ["Name", "Department", "Doctor", "Date", "Time", "Email", "Mobile"]
+    assert [row[1:] for row in journal[1:]] == [
+        ["Meena", "Cardiology", "Dr. Mehta", "2031-03-04", "11:00 AM", "meena@example.com", "9876543212"]]
+
+    # Re-running the file adds nothing
+    report, _ = run_import(tmp_path, slot_index, "Meena,Cardiology,Dr. Mehta,2031-03-04,11:00,meena@example.com,9876543212\n")
+    assert (report["inserted"], report["duplicates"]) == (0, 1)
@@ -0,0 +1,76 @@
+"""CompressionMiddleware: Brotli / gzip / identity from Accept-Encoding, including q-values."""
+import asyncio
+import gzip
+import json
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+import compression
+from compression import CompressionMiddleware
+
+PAYLOAD = {"slots": [{"doctor": "Dr. Mehta", "date": "2031-03-04", "time": "10:00 AM"}] * 50}
+
+
+async def slots(request):
+    return JSONResponse(PAYLOAD)
+
+
+async def tiny(request):
+    return JSONResponse({"ok": True})
+
+
+async def events(request):
+    async def stream():
+        yield "event: token\ndata: {}\n\n" * 100
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+APP = CompressionMiddleware(Starlette(routes=[Route("/slots", slots), Route("/tiny", tiny), Route("/events", events)]))
+
+
+def get(path, accept_encoding):
+    import httpx
+
+    async def run():
+        transport = httpx.ASGITransport(app=APP)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # Raw bytes: no client-side decoding
+            async with client.stream("GET", path, headers={"Accept-Encoding": accept_encoding}) as response:
+                return response.headers, b"".join([chunk async for chunk in response.aiter_raw()])
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("accept_encoding", ["gzip", "gzip, br;q=0", "br;q=0.0, gzip;q=0.8", "deflate, gzip"])
+def test_gzip_when_br_is_not_accepted(accept_encoding):
+    headers, body = get("/slots", accept_encoding)
+    assert headers["content-encoding"] == "gzip"
+    assert json.loads(gzip.decompress(body)) == PAYLOAD
+
+
+@pytest.mark.parametrize("accept_encoding", ["", "identity", "gzip;q=0", "gzip;q=0, br;q=0", "gzipped"])
+def test_identity_when_nothing_usable_is_accepted(accept_encoding):
+    headers, body = get("/slots", accept_encoding)
+    assert "content-encoding" not in headers
+    assert json.loads(body) == PAYLOAD
+
+
+@pytest.mark.skipif(compression.brotli is None, reason="brotli not installed")
+@pytest.mark.parametrize("accept_encoding", ["gzip, deflate, br", "br;q=1, gzip;q=0.5", "*"])
+def test_brotli_when_accepted(accept_encoding):
+    headers, body = get("/slots", accept_encoding)
+    assert (headers["content-encoding"], headers["vary"]) == ("br", "Accept-Encoding")
+    assert int(headers["content-length"]) == len(body)
+    assert json.loads(compression.brotli.decompress(body)) == PAYLOAD
+
+
+@pytest.mark.parametrize("accept_encoding", ["br", "gzip"])
+def test_small_and_streamed_responses_pass_through(accept_encoding):
+    assert "content-encoding" not in get("/tiny", accept_encoding)[0]
+    headers, body = get("/events", accept_encoding)
+    assert "content-encoding" not in headers
+    assert body.startswith(b"event: token")
@@ -0,0 +1,91 @@
+"""Folding old turns: the summary call runs outside the session lock, applied by compare-and-set."""
+import asyncio
+
+import pytest
+
+TURNS = 11  # one more than keep_turns + fold_turns
+
+
+@pytest.fixture
+def slow_summary(bot, monkeypatch):
+    """Summary calls wait for `release`; `started` is set once one is running."""
+    events = {"started": asyncio.Event(), "release": asyncio.Event()}
+
+    async def summarize(messages):
+        events["started"].set()
+        await events["release"].wait()
+        return "Asked about parking."
+
+    monkeypatch.setattr(bot.context_window, "summarize", summarize)
+    return events
+
+
+async def long_session(bot, session_id):
+    session = await bot.load_session(session_id)
+    for i in range(TURNS):
+        session["context"] += [{"role": "user", "content": f"question {i}"},
+                               {"role": "assistant", "content": f"answer {i}"}]
+    await bot.save_session(session_id, session)
+
+
+async def fold_while(bot, events, session_id, change):
+    """Run fold_session, applying change(session) under the lock during its summary call."""
+    events["started"].clear()
+    events["release"].clear()
+    fold = asyncio.create_task(bot.fold_session(session_id))
+    await events["started"].wait()
+    async def turn():
+        async with bot.session_manager.lock(session_id):
+            session = await bot.load_session(session_id)
+            change(session)
+            await bot.save_session(session_id, session)
+
+    # Not blocked by the fold in progress
+    await asyncio.wait_for(turn(), 1)
+    events["release"].set()
+    await fold
+    return await bot.load_session(session_id)
+
+
+def test_turn_during_summary_is_kept(bot, slow_summary):
+    async def run():
+        await long_session(bot, "fold-turn")
+        return await fold_while(bot, slow_summary, "fold-turn", lambda session: session["context"].append(
+            {"role": "user", "content": "is there parking?"}))
+
+    session = asyncio.run(run())
+    keep = bot.context_window.keep_turns
+    assert session["summary"] == "Asked about parking."
+    assert [m["content"] for m in session["context"][1:3]] == [f"question {TURNS - keep}", f"answer {TURNS - keep}"]
+    assert session["context"][-1]["content"] == "is there parking?"
+    assert len(session["context"]) == 1 + 2 * keep + 1
+
+
+def test_stale_fold_is_dropped(bot, slow_summary):
+    def reset(session):
+        del session["context"][1:]
+
+    async def run():
+        await long_session(bot, "fold-reset")
+        return await fold_while(bot, slow_summary, "fold-reset", reset)
+
+    session = asyncio.run(run())
+    assert session.get("summary", "") == ""
+    assert len(session["context"]) == 1
+
+
+def test_streaming_turn_does_not_wait_for_its_fold(bot, slow_summary):
+    async def run():
+        await long_session(bot, "fold-stream")
+        async def turn():
+            return [event async for event, _ in bot.stream_turn("9 am", session_id="fold-stream")]
+
+        assert (await asyncio.wait_for(turn(), 2))[-1] == "done"
+        # The turn is over while its fold is still summarizing
+        await slow_summary["started"].wait()
+        assert len(bot.fold_tasks) == 1
+        slow_summary["release"].set()
+        await asyncio.gather(*bot.fold_tasks)
+        return await bot.load_session("fold-stream")
+
+    assert asyncio.run(run())["summary"] == "Asked about parking."
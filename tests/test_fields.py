@@ -0,0 +1,67 @@
+"""Which extracted value a session keeps: fast path vs LLM, across and within turns."""
+import asyncio
+
+import pytest
+
+from extraction import AppointmentFields, ChatTurn
+from session_manager import new_session
+
+
+@pytest.fixture
+def llm_reads(bot, monkeypatch):
+    """Script the fused turn: each call returns the next set of fields."""
+    readings = []
+
+    async def fused_turn(messages):
+        return ChatTurn(reply="Noted.", appointment=AppointmentFields(**readings.pop(0)))
+
+    monkeypatch.setattr(bot, "run_fused_turn", fused_turn)
+    monkeypatch.setattr(bot, "CHAT_MODE", "fused")
+    return readings
+
+
+def turn(bot, session, text):
+    return asyncio.run(bot.run_chat_turn(session, text))
+
+
+def test_llm_correction_overwrites_earlier_fast_path_value(bot, llm_reads):
+    session = new_session()
+    turn(bot, session, "my email is asha@example.com")
+    assert session["data"]["email"] == "asha@example.com"
+    assert session["confidence"]["email"] > bot.LLM_FIELD_CONFIDENCE
+
+    llm_reads.append({"email": "asha.rao@example.com"})
+    turn(bot, session, "sorry, that was wrong: it's asha dot rao at example dot com")
+    assert session["data"]["email"] == "asha.rao@example.com"
+
+
+def test_llm_reading_wins_over_regex_in_an_unresolved_message(bot, llm_reads):
+    session = new_session()
+    llm_reads.append({"time": "11:00 AM"})
+    # The regex picks the first time it sees
+    turn(bot, session, "not 10 am, 11 am please")
+    assert session["data"]["time"] == "11:00 AM"
+
+
+def test_fast_path_beats_llm_within_a_resolved_turn(bot):
+    session = new_session()
+    bot.start_turn(session)
+    bot.set_field(session, "email", "asha@example.com", 0.99)
+    bot.set_field(session, "email", "asha@exarnple.com", bot.LLM_FIELD_CONFIDENCE)
+    assert session["data"]["email"] == "asha@example.com"
+
+    # A new turn: the earlier confidence no longer shields the value
+    bot.start_turn(session)
+    bot.set_field(session, "email", "asha.rao@example.com", bot.LLM_FIELD_CONFIDENCE)
+    assert session["data"]["email"] == "asha.rao@example.com"
+
+
+def test_llm_restating_a_detail_keeps_the_summary_current(bot, llm_reads):
+    session = new_session()
+    turn(bot, session, "9 am")
+    assert session["data"]["time"] == "09:00 AM"
+
+    # The fused output repeats every known detail in its own format
+    llm_reads.append({"name": "Asha Rao", "time": "9:00 AM"})
+    turn(bot, session, "I'm Asha Rao, thanks")
+    assert session["data"] == {"time": "09:00 AM", "name": "Asha Rao"}
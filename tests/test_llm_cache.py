@@ -0,0 +1,59 @@
+"""LLM response cache: keys and the memory / disk tiers."""
+import asyncio
+
+from llm_cache import LLMCache, cache_key
+
+MESSAGES = [{"role": "system", "content": "You book appointments."},
+            {"role": "user", "content": "I need a  cardiologist\n"}]
+
+
+def test_key_ignores_whitespace_but_not_parameters():
+    key = cache_key("llama-3.3-70b-versatile", "reply", MESSAGES)
+    spaced = [dict(m, content=" " + m["content"].replace(" ", "   ")) for m in MESSAGES]
+    assert cache_key("llama-3.3-70b-versatile", "reply", spaced) == key
+    assert cache_key("gemini-2.5-flash", "reply", MESSAGES) != key
+    assert cache_key("llama-3.3-70b-versatile", "extraction", MESSAGES) != key
+    assert cache_key("llama-3.3-70b-versatile", "reply", MESSAGES, '{"type": "object"}') != key
+
+
+def test_only_deterministic_opted_in_calls_are_cached():
+    cache = LLMCache(classes={"reply"}, disk_path="")
+    assert cache.caches("reply", 0)
+    assert not cache.caches("reply", 0.7)
+    assert not cache.caches("summary", 0)
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    path = str(tmp_path / "llm_cache.db")
+    key = cache_key("llama-3.3-70b-versatile", "reply", MESSAGES)
+
+    async def run():
+        first = LLMCache(disk_path=path, enabled=True)
+        assert await first.get("reply", key) is None
+        await first.set(key, "Which date suits you?")
+        assert await first.get("reply", key) == "Which date suits you?"
+        first.close()
+
+        second = LLMCache(disk_path=path, enabled=True)
+        assert await second.get("reply", key) == "Which date suits you?"
+        assert await second.get("reply", key) == "Which date suits you?"
+        second.close()
+        return first.stats(), second.stats()
+
+    first, second = asyncio.run(run())
+    assert (first["memory_hits"], first["misses"]) == (1, 1)
+    assert (second["disk_hits"], second["memory_hits"]) == (1, 1)
+
+
+def test_expired_and_evicted_entries_miss(tmp_path):
+    async def run():
+        cache = LLMCache(max_entries=2, ttl_seconds=0, disk_path="", enabled=True)
+        await cache.set("a", "1")
+        assert await cache.get("reply", "a") is None
+
+        cache.ttl_seconds = 60
+        for key in ("a", "b", "c"):
+            await cache.set(key, key)
+        assert list(cache.memory) == ["b", "c"]
+
+    asyncio.run(run())
@@ -0,0 +1,161 @@
+"""ProviderRouter failover, circuit breaking and hedging over FakeProviders."""
+import asyncio
+
+import pytest
+
+import llm_router
+from llm_providers import FakeProvider, providers
+from llm_router import AllProvidersFailed, ProviderRouter
+
+MESSAGES = [{"role": "user", "content": "Book me with Dr. Mehta"}]
+GROQ_MODEL = "llama-3.3-70b-versatile"
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    """groq / gemini replaced by fast, healthy fakes that answer with their own name."""
+    for name in ("groq", "gemini"):
+        monkeypatch.setitem(providers, name, FakeProvider(name=name, latency=0.01, jitter=0, reply=name, seed=1))
+    return providers
+
+
+def router(**kwargs):
+    kwargs.setdefault("hedging", False)
+    return ProviderRouter(dict(providers), **kwargs)
+
+
+def test_preferred_provider_answers(fakes):
+    r = router()
+    assert r.order(GROQ_MODEL) == ["groq", "gemini"]
+    assert r.order("gemini-2.5-flash") == ["gemini", "groq"]
+    assert asyncio.run(r.call(MESSAGES, GROQ_MODEL)) == "groq"
+    assert r.failovers == 0
+
+
+def test_error_fails_over_to_next_provider(fakes):
+    fakes["groq"].error_rate = 1.0
+    r = router()
+    assert asyncio.run(r.call(MESSAGES, GROQ_MODEL)) == "gemini"
+    assert r.failovers == 1
+    stats = r.stats()["providers"]
+    assert stats["groq"]["error_rate"] == 1.0
+    assert stats["gemini"]["error_rate"] == 0.0
+
+
+def test_rate_limit_and_timeout_are_counted(fakes):
+    fakes["groq"].rate_limit_rate = 1.0
+    fakes["gemini"].latency = 0.5
+    r = router(timeout=0.05)
+    with pytest.raises(AllProvidersFailed):
+        asyncio.run(r.call(MESSAGES, GROQ_MODEL))
+    stats = r.stats()["providers"]
+    assert (stats["groq"]["rate_limits"], stats["gemini"]["timeouts"]) == (1, 1)
+
+
+def test_breaker_opens_then_half_opens_after_cooldown(fakes):
+    fakes["groq"].error_rate = 1.0
+    r = router()
+    breaker = r.health["groq"].breaker
+    for _ in range(llm_router.BREAKER_FAILURES):
+        assert asyncio.run(r.call(MESSAGES, GROQ_MODEL)) == "gemini"
+    assert breaker.state == "open"
+    assert breaker.opens == 1
+    # Open breaker: groq is skipped entirely, no failover needed
+    failovers = r.failovers
+    assert r.order(GROQ_MODEL) == ["gemini"]
+    assert asyncio.run(r.call(MESSAGES, GROQ_MODEL)) == "gemini"
+    assert r.failovers == failovers
+
+    # Cooldown over: one trial call; it fails, so the breaker re-opens
+    breaker.cooldown = 0
+    assert breaker.state == "half-open"
+    assert r.order(GROQ_MODEL) == ["groq", "gemini"]
+    assert asyncio.run(r.call(MESSAGES, GROQ_MODEL)) == "gemini"
+    assert breaker.opens == 2
+
+    # Recovered provider: a successful trial closes the breaker
+    fakes["groq"].error_rate = 0.0
+    assert asyncio.run(r.call(MESSAGES, GROQ_MODEL)) == "groq"
+    assert breaker.state == "closed"
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = llm_router.CircuitBreaker(failures=1, cooldown=0)
+    breaker.record(False)
+    assert breaker.allows()
+    breaker.before_call()
+    assert not breaker.allows()
+    breaker.record(True)
+    assert breaker.state == "closed" and breaker.allows()
+
+
+def test_every_breaker_open_still_tries_preferred(fakes):
+    fakes["groq"].error_rate = fakes["gemini"].error_rate = 1.0
+    r = router()
+    for _ in range(llm_router.BREAKER_FAILURES):
+        assert asyncio.run(r.complete(MESSAGES, GROQ_MODEL)) == fakes["groq"].error_message
+    assert r.order(GROQ_MODEL) == ["groq"]
+    assert asyncio.run(r.complete_json(MESSAGES, GROQ_MODEL)) is None
+
+
+def test_slow_preferred_provider_is_demoted(fakes, monkeypatch):
+    monkeypatch.setattr(llm_router, "ROUTER_MIN_SAMPLES", 1)
+    r = router()
+    r.health["groq"].latencies.extend([1.0] * 5)
+    r.health["gemini"].latencies.extend([0.1] * 5)
+    assert r.order(GROQ_MODEL) == ["gemini", "groq"]
+
+
+def test_hedge_races_slow_primary(fakes, monkeypatch):
+    monkeypatch.setattr(llm_router, "ROUTER_HEDGE_DEFAULT_DELAY", 0.05)
+    fakes["groq"].latency = 1.0
+    r = router(hedging=True)
+    assert asyncio.run(r.call(MESSAGES, GROQ_MODEL)) == "gemini"
+    assert (r.hedges, r.hedge_wins, r.failovers) == (1, 1, 0)
+    # The cancelled primary got no verdict
+    assert list(r.health["groq"].outcomes) == []
+    assert r.health["groq"].breaker.allows()
+
+
+def test_stream_fails_over_before_first_chunk(fakes):
+    fakes["groq"].error_rate = 1.0
+    fakes["gemini"].reply = "Which doctor would you like?"
+    r = router()
+
+    async def collect():
+        return "".join([chunk async for chunk in r.stream(MESSAGES, GROQ_MODEL)])
+
+    assert asyncio.run(collect()).strip() == "Which doctor would you like?"
+    assert r.failovers == 1
+
+
+def test_stream_cancelled_before_first_chunk_releases_trial(fakes):
+    fakes["groq"].latency = 1.0
+    r = router()
+    breaker = r.health["groq"].breaker = llm_router.CircuitBreaker(failures=1, cooldown=0)
+    breaker.record(False)
+    assert breaker.state == "half-open"
+
+    async def cancel_early():
+        task = asyncio.create_task(anext(r.stream(MESSAGES, GROQ_MODEL)))
+        await asyncio.sleep(0.05)
+        assert breaker.trial_running
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_early())
+    assert breaker.allows()
+
+
+def test_stream_first_token_does_not_feed_hedge_window(fakes):
+    r = router()
+
+    async def collect():
+        return [chunk async for chunk in r.stream(MESSAGES, GROQ_MODEL)]
+
+    asyncio.run(collect())
+    health = r.health["groq"]
+    assert list(health.outcomes) == [True]
+    assert list(health.latencies) == []
+    assert len(health.first_token_latencies) == 1
@@ -0,0 +1,226 @@
+"""Outbox claim / delivery / retry against a local SMTP server (aiosmtpd)."""
+import socket
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+pytest.importorskip("aiosmtpd")
+from aiosmtpd.controller import Controller  # noqa: E402
+
+import models  # noqa: E402
+import outbox  # noqa: E402
+from database import SessionLocal  # noqa: E402
+from outbox import Outbox, SMTPConnection, email_row, retry_delay  # noqa: E402
+
+
+class Mailbox:
+    """aiosmtpd handler: keeps accepted messages, rejects the first `reject` with a 451."""
+
+    def __init__(self):
+        self.messages = []
+        self.reject = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.reject:
+            self.reject -= 1
+            return "451 4.3.0 Try again later"
+        self.messages.append(envelope)
+        return "250 Message accepted for delivery"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp():
+    mailbox = Mailbox()
+    controller = Controller(mailbox, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    yield mailbox, controller.port
+    controller.stop()
+
+
+def connection_factory(port):
+    return lambda: SMTPConnection("127.0.0.1", port, starttls=False, username=None, password=None,
+                                  from_email="bot@hospital.test")
+
+
+def rows():
+    db = SessionLocal()
+    try:
+        return db.execute(select(models.EmailOutbox).order_by(models.EmailOutbox.id)).scalars().all()
+    finally:
+        db.close()
+
+
+def enqueue_email(*args, **kwargs):
+    """Commit one outbox row (bookings add theirs in the appointment's transaction)."""
+    db = SessionLocal()
+    try:
+        row = email_row(*args, **kwargs)
+        db.add(row)
+        db.commit()
+        return row.id
+    finally:
+        db.close()
+
+
+class FakeConnection:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, to_email, subject, body):
+        self.sent.append(to_email)
+
+    def close(self):
+        pass
+
+
+def make_due(row_id):
+    db = SessionLocal()
+    try:
+        db.execute(update(models.EmailOutbox).where(models.EmailOutbox.id == row_id)
+                   .values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_workers_deliver_queued_email(tables, smtp):
+    mailbox, port = smtp
+    row_id = enqueue_email("asha@example.com", "Your Hospital Appointment Confirmation", "Dear Asha", appointment_id=7)
+    box = Outbox(workers=1, poll_interval=0.05, connection_factory=connection_factory(port))
+    box.start()
+    try:
+        deadline = time.monotonic() + 5
+        while rows()[0].status != "sent" and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        box.stop()
+
+    row, = rows()
+    assert (row.id, row.status, row.attempts, row.last_error) == (row_id, "sent", 1, None)
+    assert row.sent_at is not None
+    envelope, = mailbox.messages
+    assert envelope.rcpt_tos == ["asha@example.com"]
+    assert b"Subject: Your Hospital Appointment Confirmation" in envelope.content
+    assert outbox.delivery_status(7)[0]["status"] == "sent"
+
+
+def test_claim_is_exclusive_until_stale(tables, monkeypatch):
+    for i in range(3):
+        enqueue_email(f"p{i}@example.com", "s", "b")
+    box = Outbox(batch_size=2)
+
+    first = box.claim("w1")
+    assert [row.to_email for row in first] == ["p0@example.com", "p1@example.com"]
+    assert all(row.status == "sending" for row in first)
+    # Claimed rows are not handed out again; the rest of the queue is
+    assert [row.to_email for row in box.claim("w2")] == ["p2@example.com"]
+    assert box.claim("w3") == []
+
+    # A worker that died mid-batch: its claims are taken over once stale
+    monkeypatch.setattr(outbox, "OUTBOX_CLAIM_TIMEOUT", -1)
+    assert len(box.claim("w4")) == 2
+
+
+def test_rejected_send_is_retried_with_backoff(tables, smtp):
+    mailbox, port = smtp
+    mailbox.reject = 1
+    enqueue_email("asha@example.com", "s", "b")
+    box = Outbox(connection_factory=connection_factory(port))
+    connection = box.connection_factory()
+    try:
+        before = datetime.utcnow()
+        box.deliver(box.claim("w1"), connection)
+        row, = rows()
+        assert (row.status, row.attempts) == ("pending", 1)
+        assert "451" in row.last_error
+        assert row.next_attempt_at >= before + timedelta(seconds=retry_delay(1))
+        # Not due yet
+        assert box.claim("w1") == []
+
+        make_due(row.id)
+        box.deliver(box.claim("w1"), connection)
+    finally:
+        connection.close()
+    row, = rows()
+    assert (row.status, row.attempts, row.last_error) == ("sent", 2, None)
+    assert len(mailbox.messages) == 1
+
+
+def test_gives_up_after_max_attempts(tables, smtp, monkeypatch):
+    mailbox, port = smtp
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 3)
+    mailbox.reject = 10
+    enqueue_email("asha@example.com", "s", "b")
+    box = Outbox(connection_factory=connection_factory(port))
+    connection = box.connection_factory()
+    try:
+        for _ in range(3):
+            make_due(rows()[0].id)
+            box.deliver(box.claim("w1"), connection)
+    finally:
+        connection.close()
+    row, = rows()
+    assert (row.status, row.attempts) == ("failed", 3)
+    assert box.failed == 1
+    make_due(row.id)
+    assert box.claim("w1") == []
+
+
+def test_retry_delay_doubles_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_RETRY_BASE_SECONDS", 5)
+    monkeypatch.setattr(outbox, "OUTBOX_RETRY_MAX_SECONDS", 30)
+    assert [retry_delay(attempt) for attempt in range(1, 6)] == [5, 10, 20, 30, 30]
+
+
+def test_outcome_of_a_re_claimed_row_is_not_recorded(tables, monkeypatch):
+    enqueue_email("asha@example.com", "s", "b")
+    box = Outbox()
+    slow = box.claim("w1")
+    # w1 outlived its claim: w2 takes the row over
+    monkeypatch.setattr(outbox, "OUTBOX_CLAIM_TIMEOUT", -1)
+    taken_over = box.claim("w2")
+    monkeypatch.setattr(outbox, "OUTBOX_CLAIM_TIMEOUT", 300)
+
+    box.deliver(slow, FakeConnection())
+    row, = rows()
+    assert (row.status, row.attempts, row.claimed_by) == ("sending", 0, taken_over[0].claimed_by)
+    assert box.sent == 0
+
+    box.deliver(taken_over, FakeConnection())
+    assert (rows()[0].status, box.sent) == ("sent", 1)
+
+
+def test_worker_survives_a_failed_delivery(tables, monkeypatch):
+    enqueue_email("asha@example.com", "s", "b")
+    connection = FakeConnection()
+    box = Outbox(workers=1, poll_interval=0.01, connection_factory=lambda: connection)
+    deliver = box.deliver
+    failures = []
+
+    def flaky_deliver(batch, conn):
+        if not failures:
+            failures.append(batch)
+            raise RuntimeError("database is locked")
+        deliver(batch, conn)
+
+    monkeypatch.setattr(box, "deliver", flaky_deliver)
+    # The failed batch stays claimed; let the retry take it over at once
+    monkeypatch.setattr(outbox, "OUTBOX_CLAIM_TIMEOUT", -1)
+    box.start()
+    try:
+        deadline = time.monotonic() + 5
+        while rows()[0].status != "sent" and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        box.stop()
+    assert len(failures) == 1
+    assert rows()[0].status == "sent"
+    assert connection.sent == ["asha@example.com"]
@@ -0,0 +1,73 @@
+"""Lifespan warm-up: /ready answers 503 until the slot index and providers are warm."""
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+
+@pytest.fixture
+def slow_slot_index(bot, monkeypatch):
+    """Slot index loads block until the returned event is set."""
+    loaded = threading.Event()
+    load = bot.slot_index.load
+
+    def blocking_load(*args, **kwargs):
+        loaded.wait(5)
+        return load(*args, **kwargs)
+
+    monkeypatch.setattr(bot.slot_index, "load", blocking_load)
+    monkeypatch.setitem(bot.readiness, "ready", False)
+    monkeypatch.setitem(bot.readiness, "steps", {})
+    return loaded
+
+
+def serve(bot, client_calls):
+    """Run client_calls(client) against the app inside its lifespan."""
+    async def run():
+        async with bot.app.router.lifespan_context(bot.app):
+            transport = httpx.ASGITransport(app=bot.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client_calls(client)
+
+    return asyncio.run(run())
+
+
+def test_background_warm_up_is_behind_ready(bot, tables, slow_slot_index, monkeypatch):
+    # As STARTUP_WARMUP=background would set them at import
+    monkeypatch.setattr(bot, "STARTUP_WARMUP", "background")
+    monkeypatch.setitem(bot.readiness, "mode", "background")
+
+    async def calls(client):
+        # Serving already, but not ready
+        cold = await client.get("/ready")
+        index = await client.get("/")
+        slow_slot_index.set()
+        for _ in range(100):
+            warm = await client.get("/ready")
+            if warm.status_code == 200:
+                break
+            await asyncio.sleep(0.02)
+        return cold, index, warm
+
+    cold, index, warm = serve(bot, calls)
+    assert cold.status_code == 503 and cold.json()["ready"] is False
+    assert index.status_code == 200
+    assert f'static/{bot.static_assets.urls["api.js"]}' in index.text
+    assert warm.status_code == 200
+    body = warm.json()
+    assert body["mode"] == "background"
+    assert {"schema_ms", "slot_index_ms", "warmup_ms"} <= set(body["steps"])
+    assert set(body["providers"]) == {"groq", "gemini"}
+    # Draining: not ready any more
+    assert bot.readiness["ready"] is False
+
+
+def test_blocking_warm_up_is_ready_on_first_request(bot, tables, slow_slot_index, monkeypatch):
+    monkeypatch.setattr(bot, "STARTUP_WARMUP", "blocking")
+    slow_slot_index.set()
+
+    async def calls(client):
+        return await client.get("/ready")
+
+    assert serve(bot, calls).status_code == 200
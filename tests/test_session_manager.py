@@ -0,0 +1,240 @@
+"""Session backends: locks, TTL expiry and rate-limit buckets (memory, SQLite, fakeredis)."""
+import asyncio
+import sys
+import time
+
+import pytest
+
+import session_manager
+from session_manager import MemoryBackend, RedisBackend, SessionManager, SQLiteBackend, new_session
+
+BACKENDS = ["memory", "sqlite", "redis"]
+# Backends whose locks and buckets are shared between worker processes
+SHARED = ["sqlite", "redis"]
+
+
+@pytest.fixture
+def make_backend(tmp_path):
+    """Backend factory; backends of one test share storage, like workers on one host."""
+    server = None
+
+    def make(kind, **kwargs):
+        nonlocal server
+        if kind == "memory":
+            return MemoryBackend(**kwargs)
+        if kind == "sqlite":
+            return SQLiteBackend(str(tmp_path / "sessions.db"), **kwargs)
+        fakeredis = pytest.importorskip("fakeredis")
+        server = server or fakeredis.FakeServer()
+        return RedisBackend(client=fakeredis.FakeAsyncRedis(server=server), **kwargs)
+
+    return make
+
+
+def stale(seconds):
+    session = new_session()
+    session["last_accessed"] = time.time() - seconds
+    return session
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_save_load_delete(kind, make_backend):
+    async def run():
+        manager = SessionManager(make_backend(kind))
+        session = await manager.get_session("s1")
+        session["data"]["name"] = "Asha Rao"
+        session["context"].append({"role": "user", "content": "x" * 2000})
+        await manager.save_session("s1", session)
+
+        loaded = await manager.get_session("s1")
+        assert loaded["data"] == {"name": "Asha Rao"}
+        assert loaded["context"][0]["content"] == "x" * 2000
+        assert (manager.hits, manager.misses) == (1, 1)
+
+        await manager.clear_session("s1")
+        assert (await manager.get_session("s1"))["data"] == {}
+        await manager.close()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite"])
+def test_expired_sessions_are_dropped_and_swept(kind, make_backend):
+    async def run():
+        backend = make_backend(kind, ttl_seconds=60)
+        await backend.save("old", stale(120))
+        await backend.save("older", stale(300))
+        await backend.save("live", stale(1))
+
+        assert await backend.load("old") is None
+        assert await backend.sweep() == 1
+        assert await backend.load("live") is not None
+        assert backend.stats()["sessions"] == 1
+        assert backend.stats()["expirations"] == 2
+        await backend.close()
+
+    asyncio.run(run())
+
+
+def test_redis_sessions_expire_natively(make_backend):
+    async def run():
+        backend = make_backend("redis", ttl_seconds=60)
+        await backend.save("s1", new_session())
+        assert 0 < await backend.client.ttl("session:s1") <= 60
+        await backend.close()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_lock_serializes_turns(kind, make_backend):
+    async def run():
+        if kind == "memory":
+            managers = [SessionManager(make_backend(kind))] * 2
+        else:
+            # Two workers, each with its own connection to the shared store
+            managers = [SessionManager(make_backend(kind)) for _ in range(2)]
+        events = []
+
+        async def turn(manager, n):
+            async with manager.lock("s1"):
+                events.append(("enter", n))
+                await asyncio.sleep(0.05)
+                events.append(("exit", n))
+
+        await asyncio.gather(*(turn(managers[n % 2], n) for n in range(4)))
+        for i in range(0, len(events), 2):
+            assert events[i][0] == "enter" and events[i + 1] == ("exit", events[i][1])
+        assert managers[0]._locks == {}
+        for manager in set(managers):
+            await manager.close()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("kind", SHARED)
+def test_expired_lease_is_taken_over(kind, make_backend, monkeypatch):
+    monkeypatch.setattr(session_manager, "SESSION_LOCK_TTL", 0.1)
+
+    async def run():
+        crashed, worker = make_backend(kind), make_backend(kind)
+        assert await crashed.acquire_lock("s1", "t1")
+        assert not await worker.acquire_lock("s1", "t2")
+        await asyncio.sleep(0.2)
+        assert await worker.acquire_lock("s1", "t2")
+        # A late release by the old holder must not free the new lease
+        await crashed.release_lock("s1", "t1")
+        assert not await crashed.acquire_lock("s1", "t3")
+        await worker.release_lock("s1", "t2")
+        assert await crashed.acquire_lock("s1", "t3")
+        await crashed.close()
+        await worker.close()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("kind", SHARED)
+def test_held_lease_is_renewed(kind, make_backend, monkeypatch):
+    monkeypatch.setattr(session_manager, "SESSION_LOCK_TTL", 0.1)
+
+    async def run():
+        manager, worker = SessionManager(make_backend(kind)), make_backend(kind)
+        async with manager.lock("s1"):
+            # A turn running for several TTLs keeps its lease
+            await asyncio.sleep(0.3)
+            assert not await worker.acquire_lock("s1", "t2")
+        assert await worker.acquire_lock("s1", "t2")
+        # Renewal fails once the lease belongs to someone else
+        assert not await manager.backend.renew_lock("s1", "t1")
+        assert await worker.renew_lock("s1", "t2")
+        await manager.close()
+        await worker.close()
+
+    asyncio.run(run())
+
+
+def test_redis_backend_without_package_fails_clearly(monkeypatch):
+    monkeypatch.setattr(session_manager, "SESSION_BACKEND", "redis")
+    monkeypatch.setitem(sys.modules, "redis", None)
+    monkeypatch.setitem(sys.modules, "redis.asyncio", None)
+    with pytest.raises(RuntimeError, match="pip install redis"):
+        session_manager.create_session_manager()
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_take_tokens_is_all_or_nothing(kind, make_backend):
+    # Slow refill, so nothing comes back during the test
+    ip, session = ("ip:10.0.0.1", 0.001, 2), ("session:s1", 0.001, 1)
+
+    async def run():
+        backend = make_backend(kind)
+        assert await backend.take_tokens([ip, session]) == (None, 0.0)
+
+        # The session bucket is empty: the ip bucket must not be charged
+        empty, retry_after = await backend.take_tokens([ip, session])
+        assert empty == 1
+        assert 990 < retry_after <= 1000
+
+        assert await backend.take_tokens([ip]) == (None, 0.0)
+        empty, _ = await backend.take_tokens([ip])
+        assert empty == 0
+        await backend.close()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("kind", SHARED)
+def test_buckets_are_shared_between_workers(kind, make_backend):
+    bucket = ("ip:10.0.0.1", 0.001, 3)
+
+    async def run():
+        workers = [make_backend(kind) for _ in range(3)]
+        results = await asyncio.gather(*(worker.take_tokens([bucket]) for worker in workers * 2))
+        assert sum(empty is None for empty, _ in results) == 3
+        for worker in workers:
+            await worker.close()
+
+    asyncio.run(run())
+
+
+def test_buckets_refill_over_time(make_backend):
+    async def run():
+        backend = make_backend("memory")
+        bucket = ("ip:10.0.0.1", 20.0, 1)
+        assert (await backend.take_tokens([bucket]))[0] is None
+        assert (await backend.take_tokens([bucket]))[0] == 0
+        await asyncio.sleep(0.1)
+        assert (await backend.take_tokens([bucket]))[0] is None
+
+    asyncio.run(run())
+
+
+def test_memory_backend_evicts_least_recently_used(make_backend):
+    async def run():
+        manager = SessionManager(make_backend("memory", max_sessions=2))
+        await manager.get_session("a")
+        await manager.get_session("b")
+        await manager.get_session("a")  # a is now the most recent
+        await manager.get_session("c")
+        assert list(manager.backend.sessions) == ["a", "c"]
+        assert manager.backend.stats()["evictions"] == 1
+
+    asyncio.run(run())
+
+
+def test_memory_backend_enforces_byte_cap(make_backend):
+    async def run():
+        backend = make_backend("memory", max_bytes=7000)
+        for name in ("a", "b", "c"):
+            session = new_session()
+            session["context"].append({"role": "user", "content": "x" * 2000})
+            await backend.save(name, session)
+        assert list(backend.sessions) == ["b", "c"]
+        assert backend.total_bytes <= 7000
+
+        # Growing a session in place is accounted for on the next save
+        backend.sessions["c"]["context"].append({"role": "user", "content": "y" * 2000})
+        await backend.save("c", backend.sessions["c"])
+        assert list(backend.sessions) == ["c"]
+
+    asyncio.run(run())
@@ -0,0 +1,76 @@
+"""Static assets: fingerprinted names, precompressed variants, cache headers and ETags."""
+import gzip
+import hashlib
+
+import pytest
+
+import static_assets
+from static_assets import IMMUTABLE, REVALIDATE, StaticAssets, accepted_encodings
+
+API_JS = b"function send() { return fetch('/chat'); }\n" * 50
+INDEX = '<link href="/static/style.css"><script src="static/api.js"></script><img src="/static/logo.png">'
+
+
+@pytest.fixture
+def assets(tmp_path):
+    (tmp_path / "api.js").write_bytes(API_JS)
+    (tmp_path / "style.css").write_text("body { margin: 0; }\n" * 50)
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG not really")
+    (tmp_path / "index.html").write_text(INDEX)
+    built = StaticAssets(str(tmp_path))
+    built.build()
+    return built
+
+
+def test_manifest_fingerprints_and_rewrites_index(assets):
+    hashed = f"api.{hashlib.sha256(API_JS).hexdigest()[:12]}.js"
+    assert assets.urls["api.js"] == hashed
+    assert set(assets.urls) == {"api.js", "style.css"}
+    html = assets.get("index.html").variants["identity"].decode()
+    assert f'src="static/{hashed}"' in html
+    assert f'href="/static/{assets.urls["style.css"]}"' in html
+    # Not fingerprinted: referenced by its plain name
+    assert 'src="/static/logo.png"' in html
+
+
+def test_cache_headers(assets):
+    status, headers, body = StaticAssets.respond(assets.get(assets.urls["api.js"]), {})
+    assert (status, headers["Cache-Control"], body) == (200, IMMUTABLE, API_JS)
+    assert headers["Content-Type"] == "application/javascript; charset=utf-8"
+    for name in ("api.js", "index.html", "logo.png"):
+        _, headers, _ = StaticAssets.respond(assets.get(name), {})
+        assert headers["Cache-Control"] == REVALIDATE
+
+
+def test_variant_follows_accept_encoding(assets):
+    asset = assets.get(assets.urls["api.js"])
+    _, headers, body = StaticAssets.respond(asset, {"accept-encoding": "gzip, br;q=0"})
+    assert (headers["Content-Encoding"], headers["Vary"]) == ("gzip", "Accept-Encoding")
+    assert gzip.decompress(body) == API_JS
+    _, headers, body = StaticAssets.respond(asset, {"accept-encoding": "gzip;q=0, identity"})
+    assert "Content-Encoding" not in headers and body == API_JS
+    # Images are not compressed
+    assert set(assets.get("logo.png").variants) == {"identity"}
+    if static_assets.brotli is not None:
+        _, headers, _ = StaticAssets.respond(asset, {"accept-encoding": "gzip, br"})
+        assert headers["Content-Encoding"] == "br"
+
+
+def test_etag_revalidation_per_representation(assets):
+    asset = assets.get("index.html")
+    _, plain, _ = StaticAssets.respond(asset, {})
+    _, gzipped, _ = StaticAssets.respond(asset, {"accept-encoding": "gzip"})
+    assert plain["ETag"] != gzipped["ETag"]
+
+    status, headers, body = StaticAssets.respond(asset, {"if-none-match": plain["ETag"]})
+    assert (status, body, headers["ETag"]) == (304, b"", plain["ETag"])
+    assert StaticAssets.respond(asset, {"if-none-match": f'W/{plain["ETag"]}'})[0] == 304
+    assert StaticAssets.respond(asset, {"if-none-match": plain["ETag"], "accept-encoding": "gzip"})[0] == 200
+
+
+def test_accepted_encodings_reads_q_values():
+    assert accepted_encodings("gzip, deflate, br") == {"gzip", "deflate", "br"}
+    assert accepted_encodings("br;q=0, gzip;q=0.5") == {"gzip"}
+    assert accepted_encodings("gzip; q=0.000, br;q=0.") == set()
+    assert accepted_encodings("*, br;q=0") == {"*", "gzip"}
+    assert accepted_encodings("") == set()